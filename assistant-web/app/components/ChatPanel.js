@@ -6,6 +6,7 @@ import styles from "./ChatPanel.module.css";
 
 export default function ChatPanel({
   messages,
+  hasEarlier,
   prompt,
   loading,
   activeChatId,
@@ -14,20 +15,29 @@ export default function ChatPanel({
   onPromptChange,
   onSend,
   onClear,
+  onLoadEarlier,
   onToggleRecording,
 }) {
   // Auto-scroll: a ref attached to an invisible div at the bottom of the message list.
-  // useEffect watches the messages array — every time it changes, we scroll the div into view.
+  // useEffect watches the last message — every time it changes, we scroll the div into view.
+  // Loading older messages above it keeps the position.
   const bottomRef = useRef(null);
+  const lastMessage = messages[messages.length - 1];
   useEffect(() => {
     bottomRef.current?.scrollIntoView({ behavior: "smooth" });
-  }, [messages]);
+  }, [lastMessage, audioState.partial_transcript]);
 
   const serverRunning = health?.llm_server_running;
 
   return (
     <section className={styles.panel}>
       <div className={styles.messageList}>
+        {hasEarlier && (
+          <button className={styles.loadEarlier} type="button" onClick={onLoadEarlier}>
+            Load earlier messages
+          </button>
+        )}
+
         {messages.length === 0 && !loading && (
           <p className={styles.placeholder}>
             {activeChatId ? "Send a message to get started." : "Select or create a chat."}
@@ -43,6 +53,10 @@ export default function ChatPanel({
           </div>
         ))}
 
+        {audioState.recording && (
+          <div className={styles.thinking}>{audioState.partial_transcript || "Listening…"}</div>
+        )}
+
         {loading && <div className={styles.thinking}>Thinking…</div>}
 
         {/* Invisible anchor for auto-scroll */}
@@ -6,12 +6,25 @@ export default function StatusBar({
   health,
   chatsCount,
   audioState,
+  activity,
   loading,
   onStartServer,
   onStopServer,
   onToggleSpeakResponses,
 }) {
   const serverRunning = health?.llm_server_running;
+  const serverState = health?.llm_server?.state;
+
+  // Loading and draining are reported by the backend lifecycle, otherwise fall back to the process check
+  const serverLabel = () => {
+    if (serverState === "loading")
+      return `Loading… ${Math.round(health.llm_server.loading_seconds || 0)}s`;
+    if (serverState === "draining")
+      return "Stopping…";
+    if (serverState === "unhealthy")
+      return "Not responding";
+    return serverRunning ? "Running" : "Stopped";
+  };
 
   return (
     <div className={styles.statusBar}>
@@ -23,14 +36,19 @@ export default function StatusBar({
       <div className={styles.group}>
         <span className={styles.label}>LLM Server</span>
         <span className={`${styles.value} ${health ? (serverRunning ? styles.valueRunning : styles.valueStopped) : ""}`}>
-          {health ? (serverRunning ? "Running" : "Stopped") : "..."}
+          {health ? serverLabel() : "..."}
         </span>
       </div>
 
       {"busy" in (health || {}) && (
         <div className={styles.group}>
           <span className={styles.label}>Status</span>
-          <span className={styles.value}>{health.busy ? "Busy" : "Idle"}</span>
+          <span className={styles.value}>
+            {activity && activity !== "idle"
+              ? activity.charAt(0).toUpperCase() + activity.slice(1)
+              : (health.busy ? "Busy" : "Idle")}
+            {health.queue?.waiting > 0 && ` · ${health.queue.waiting} queued (avg wait ${health.queue.avg_wait}s)`}
+          </span>
         </div>
       )}
 
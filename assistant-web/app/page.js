@@ -1,12 +1,23 @@
 "use client";
 
-import { useEffect, useState } from "react";
+import { useEffect, useRef, useState } from "react";
 import styles from "./page.module.css";
 import Header from "./components/Header";
 import StatusBar from "./components/StatusBar";
 import ChatSidebar from "./components/ChatSidebar";
 import ChatPanel from "./components/ChatPanel";
 
+// Messages fetched per page, older ones load on demand
+const PAGE_SIZE = 50;
+
+// Live events from the backend, polling is only the fallback while it is unreachable
+// Same host as the page (proxied like /api), NEXT_PUBLIC_WS_URL points elsewhere if the proxy can't upgrade
+function wsUrl() {
+  if (process.env.NEXT_PUBLIC_WS_URL) return process.env.NEXT_PUBLIC_WS_URL;
+  const scheme = window.location.protocol === "https:" ? "wss" : "ws";
+  return `${scheme}://${window.location.host}/ws`;
+}
+
 export default function Home() {
   // Chat state
   const [chats, setChats] = useState([]);
@@ -14,16 +25,22 @@ export default function Home() {
 
   // Current chat state
   const [messages, setMessages] = useState([]);
+  const [messagesStart, setMessagesStart] = useState(0);
   const [prompt, setPrompt] = useState("");
+  // Chat shown and how many of its messages the UI holds, for incremental fetches
+  const loadedChat = useRef({ id: null, end: 0 });
 
   // UI state
   const [loading, setLoading] = useState(false);
   const [err, setErr] = useState("");
   const [health, setHealth] = useState(null);
   const [chatFilter, setChatFilter] = useState("");
+  const [live, setLive] = useState(false);
+  const [activity, setActivity] = useState("idle");
 
   // Audio
-  const [audioState, setAudioState] = useState({ recording: false, speak_responses: false });
+  const [audioState, setAudioState] = useState({ recording: false, partial_transcript: "", speak_responses: false });
+  const lastTurnId = useRef(null);
 
   // -------------- Backend Calls ----------------
   async function loadHealth() {
@@ -42,11 +59,46 @@ export default function Home() {
   }
 
   async function loadSingleChat(chatId) {
-    const res = await fetch(`/api/chats/${chatId}`);
+    // Only the latest window, older messages come through loadEarlierMessages
+    const res = await fetch(`/api/chats/${chatId}?limit=${PAGE_SIZE}`);
     if (!res.ok)
       throw new Error("Failed to load the selected chat");
     const data = await res.json();
+    loadedChat.current = { id: chatId, end: data.total ?? 0 };
     setMessages(data.messages ?? []);
+    setMessagesStart(data.start ?? 0);
+  }
+
+  async function loadEarlierMessages() {
+    const chatId = loadedChat.current.id;
+    if (!chatId || messagesStart === 0)
+      return;
+    const res = await fetch(`/api/chats/${chatId}?before=${messagesStart}&limit=${PAGE_SIZE}`);
+    if (!res.ok)
+      throw new Error("Failed to load earlier messages");
+    const data = await res.json();
+    if (loadedChat.current.id !== chatId)
+      return;
+    setMessages((prev) => [...(data.messages ?? []), ...prev]);
+    setMessagesStart(data.start ?? 0);
+  }
+
+  async function syncChat(chatId) {
+    // Pulls only the messages added since the last fetch
+    const { id, end } = loadedChat.current;
+    if (id !== chatId)
+      return;
+    const res = await fetch(`/api/chats/${chatId}?since=${end}`);
+    if (!res.ok)
+      throw new Error("Failed to update the chat");
+    const data = await res.json();
+    if (data.total < end) {
+      // Cleared or rewritten elsewhere
+      await loadSingleChat(chatId);
+      return;
+    }
+    loadedChat.current = { id: chatId, end: data.total };
+    setMessages((prev) => [...prev, ...(data.messages ?? [])]);
   }
 
   async function createNewChat() {
@@ -210,8 +262,21 @@ export default function Home() {
 
   async function loadAudioState() {
     const response = await fetch("/api/audio/state");
-    const data = await response.json();
+    await applyAudioState(await response.json());
+  }
+
+  async function applyAudioState(data) {
     setAudioState(data);
+
+    // An utterance ended by trailing silence was answered in the background
+    const turn = data.last_turn;
+    if (turn && lastTurnId.current !== null && turn.id !== lastTurnId.current) {
+      if (turn.error)
+        setErr(turn.error);
+      await syncChat(turn.chat_id).catch(() => {});
+      await loadChats().catch(() => {});
+    }
+    lastTurnId.current = turn ? turn.id : 0;
   }
 
   async function toggleSpeakResponses(enabled) {
@@ -260,6 +325,7 @@ export default function Home() {
           { role: "user", content: data.transcript },
           { role: "assistant", content: data.response },
         ]);
+        loadedChat.current.end += 2;
         // Upddate chats
         await loadChats();
       }
@@ -291,16 +357,74 @@ export default function Home() {
       }
     })();
 
-    // Step 3: Poll health
+    // Step 3: Load audio state
+    loadAudioState().catch(() => {});
+  }, []);
+
+  // Server-pushed state; reconnects with backoff and the polls below take over meanwhile
+  useEffect(() => {
+    let socket = null;
+    let retry = null;
+    let delay = 1000;
+    let closed = false;
+
+    function handleEvent(event) {
+      if (event.type === "health")
+        setHealth(event.data);
+      else if (event.type === "audio")
+        applyAudioState(event.data).catch(() => {});
+      else if (event.type === "activity")
+        setActivity(event.state);
+      else if (event.type === "server")
+        setHealth((prev) => (prev ? { ...prev, llm_server: { ...prev.llm_server, state: event.state } } : prev));
+      else if (event.type === "transcript" && !event.final)
+        setAudioState((prev) => ({ ...prev, partial_transcript: event.text }));
+      // "delta"/"done" are for other clients, this page reads its own replies from the chat stream
+    }
+
+    function connect() {
+      socket = new WebSocket(wsUrl());
+      socket.onopen = () => {
+        setLive(true);
+        delay = 1000;
+      };
+      socket.onmessage = (message) => handleEvent(JSON.parse(message.data));
+      socket.onclose = () => {
+        setLive(false);
+        if (!closed) {
+          retry = setTimeout(connect, delay);
+          delay = Math.min(delay * 2, 15000);
+        }
+      };
+    }
+
+    connect();
+    return () => {
+      closed = true;
+      clearTimeout(retry);
+      socket?.close();
+    };
+  }, []);
+
+  // Poll health only without the live connection
+  useEffect(() => {
+    if (live)
+      return;
     const id = setInterval(() => {
       loadHealth().catch(() => {});
     }, 3000);
+    return () => clearInterval(id);
+  }, [live]);
 
-    // Step 4: Load audio state
-    loadAudioState().catch(() => {});
-
+  // Without the live connection, poll partial transcripts while recording and auto-ended turns while they are processed
+  useEffect(() => {
+    if (live || (!audioState.recording && !audioState.processing))
+      return;
+    const id = setInterval(() => {
+      loadAudioState().catch(() => {});
+    }, 500);
     return () => clearInterval(id);
-  }, []);
+  }, [live, audioState.recording, audioState.processing]);
 
   // ---------------- Send function ---------------
   async function send(e) {
@@ -330,7 +454,7 @@ export default function Home() {
     setPrompt("");
 
     try {
-      const res = await fetch(`/api/chats/${activeChatId}/chat`, {
+      const res = await fetch(`/api/chats/${activeChatId}/chat/stream`, {
         method: "POST",
         headers: { "Content-Type": "application/json" },
         body: JSON.stringify({ prompt: text }),
@@ -341,8 +465,51 @@ export default function Home() {
         throw new Error(data.detail || `Request failed (${res.status})`);
       }
 
-      const data = await res.json();
-      setMessages((prev) => [...prev, { role: "assistant", content: data.response }]);
+      // Assistant message fills up as NDJSON deltas arrive
+      setMessages((prev) => [...prev, { role: "assistant", content: "" }]);
+      const setAssistantContent = (update) => {
+        setMessages((prev) => {
+          const last = prev[prev.length - 1];
+          return [...prev.slice(0, -1), { ...last, content: update(last.content) }];
+        });
+      };
+
+      const reader = res.body.getReader();
+      const decoder = new TextDecoder();
+      let buffer = "";
+      let queued = false;
+      while (true) {
+        const { value, done } = await reader.read();
+        if (done)
+          break;
+        buffer += decoder.decode(value, { stream: true });
+
+        const lines = buffer.split("\n");
+        buffer = lines.pop();
+        for (const line of lines) {
+          if (!line.trim())
+            continue;
+          const event = JSON.parse(line);
+          if (event.type === "queued") {
+            // Placeholder until a server slot frees up
+            queued = true;
+            setAssistantContent(() => `Queued (position ${event.position}, waited ${Math.round(event.waited)}s)…`);
+          }
+          else if (event.type === "delta") {
+            const first = queued;
+            queued = false;
+            setAssistantContent((content) => (first ? "" : content) + event.content);
+          }
+          else if (event.type === "done")
+            setAssistantContent(() => event.response);
+          else if (event.type === "error")
+            throw new Error(event.detail || "Streaming failed.");
+        }
+      }
+
+      // The turn was streamed into place, only the count of stored messages moves on
+      loadedChat.current.end += 2;
+
       // Refresh sidebar timestamps after a message
       await loadChats();
 
@@ -370,6 +537,7 @@ export default function Home() {
         health={health}
         chatsCount={chats.length}
         audioState={audioState}
+        activity={activity}
         loading={loading}
         onStartServer={startServer}
         onStopServer={stopServer}
@@ -400,6 +568,7 @@ export default function Home() {
 
         <ChatPanel
           messages={messages}
+          hasEarlier={messagesStart > 0}
           prompt={prompt}
           loading={loading}
           activeChatId={activeChatId}
@@ -408,6 +577,7 @@ export default function Home() {
           onPromptChange={setPrompt}
           onSend={send}
           onClear={clearActiveChat}
+          onLoadEarlier={() => loadEarlierMessages().catch((e) => setErr(e.message))}
           onToggleRecording={toggleRecording}
         />
       </div>
@@ -6,6 +6,10 @@ const nextConfig = {
         source: "/api/:path*",
         destination: "http://127.0.0.1:8000/api/:path*",
       },
+      {
+        source: "/ws",
+        destination: "http://127.0.0.1:8000/ws",
+      },
     ];
   },
 };
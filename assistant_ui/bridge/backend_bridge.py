@@ -76,8 +76,8 @@ class BackendBridge(QObject):
         print("sendMessage() called with:", text)
 
         # Show user's message in UI immediately
+        # (the completion pipeline stores both messages once the reply is done)
         self.newMessage.emit("user", text)
-        self.conversation.append("user", text)
 
         # Set state
         self._setStatus("thinking")
@@ -93,18 +93,17 @@ class BackendBridge(QObject):
         """Runs in background thread."""
         print(">>> Running LLM thread...")
 
-        response = self.llm.send_query(text)
-
-        # Append assistant message to history
-        self.conversation.append("assistant", response)
+        # Speech is fed sentence by sentence while the reply generates
+        speech = None if self._muted else self.audio.speech_pipeline()
+        response = self.llm.send_query(text, speech=speech)
 
         # Emit assistant message to UI
         self.newMessage.emit("assistant", response)
 
-        # Play TTS if not muted
-        if not self._muted:
+        # Wait for TTS if not muted
+        if speech:
             self._setStatus("speaking")
-            self.audio.speak(response)
+            speech.wait()
 
         # Finished
-        self._setStatus("idle")
\ No newline at end of file
+        self._setStatus("idle")
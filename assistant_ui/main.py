@@ -9,8 +9,11 @@ sys.path.append(ROOT)
 from bridge.backend_bridge import BackendBridge
 from audio_manager import AudioManager
 from llm_client import LLMClient
+from context_window import ContextWindowBuilder
+from response_cache import ResponseCache
 from conversation_manager import ConversationManager
 from llm_server import LLMServerManager
+from llm_transport import LLMTransport
 import config
 
 
@@ -24,24 +27,76 @@ def main():
         mic_rate=config.SAMPLE_RATE,
         tts_rate=config.PIPER_SAMPLE_RATE,
         channels=config.CHANNELS,
-        record_timeout=config.RECORD_TIMEOUT
+        record_timeout=config.RECORD_TIMEOUT,
+        output_backend=config.TTS_OUTPUT,
+        volume=config.TTS_VOLUME,
+        max_record_seconds=config.MAX_RECORD_SECONDS,
+        streaming_stt=config.STREAMING_STT,
+        vad_threshold=config.VAD_ENERGY_THRESHOLD,
+        segment_silence=config.VAD_SEGMENT_SILENCE,
+        max_segment_seconds=config.MAX_SEGMENT_SECONDS,
+        endpointing=config.ENDPOINTING,
+        endpoint_silence=config.ENDPOINT_SILENCE,
+        tts_cache_dir=config.TTS_CACHE_DIR,
+        tts_cache_mb=config.TTS_CACHE_MB,
+        whisper_fast_model=config.WHISPER_FAST_MODEL,
+        whisper_tier_seconds=config.WHISPER_TIER_SECONDS,
+        whisper_threads=config.WHISPER_THREADS,
+        whisper_compute_type=config.WHISPER_COMPUTE_TYPE,
+        preload_models=config.PRELOAD_AUDIO_MODELS,
+        barge_in=config.BARGE_IN,
+        barge_in_threshold=config.BARGE_IN_THRESHOLD,
+        barge_in_min_speech=config.BARGE_IN_MIN_SPEECH,
+        replace_speech=config.REPLACE_SPEECH,
+        capture_16k=config.CAPTURE_16K,
+        preroll_seconds=config.PREROLL_SECONDS,
+        tts_workers=config.TTS_WORKERS
     )
 
     conversation = ConversationManager(config.CHAT_HISTORY_FILE)
 
+    transport = LLMTransport(
+        port=config.SERVER_PORT,
+        connect_timeout=config.LLM_CONNECT_TIMEOUT,
+        read_timeout=config.LLM_READ_TIMEOUT,
+        retries=config.LLM_RETRIES,
+        pool_size=config.LLM_POOL_SIZE
+    )
+
     server = LLMServerManager(
         bin_path=config.LLM_SERVER_BIN,
         model_path=config.LLM_MODEL_PATH,
         port=config.SERVER_PORT,
         pid_file=config.LLM_PID_FILE,
-        auto_shutdown=config.AUTO_SHUTDOWN
+        auto_shutdown=config.AUTO_SHUTDOWN,
+        transport=transport,
+        parallel=config.LLM_PARALLEL,
+        context_size=config.LLM_CONTEXT_SIZE,
+        load_timeout=config.LLM_LOAD_TIMEOUT,
+        slot_save_path=config.LLM_SLOT_SAVE_DIR,
+        probe_interval=config.LLM_PROBE_INTERVAL
     )
 
     llm = LLMClient(
         model_name=config.MODEL_NAME,
         server=server,
         conversation=conversation,
-        temperature=config.TEMPERATURE
+        temperature=config.TEMPERATURE,
+        prompt_builder=ContextWindowBuilder(
+            transport,
+            config.MODEL_NAME,
+            budget=config.CONTEXT_TOKEN_BUDGET,
+            keep_ratio=config.CONTEXT_KEEP_RATIO,
+            summary_tokens=config.CONTEXT_SUMMARY_TOKENS
+        ),
+        response_cache=ResponseCache(
+            config.RESPONSE_CACHE_DIR,
+            enabled=config.RESPONSE_CACHE,
+            mode=config.RESPONSE_CACHE_MODE,
+            force=config.RESPONSE_CACHE_FORCE,
+            max_entries=config.RESPONSE_CACHE_MAX_ENTRIES,
+            ttl=config.RESPONSE_CACHE_TTL
+        )
     )
 
     backend = BackendBridge(audio, llm, conversation, server)
@@ -1,97 +1,466 @@
-import os, time, queue, numpy, sounddevice, subprocess
-from faster_whisper import WhisperModel
-from scipy.io.wavfile import write as write_wav
-from piper import PiperVoice, SynthesisConfig
+import math, time, queue, threading, numpy, sounddevice
+from concurrent.futures import ThreadPoolExecutor
+from scipy.signal import resample_poly
+from speech_pipeline import SpeechQueue
+from audio_output import open_output
+from streaming_transcriber import StreamingTranscriber
+from vad import EnergyVAD
+from tts_cache import TtsCache
+from model_loader import LazyModel
+from capture_buffer import CaptureBuffer
+
+# Sample rate faster-whisper expects for in-memory audio
+WHISPER_RATE = 16000
+
+class Utterance:
+    def __init__(self, buffer, rate):
+        ''' One recording, from the moment it starts until it has been transcribed
+
+        Keeps its own marks into the capture buffer, so it reads its own audio
+        even after a new recording has started. If the ring is reused before it
+        is transcribed, its audio is copied out first (detach).
+
+        Args: buffer (CaptureBuffer): the buffer the recording goes into, start() already called
+        rate (int): sample rate of the buffer '''
+        self._buffer = buffer
+        self.rate = rate
+        self.start, self.end = buffer.marks
+        self.transcriber = None
+        self.released = False
+        self._audio = None
+
+    def read(self, offset=0):
+        # View of the samples from offset onwards
+        if self._audio is not None:
+            return self._audio[offset:]
+        return self._buffer.read_span(self.start, self.end, offset)
+
+    @property
+    def seconds(self):
+        return len(self.read()) / self.rate
+
+    def stop(self):
+        # Recording ended, the transcriber stops polling and only the tail is left for finish()
+        self.end = self._buffer.marks[1]
+        if self.transcriber:
+            self.transcriber.stop()
+
+    def detach(self):
+        # Called before a new recording reuses the ring
+        if self._audio is None and not self.released:
+            self._audio = numpy.array(self.read())
+
+    def release(self):
+        # Transcribed or dropped, the buffer may feed the pre-roll again
+        self.released = True
+        self._audio = None
+        self._buffer.release(self.start)
 
 class AudioManager:
     def __init__(self,whisper_model, piper_model, piper_config,
-                mic_rate, tts_rate, channels, record_timeout):
-        # Recording setup
-        self.mic_rate = mic_rate
-        self.channels = channels
+                mic_rate, tts_rate, channels, record_timeout,
+                output_backend="sounddevice", volume=1.0, max_record_seconds=120,
+                streaming_stt=True, vad_threshold=0.01, segment_silence=0.5, max_segment_seconds=20,
+                endpointing=False, endpoint_silence=1.0, tts_cache_dir=None, tts_cache_mb=64,
+                whisper_fast_model=None, whisper_tier_seconds=4.0, whisper_threads=16,
+                whisper_compute_type="int8", preload_models=True,
+                barge_in=False, barge_in_threshold=0.05, barge_in_min_speech=0.3, replace_speech=False,
+                capture_16k=False, preroll_seconds=0.0, tts_workers=1, stt_workers=1):
+        # Recording setup, capture_16k records mono at Whisper's rate so nothing is resampled
+        self.mic_rate = WHISPER_RATE if capture_16k else mic_rate
+        self.channels = 1 if capture_16k else channels
         self.record_timeout = record_timeout
-        self.audio_queue = queue.Queue()
-        self.recording=False
 
-        # Whisper setup
-        print(">> Loading Whisper model...")
-        self.whisper = WhisperModel(whisper_model, device="cpu", cpu_threads=16, compute_type="int8")
+        # Ring buffer allocated once; the audio callback is its only writer, so there is no lock
+        # With a pre-roll the stream keeps filling it between utterances, so the first syllable isn't cut off
+        self._buffer = CaptureBuffer(self.mic_rate, max_record_seconds, preroll_seconds=preroll_seconds)
+        self._recording = False
+        # The latest recording, stays here after it stops until the next one starts
+        self._utterance = None
+
+        # Streaming recognition setup
+        self.streaming_stt = streaming_stt
+        self.vad_threshold = vad_threshold
+        self.segment_silence = segment_silence
+        self.max_segment_seconds = max_segment_seconds
+        # Called with the transcript so far whenever a segment is recognized
+        self.on_partial = None
+
+        # Endpointing setup, on_endpoint is called with the Utterance when trailing silence ends it
+        self.endpointing = endpointing
+        self.endpoint_silence = endpoint_silence
+        self.on_endpoint = None
+        self._endpoint_vad = EnergyVAD(self.mic_rate, threshold=vad_threshold)
+        self._speech_heard = False
+        self._trailing_silence = 0
+
+        # Whisper setup, models load on first use or in the background (preload_models)
+        # With a fast model, utterances up to whisper_tier_seconds go to it and longer dictation to whisper_model
+        self.whisper_tier_seconds = whisper_tier_seconds
+        # The model is safe to call from several threads, stt_workers of those calls run in parallel
+        self.stt_workers = stt_workers
+        self.configure_whisper(whisper_model, whisper_fast_model, whisper_threads, whisper_compute_type)
 
         # Piper tts setup
-        if piper_model and piper_config:
-            print(">> Loading Piper TTS voice...")
-            self.voice = PiperVoice.load(piper_model, config_path=piper_config)
-            self.tts_config = SynthesisConfig(length_scale=0.95, noise_scale=0.3, noise_w_scale=0.9)
-            self.tts_rate = tts_rate
-        else:
-            self.voice = None
+        self.piper_model = piper_model
+        self.tts_rate = tts_rate
+        self.tts_config = None
+        self._voice = LazyModel("Piper TTS voice", lambda: self._load_voice(piper_model, piper_config)) \
+            if piper_model and piper_config else None
+
+        # Phrases that were spoken before are played back from disk
+        self.tts_cache = TtsCache(tts_cache_dir, max_bytes=int(tts_cache_mb * 1024 * 1024)) \
+            if tts_cache_dir and tts_cache_mb > 0 else None
+
+        # Playback setup, replies queue up behind each other unless replace_speech is set
+        self.output_backend = output_backend
+        self.volume = volume
+        self.replace_speech = replace_speech
+        self._speech = SpeechQueue(self._synthesize, self._open_output)
+        # Piper runs on tts_workers shared threads, however many replies are queued
+        self._tts_pool = ThreadPoolExecutor(max_workers=tts_workers, thread_name_prefix="tts")
+
+        # Barge-in setup, talking over a reply stops it
+        # There is no echo cancellation, so it is meant for headsets: on speakers the reply itself trips it
+        self.barge_in = barge_in
+        self.barge_in_min_speech = barge_in_min_speech
+        self.on_barge_in = None
+        self._barge_in_vad = EnergyVAD(self.mic_rate, threshold=barge_in_threshold)
+        self._barge_in_speech = 0
+
+        if preload_models:
+            self.preload()
+
+    # Model loading
+    def configure_whisper(self, model, fast_model=None, threads=16, compute_type="int8"):
+        # Replaces the STT models, they are loaded again on next use
+        # A transcription that is already running finishes with the old model
+        def loader(name):
+            return LazyModel(f"Whisper {name}", lambda: self._load_whisper(name, threads, compute_type))
+
+        self._whisper = loader(model)
+        self._whisper_fast = loader(fast_model) if fast_model and fast_model != model else None
+
+    def preload(self):
+        # Loads every model in one background thread so they don't fight over the CPU
+        # The fast model comes first: short commands work while large-v3 is still loading
+        models = [m for m in (self._whisper_fast, self._voice, self._whisper) if m is not None]
+        threading.Thread(target=lambda: [m.load_now() for m in models], daemon=True).start()
+
+    def models_status(self):
+        return {
+            "whisper": self._whisper.status(),
+            "whisper_fast": self._whisper_fast.status() if self._whisper_fast else None,
+            "piper": self._voice.status() if self._voice else None,
+        }
+
+    @property
+    def whisper(self):
+        return self._whisper.get()
+
+    @property
+    def voice(self):
+        # None when no Piper voice is configured
+        return self._voice.get() if self._voice else None
+
+    def _load_whisper(self, name, threads, compute_type):
+        # Imported here, so importing this module doesn't pull in CTranslate2
+        from faster_whisper import WhisperModel
+        # The threads are split between the workers instead of oversubscribing the CPU
+        return WhisperModel(name, device="cpu", cpu_threads=max(1, threads // self.stt_workers),
+                            num_workers=self.stt_workers, compute_type=compute_type)
+
+    def _load_voice(self, piper_model, piper_config):
+        from piper import PiperVoice, SynthesisConfig
+        self.tts_config = SynthesisConfig(length_scale=0.95, noise_scale=0.3, noise_w_scale=0.9)
+        return PiperVoice.load(piper_model, config_path=piper_config)
+
+    @property
+    def recording(self):
+        return self._recording
+
+    @recording.setter
+    def recording(self, value):
+        # True starts a recording, False drops it; stop_recording() hands it over for transcription
+        if value and not self._recording:
+            self.start_recording()
+        elif not value and self._recording:
+            self.discard(self.stop_recording())
+
+    def start_recording(self):
+        # A new utterance starts at the current write position, minus the pre-roll
+        previous = self._utterance
+        if previous is not None and not previous.released:
+            # Still waiting for transcription, its audio must survive the new recording
+            previous.detach()
+        self._buffer.start()
+        utterance = Utterance(self._buffer, self.mic_rate)
+        self._speech_heard = False
+        self._trailing_silence = 0
+        # Finished segments are transcribed while the user is still talking
+        if self.streaming_stt:
+            utterance.transcriber = StreamingTranscriber(
+                utterance.read,
+                lambda samples: self._whisper_text(self._to_whisper_rate(samples), utterance.seconds),
+                self.mic_rate,
+                threshold=self.vad_threshold,
+                segment_silence=self.segment_silence,
+                max_segment_seconds=self.max_segment_seconds,
+                on_partial=self._report_partial)
+        self._utterance = utterance
+        self._recording = True
+
+    def stop_recording(self):
+        # Ends the recording and returns its Utterance for transcribe(), None if nothing was recording
+        if not self._recording:
+            return None
+        self._recording = False
+        self._buffer.stop()
+        utterance = self._utterance
+        utterance.stop()
+        return utterance
+
+    def discard(self, utterance):
+        # Drops an utterance that won't be transcribed
+        if utterance is None:
+            return
+        if utterance.transcriber:
+            utterance.transcriber.stop()
+        utterance.release()
+
+    @property
+    def partial_transcript(self):
+        # Text of the segments recognized so far in the latest utterance
+        utterance = self._utterance
+        return utterance.transcriber.partial_text if utterance and utterance.transcriber else ""
+
+    def _report_partial(self, text):
+        if self.on_partial:
+            self.on_partial(text)
 
     # Audio input
     def _callback(self, indata, frames, time_info, status):
-        if self.recording:
-            self.audio_queue.put(indata.copy())
+        # The input stream is always open: between utterances it only feeds the pre-roll
+        # and the barge-in detector, and returns right away when neither is needed
+        recording = self._recording
+        barge_in = self.barge_in and not recording and self._speech.playing
+        if not recording and not barge_in and not self._buffer.preroll:
+            return
+
+        # Downmix into the ring buffer, a view of the only channel needs no copy
+        mono = indata[:, 0] if indata.shape[1] == 1 else indata.mean(axis=1)
+        if not recording:
+            if barge_in:
+                self._check_barge_in(mono)
+            if self._buffer.preroll:
+                self._buffer.write(mono)
+            return
+
+        self._buffer.write(mono)
+        if self._buffer.full:
+            self._end_utterance("Maximum recording length reached")
+            return
+
+        if self.endpointing:
+            self._check_endpoint(mono)
+
+    def _check_endpoint(self, mono):
+        # Ends the utterance once the user has spoken and then stayed quiet long enough
+        if self._endpoint_vad.voiced_block(mono):
+            self._speech_heard = True
+            self._trailing_silence = 0
+            return
+
+        self._trailing_silence += len(mono)
+        if self._speech_heard and self._trailing_silence >= self.endpoint_silence * self.mic_rate:
+            self._end_utterance("Trailing silence detected")
+
+    def _end_utterance(self, reason):
+        # Called from the audio callback: only the capture stops here, logging,
+        # transcription and the LLM query run on their own thread
+        utterance = self.stop_recording()
+        threading.Thread(target=self._utterance_ended, args=(utterance, reason), daemon=True).start()
+
+    def _utterance_ended(self, utterance, reason):
+        print(f">> {reason}. Ending utterance...")
+        if self.on_endpoint:
+            self.on_endpoint(utterance)
+        else:
+            self.discard(utterance)
+
+    def _check_barge_in(self, mono):
+        # Needs a short stretch of continuous speech, a single loud block is usually a noise
+        if not self._barge_in_vad.voiced_block(mono):
+            self._barge_in_speech = 0
+            return
+
+        self._barge_in_speech += len(mono)
+        if self._barge_in_speech >= self.barge_in_min_speech * self.mic_rate:
+            self._barge_in_speech = 0
+            # Stopping the output stream from inside the input callback could deadlock the audio backend
+            threading.Thread(target=self._barged_in, daemon=True).start()
+
+    def _barged_in(self):
+        print(">> User started talking. Stopping playback...")
+        self.stop_speaking()
+        if self.on_barge_in:
+            self.on_barge_in()
 
     # Recording
     def record_loop(self):
-        # Listens to audio continiously and stores chunks into a queue
+        # Listens to audio continiously and stores chunks into the capture buffer
         with sounddevice.InputStream(samplerate=self.mic_rate, channels=self.channels, 
                                     callback=self._callback):
             while True:
                 time.sleep(self.record_timeout)
 
     # Transcription
-    def transcribe(self):
-        # Create an empty list and append audio chunks to it
-        frames = []
-        while not self.audio_queue.empty():
-            frames.append(self.audio_queue.get())
-
-        # Checks for no recording
-        if not frames:
-            print(">> No audio captured.")
+    def transcribe(self, utterance):
+        # Collects the transcript of an utterance returned by stop_recording()
+        if utterance is None:
             return None
-        
-        # Joins all audio chunks into a temporary .wav file
-        audio = numpy.concatenate(frames, axis=0)
-        temp_path = "temp_audio.wav"
-        write_wav(temp_path, self.mic_rate, audio)
+        transcriber = utterance.transcriber
 
-        # Transcribe the audio
-        segments, _ = self.whisper.transcribe(temp_path, language="en", task="transcribe")
-        text = " ".join([seg.text for seg in segments])
+        # Released on every way out, otherwise the held buffer stops feeding the next pre-roll
+        try:
+            # Checks for no recording
+            if not len(utterance.read()):
+                if transcriber:
+                    transcriber.finish()
+                print(">> No audio captured.")
+                return None
 
-        # Clean upfor temp files
-        os.remove(temp_path)
+            if transcriber:
+                # Earlier segments are already done, only the last one is left
+                text = transcriber.finish()
+            else:
+                # Resample what was captured to 16 kHz and hand it to Whisper in memory
+                text = self._whisper_text(self._to_whisper_rate(utterance.read()))
+        finally:
+            utterance.release()
 
         print(">> TRANSCRIPT:", text)
         return text.strip()
 
+    def _whisper_text(self, audio, utterance_seconds=None):
+        # No lock: the streaming workers and transcribe() share the model, extra calls wait for a model worker
+        model = self._stt_model(len(audio) / WHISPER_RATE if utterance_seconds is None else utterance_seconds)
+        segments, _ = model.transcribe(audio, language="en", task="transcribe")
+        return " ".join([seg.text for seg in segments])
+
+    def _stt_model(self, seconds):
+        # Short commands go to the fast model, dictation to the large one
+        # A fast model that failed to load isn't retried, configure_whisper() replaces it
+        fast = self._whisper_fast
+        if fast is not None and not fast.failed and seconds <= self.whisper_tier_seconds:
+            try:
+                return fast.get()
+            except RuntimeError as e:
+                print(f">> {e}, using the large model.")
+        return self.whisper
+
+    def _to_whisper_rate(self, audio):
+        # Polyphase resampling; at 16 kHz the ring buffer view goes to Whisper as is, it only reads it
+        if self.mic_rate == WHISPER_RATE:
+            return audio
+        factor = math.gcd(self.mic_rate, WHISPER_RATE)
+        return resample_poly(audio, WHISPER_RATE // factor, self.mic_rate // factor).astype(numpy.float32)
+
     # Text-To-Speech
     def speak(self, text):
         # Generate audio output from text
-        if not text or not self.voice:
+        if not text or not self._voice:
             return
         print(">> Generating speech...")
 
-        # Generate audio chunks from provided response text
-        audio_chunks = list(self.voice.synthesize(text, syn_config=self.tts_config))
-        if not audio_chunks:
-            print(">> Piper returned no audio.")
+        # Sentences are synthesized and played back to back
+        pipeline = self.speech_pipeline()
+        pipeline.feed(text)
+        pipeline.finish()
+        pipeline.wait()
+
+    def speech_pipeline(self, on_done=None, replace=None):
+        # Starts a pipelined speech session, None if no voice is configured
+        # The voice itself may still be loading, the synthesis thread waits for it
+        # It plays after the replies already queued, or cuts them off with replace (default: replace_speech)
+        if not self._voice:
+            return None
+        return self._speech.open(replace=self.replace_speech if replace is None else replace, on_done=on_done)
+
+    @property
+    def speaking(self):
+        return self._speech.playing
+
+    @property
+    def speech_pending(self):
+        # Replies playing or waiting to be played
+        return self._speech.pending
+
+    def stop_speaking(self):
+        # Interrupts the reply that is being spoken and drops the queued ones
+        self._speech.cancel()
+
+    def set_barge_in_threshold(self, threshold):
+        self._barge_in_vad.threshold = float(threshold)
+
+    def set_volume(self, volume):
+        # Applies to new replies and to the one that is playing right now
+        self.volume = min(max(float(volume), 0.0), 1.0)
+        for pipeline in self._speech.sessions:
+            if pipeline.output is not None:
+                pipeline.output.volume = self.volume
+
+    def _synthesize(self, text):
+        # Yields Piper's audio chunks as soon as each one is ready
+        # Piper itself runs on the TTS pool, the session thread only hands the chunks on
+        chunks = queue.Queue()
+        stop = threading.Event()
+
+        def job():
+            try:
+                for samples in self._synthesize_sentence(text):
+                    if stop.is_set():
+                        break
+                    chunks.put(samples)
+            except Exception as e:
+                chunks.put(e)
+            finally:
+                chunks.put(None)
+
+        self._tts_pool.submit(job)
+        try:
+            while True:
+                item = chunks.get()
+                if item is None:
+                    return
+                if isinstance(item, Exception):
+                    raise item
+                yield item
+        finally:
+            # Cancelled sessions stop consuming, the job ends after its current chunk
+            stop.set()
+
+    def _synthesize_sentence(self, text):
+        voice = self.voice
+        if self.tts_cache is None:
+            for chunk in voice.synthesize(text, syn_config=self.tts_config):
+                yield chunk.audio_int16_array
             return
 
-        # Extract audio chunks into an array
-        audio_arrays = []
-        for chunk in audio_chunks:
-            audio_arrays.append(chunk.audio_int16_array)
-        audio = numpy.concatenate(audio_arrays)
-
-        # Write the audio data to a wav file
-        wav_path = "response.wav"
-        write_wav(wav_path, self.tts_rate, audio)
-
-        # Play generated audio file with ffplay
-        subprocess.run(["ffplay", "-nodisp", "-autoexit", wav_path],
-                        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
-        
-        # Cleanup for temp files
-        os.remove(wav_path)
\ No newline at end of file
+        key = self.tts_cache.key(text, self.piper_model, self.tts_config)
+        cached = self.tts_cache.get(key)
+        if cached is not None:
+            yield cached
+            return
+
+        chunks = []
+        for chunk in voice.synthesize(text, syn_config=self.tts_config):
+            chunks.append(chunk.audio_int16_array)
+            yield chunk.audio_int16_array
+        # Only complete sentences are stored, an interrupted one never gets here
+        if chunks:
+            self.tts_cache.put(key, numpy.concatenate(chunks))
+
+    def _open_output(self):
+        return open_output(self.tts_rate, backend=self.output_backend, volume=self.volume)
+
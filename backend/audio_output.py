@@ -0,0 +1,173 @@
+import threading, subprocess, numpy, sounddevice
+
+
+def open_output(rate, backend="sounddevice", volume=1.0):
+    ''' Opens a playback output for int16 mono PCM
+
+    Args: rate (int): sample rate of the samples that will be written
+    backend (str): "sounddevice" for in-process playback or "ffplay"
+    volume (float): 0.0 - 1.0 '''
+    if backend == "sounddevice":
+        try:
+            return SoundDeviceOutput(rate, volume=volume)
+        except Exception as e:
+            print(f">> sounddevice output unavailable ({e}). Falling back to ffplay.")
+    return FfplayOutput(rate, volume=volume)
+
+
+### RING BUFFER ###
+class SampleRingBuffer:
+    def __init__(self, capacity):
+        ''' Fixed-size int16 buffer between the writer thread and the audio callback '''
+        self.capacity = capacity
+        self._data = numpy.zeros(capacity, dtype=numpy.int16)
+        self._start = 0
+        self._size = 0
+        self._lock = threading.Lock()
+        self._not_full = threading.Condition(self._lock)
+
+
+    def __len__(self):
+        return self._size
+
+
+    def write(self, samples):
+        # Copies as many samples as fit and returns how many were written
+        with self._lock:
+            count = min(len(samples), self.capacity - self._size)
+            end = (self._start + self._size) % self.capacity
+            first = min(count, self.capacity - end)
+            self._data[end:end + first] = samples[:first]
+            self._data[:count - first] = samples[first:count]
+            self._size += count
+            return count
+
+
+    def read_into(self, out):
+        # Fills out from the buffer and returns how many samples were read
+        with self._lock:
+            count = min(len(out), self._size)
+            first = min(count, self.capacity - self._start)
+            out[:first] = self._data[self._start:self._start + first]
+            out[first:count] = self._data[:count - first]
+            self._start = (self._start + count) % self.capacity
+            self._size -= count
+            self._not_full.notify_all()
+            return count
+
+
+    def wait_for_space(self, timeout):
+        with self._not_full:
+            if self._size >= self.capacity:
+                self._not_full.wait(timeout)
+
+
+    def clear(self):
+        with self._lock:
+            self._start = 0
+            self._size = 0
+            self._not_full.notify_all()
+
+
+### OUTPUT BACKENDS ###
+class SoundDeviceOutput:
+    def __init__(self, rate, volume=1.0, buffer_seconds=2.0, drain_grace=2.0):
+        ''' Plays int16 mono PCM in-process through a sounddevice.OutputStream
+
+        Written samples go into a ring buffer that the audio callback drains,
+        so writes of consecutive chunks play back to back.
+
+        drain_grace (float): seconds close() waits for the device beyond the buffered audio '''
+        self.rate = rate
+        self.volume = volume
+        self.drain_grace = drain_grace
+        self._ring = SampleRingBuffer(int(rate * buffer_seconds))
+        self._closing = False
+        self._stopped = False
+        self._finished = threading.Event()
+
+        self._stream = sounddevice.OutputStream(
+            samplerate=rate, channels=1, dtype="int16",
+            callback=self._callback, finished_callback=self._finished.set)
+        self._stream.start()
+
+
+    def _callback(self, outdata, frames, time_info, status):
+        out = outdata[:, 0]
+        count = self._ring.read_into(out)
+        out[count:] = 0
+
+        # Volume is applied here so changes take effect mid-sentence
+        if self.volume != 1.0:
+            numpy.multiply(out, min(max(self.volume, 0.0), 1.0), out=out, casting="unsafe")
+
+        # Stop once everything written before close() has been played
+        if self._closing and count == 0:
+            raise sounddevice.CallbackStop
+
+
+    def write(self, samples):
+        # Blocks while the ring buffer is full
+        samples = numpy.asarray(samples, dtype=numpy.int16).reshape(-1)
+        offset = 0
+        while offset < len(samples) and not self._stopped:
+            written = self._ring.write(samples[offset:])
+            offset += written
+            if not written:
+                self._ring.wait_for_space(0.05)
+
+
+    def close(self):
+        # Plays out the buffered audio, then releases the device
+        self._closing = True
+        # A stalled device never fires the finished callback, so the wait is bounded by what is left to play
+        timeout = len(self._ring) / self.rate + self.drain_grace
+        if not self._finished.wait(timeout):
+            print(">> Audio output didn't finish playing. Aborting the stream...")
+            self._ring.clear()
+            self._stream.abort()
+        self._stream.close()
+
+
+    def stop(self):
+        # Interrupts playback right away and drops buffered audio
+        if self._stopped:
+            return
+        self._stopped = True
+        self._ring.clear()
+        self._stream.abort()
+        self._stream.close()
+
+
+class FfplayOutput:
+    def __init__(self, rate, volume=1.0):
+        ''' Plays raw int16 mono PCM through a single ffplay process fed over stdin '''
+        self.rate = rate
+        self.volume = volume
+        self.process = subprocess.Popen(
+            ["ffplay", "-nodisp", "-autoexit", "-loglevel", "quiet",
+             "-volume", str(int(min(max(volume, 0.0), 1.0) * 100)),
+             "-f", "s16le", "-ar", str(rate), "-i", "-"],
+            stdin=subprocess.PIPE, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+
+    def write(self, samples):
+        # Queues samples right behind the previous ones, so there is no gap between writes
+        self.process.stdin.write(samples.tobytes())
+        self.process.stdin.flush()
+
+
+    def close(self):
+        # Lets ffplay play what it has received, then waits for it to exit
+        try:
+            self.process.stdin.close()
+        except BrokenPipeError:
+            pass
+        self.process.wait()
+
+
+    def stop(self):
+        # Interrupts playback right away
+        if self.process.poll() is None:
+            self.process.kill()
+        self.process.wait()
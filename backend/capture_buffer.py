@@ -0,0 +1,125 @@
+import numpy
+
+
+class CaptureBuffer:
+    def __init__(self, rate, seconds, preroll_seconds=0.0):
+        ''' Preallocated ring of float32 microphone samples with a single writer
+
+        The audio callback is the only writer. It copies a block in and then
+        advances the write index, so readers never need a lock: everything below
+        the index they read is complete. Every sample is stored twice, at pos and
+        pos + capacity, which makes any window up to capacity samples one
+        contiguous slice, so reads are zero-copy views.
+
+        Args: rate (int): sample rate of the stream
+        seconds (float): longest utterance kept
+        preroll_seconds (float): audio from before start() that is included in the utterance '''
+        self.rate = rate
+        self.preroll = int(rate * preroll_seconds)
+        self.capacity = int(rate * seconds) + self.preroll
+        self._ring = numpy.zeros(2 * self.capacity, dtype=numpy.float32)
+
+        # Absolute sample counts since the stream opened
+        self._written = 0
+        self._start = 0
+        self._end = 0
+        # Between stop() and clear() the utterance may still be read, so nothing is written
+        self._held = False
+        # Pre-roll never reaches back past a hold, that audio is from the previous utterance
+        self._floor = 0
+
+
+    ### PRODUCER SIDE ###
+    def write(self, samples):
+        # Called from the audio callback only
+        if self._held:
+            return
+        count = len(samples)
+        if self._end is None:
+            # Never laps the start of the utterance being captured, what doesn't fit is dropped
+            room = self.capacity - (self._written - self._start)
+            if count > room:
+                samples = samples[:room]
+                count = room
+        elif count > self.capacity:
+            self._written += count - self.capacity
+            samples = samples[-self.capacity:]
+            count = self.capacity
+
+        pos = self._written % self.capacity
+        first = min(count, self.capacity - pos)
+        self._ring[pos:pos + first] = samples[:first]
+        self._ring[pos + self.capacity:pos + self.capacity + first] = samples[:first]
+        rest = count - first
+        if rest:
+            self._ring[:rest] = samples[first:]
+            self._ring[self.capacity:self.capacity + rest] = samples[first:]
+        # Published last, readers only look below it
+        self._written += count
+
+
+    ### UTTERANCE MARKS ###
+    def start(self, preroll=True):
+        # A new utterance begins now, or pre-roll seconds ago
+        written = self._written
+        if self._held:
+            self._held = False
+            self._floor = written
+        self._start = max(self._floor, written - (self.preroll if preroll else 0))
+        self._end = None
+
+
+    def stop(self):
+        # Freezes the utterance end and holds writes until it has been read and cleared
+        if self._end is None:
+            self._end = self._written
+            self._held = True
+
+
+    def clear(self):
+        # The utterance is consumed, writes resume and feed the next pre-roll
+        self._start = self._end = self._written
+        if self._held:
+            self._held = False
+            self._floor = self._written
+
+
+    def release(self, start):
+        # Clears the utterance that began at start, unless a newer one has begun since
+        if self._start == start and self._end is not None:
+            self.clear()
+
+
+    @property
+    def marks(self):
+        # (start, end) of the current utterance, end is None while it is being captured
+        return self._start, self._end
+
+
+    @property
+    def captured(self):
+        # Samples in the current utterance so far
+        end = self._written if self._end is None else self._end
+        return max(0, min(end - self._start, self.capacity))
+
+
+    @property
+    def full(self):
+        return self._end is None and self._written - self._start >= self.capacity
+
+
+    ### CONSUMER SIDE ###
+    def read(self, offset=0, end=None):
+        # Zero-copy view of the current utterance from offset to end (default: everything captured)
+        return self.read_span(self._start, self._end, offset, end)
+
+
+    def read_span(self, start, stop, offset=0, end=None):
+        # Same for the utterance marked [start, stop), stop None while it is being captured
+        # The view stays valid until the writer laps it, i.e. for `seconds` of further audio
+        stop = self._written if stop is None else stop
+        captured = max(0, min(stop - start, self.capacity))
+        end = captured if end is None else min(end, captured)
+        offset = min(max(0, offset), end)
+        pos = (start + offset) % self.capacity
+        return self._ring[pos:pos + end - offset]
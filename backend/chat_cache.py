@@ -0,0 +1,160 @@
+import threading
+from collections import OrderedDict
+from typing import List, Dict, Optional
+
+
+### LRU cache in front of a chat storage backend ###
+class CachedChatStorage:
+    def __init__(self, storage, max_chats: int = 32):
+        ''' Keeps the parsed messages and metadata of recently used chats in memory
+
+        Writes go straight through to the wrapped storage and update the cached
+        copy, so a cached chat never has to be read back from disk. Deleted chats
+        are evicted. Exposes the same interface as the storage it wraps.
+
+        Args: storage: JsonlChatStorage or SqliteChatStorage
+        max_chats (int): chats kept in memory '''
+        self.storage = storage
+        self.max_chats = max_chats
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.RLock()
+        self._entries: "OrderedDict[str, Dict]" = OrderedDict()
+
+
+    ### Reads ###
+    def read_messages(self, chat_id: str) -> Optional[List[Dict]]:
+        with self._lock:
+            entry = self._lookup(chat_id, "messages")
+            if entry is not None:
+                return list(entry["messages"])
+
+            messages = self.storage.read_messages(chat_id)
+            if messages is not None:
+                self._entry(chat_id)["messages"] = list(messages)
+            return messages
+
+
+    def message_count(self, chat_id: str) -> int:
+        with self._lock:
+            entry = self._entries.get(chat_id)
+            if entry is not None and "messages" in entry:
+                return len(entry["messages"])
+        return self.storage.message_count(chat_id)
+
+
+    def read_range(self, chat_id: str, start: int, end: int) -> List[Dict]:
+        # A page of a chat pulls the whole chat into the cache, later pages are slices
+        with self._lock:
+            entry = self._lookup(chat_id, "messages")
+            if entry is None:
+                messages = self.storage.read_messages(chat_id)
+                if messages is None:
+                    raise FileNotFoundError(f"Chat not found: {chat_id}")
+                entry = self._entry(chat_id)
+                entry["messages"] = list(messages)
+            return entry["messages"][start:end]
+
+
+    def read_meta(self, chat_id: str) -> Optional[Dict]:
+        with self._lock:
+            entry = self._lookup(chat_id, "meta")
+            if entry is not None:
+                return dict(entry["meta"])
+
+            meta = self.storage.read_meta(chat_id)
+            if meta is not None:
+                self._entry(chat_id)["meta"] = dict(meta)
+            return meta
+
+
+    def exists(self, chat_id: str) -> bool:
+        with self._lock:
+            if chat_id in self._entries:
+                return True
+        return self.storage.exists(chat_id)
+
+
+    def chat_ids(self) -> List[str]:
+        return self.storage.chat_ids()
+
+
+    def list_metas(self, limit: Optional[int] = None, offset: int = 0) -> List[Dict]:
+        return self.storage.list_metas(limit, offset)
+
+
+    def count(self) -> int:
+        return self.storage.count()
+
+
+    def search(self, query: str, limit: int = 20) -> List[Dict]:
+        return self.storage.search(query, limit)
+
+
+    ### Write-through ###
+    def create(self, meta: Dict, messages: List[Dict]) -> None:
+        with self._lock:
+            self.storage.create(meta, messages)
+            entry = self._entry(meta["id"])
+            entry["meta"] = dict(meta)
+            entry["messages"] = list(messages)
+
+
+    def write_meta(self, chat_id: str, meta: Dict) -> None:
+        with self._lock:
+            self.storage.write_meta(chat_id, meta)
+            self._entry(chat_id)["meta"] = dict(meta)
+
+
+    def append_messages(self, chat_id: str, messages: List[Dict]) -> None:
+        with self._lock:
+            self.storage.append_messages(chat_id, messages)
+            entry = self._entries.get(chat_id)
+            if entry is not None and "messages" in entry:
+                entry["messages"].extend(messages)
+
+
+    def replace_messages(self, chat_id: str, messages: List[Dict]) -> None:
+        with self._lock:
+            self.storage.replace_messages(chat_id, messages)
+            self._entry(chat_id)["messages"] = list(messages)
+
+
+    def delete(self, chat_id: str) -> None:
+        with self._lock:
+            self._entries.pop(chat_id, None)
+            self.storage.delete(chat_id)
+
+
+    ### Reporting ###
+    def stats(self) -> Dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "chats": len(self._entries),
+                "max_chats": self.max_chats,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+            }
+
+
+    ### LRU internals ###
+    def _lookup(self, chat_id: str, key: str) -> Optional[Dict]:
+        entry = self._entries.get(chat_id)
+        if entry is not None and key in entry:
+            self._entries.move_to_end(chat_id)
+            self.hits += 1
+            return entry
+        self.misses += 1
+        return None
+
+
+    def _entry(self, chat_id: str) -> Dict:
+        entry = self._entries.get(chat_id)
+        if entry is None:
+            entry = self._entries[chat_id] = {}
+            while len(self._entries) > self.max_chats:
+                self._entries.popitem(last=False)
+        self._entries.move_to_end(chat_id)
+        return entry
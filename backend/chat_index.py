@@ -0,0 +1,67 @@
+import json
+import sqlite3
+import threading
+from typing import List, Dict, Optional, Set
+
+
+### Persistent index of chat metadata ###
+class ChatIndex:
+    def __init__(self, path: str):
+        ''' SQLite table with one row per chat so listing and lookups don't touch every meta.json
+
+        Args: path (str): database file, created on first use '''
+        self.path = path
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        with self._lock, self._db:
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("""
+                CREATE TABLE IF NOT EXISTS chats (
+                    id TEXT PRIMARY KEY,
+                    updated_at TEXT NOT NULL DEFAULT '',
+                    meta TEXT NOT NULL
+                )""")
+            self._db.execute("CREATE INDEX IF NOT EXISTS chats_updated_at ON chats (updated_at DESC)")
+
+
+    def upsert(self, meta: Dict) -> None:
+        with self._lock, self._db:
+            self._db.execute(
+                "INSERT INTO chats (id, updated_at, meta) VALUES (?, ?, ?) "
+                "ON CONFLICT(id) DO UPDATE SET updated_at = excluded.updated_at, meta = excluded.meta",
+                (meta["id"], meta.get("updated_at", ""), json.dumps(meta, ensure_ascii=False)))
+
+
+    def remove(self, chat_id: str) -> None:
+        with self._lock, self._db:
+            self._db.execute("DELETE FROM chats WHERE id = ?", (chat_id,))
+
+
+    def get(self, chat_id: str) -> Optional[Dict]:
+        with self._lock:
+            row = self._db.execute("SELECT meta FROM chats WHERE id = ?", (chat_id,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+
+    def list(self, limit: Optional[int] = None, offset: int = 0) -> List[Dict]:
+        # Most recently updated first
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT meta FROM chats ORDER BY updated_at DESC LIMIT ? OFFSET ?",
+                (-1 if limit is None else limit, offset)).fetchall()
+        return [json.loads(row[0]) for row in rows]
+
+
+    def count(self) -> int:
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM chats").fetchone()[0]
+
+
+    def ids(self) -> Set[str]:
+        with self._lock:
+            return {row[0] for row in self._db.execute("SELECT id FROM chats")}
+
+
+    def close(self) -> None:
+        with self._lock:
+            self._db.close()
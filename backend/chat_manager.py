@@ -1,8 +1,8 @@
 import os
-import json
 import time
 import uuid
-from typing import List, Dict
+from typing import List, Dict, Optional
+from chat_storage import JsonlChatStorage
 
 
 # Helper function to fetch time
@@ -12,51 +12,40 @@ def _time_now() -> str:
 
 ### Manages chats ###
 class ChatManager:
-    def __init__(self, base_dir: str, system_prompt: str):
+    def __init__(self, base_dir: str, system_prompt: str, storage=None):
         # Creates base directory for chat storage & sets default prompt
+        # storage: backend holding metadata and messages (JsonlChatStorage or SqliteChatStorage)
         self.base_dir = base_dir
         self.system_prompt = system_prompt
         os.makedirs(self.base_dir, exist_ok=True)
+        self.storage = storage or JsonlChatStorage(base_dir)
 
 
-    ### Patch builders ###
-    def _chat_dir(self, chat_id: str) -> str:
-        return os.path.join(self.base_dir, chat_id)
+    def list_chats(self, limit: Optional[int] = None, offset: int = 0) -> List[Dict]:
+        # Function that lists chats for sidebar, most recently updated first
+        return self.storage.list_metas(limit, offset)
 
 
-    def _meta_path(self, chat_id: str) -> str:
-        return os.path.join(self._chat_dir(chat_id), "meta.json")
+    def count_chats(self) -> int:
+        return self.storage.count()
 
 
-    def _messages_path(self, chat_id: str) -> str:
-        return os.path.join(self._chat_dir(chat_id), "messages.json")
+    def search(self, query: str, limit: int = 20) -> List[Dict]:
+        # Full-text search over message content, best matches first
+        return self.storage.search(query, limit)
 
 
-    def list_chats(self) -> List[Dict]:
-        # Function that lists chats for sidebar
-        chats = []
-        if not os.path.exists(self.base_dir):
-            return chats
-
-        # Loops through everything inside base directory & add to list
-        for chat_id in os.listdir(self.base_dir):
-            cdir = self._chat_dir(chat_id)
-            if not os.path.isdir(cdir):
-                continue
-            meta = self._read_json(self._meta_path(chat_id), default=None)
-            if not meta:
-                continue
-            chats.append(meta)
-
-        # Sorting for better UX
-        chats.sort(key=lambda m: m.get("updated_at", ""), reverse=True)
-        return chats
+    def get_meta(self, chat_id: str) -> Dict:
+        # Looks up one chat's metadata without listing the others
+        meta = self.storage.read_meta(chat_id)
+        if meta is None:
+            raise FileNotFoundError(f"Chat not found: {chat_id}")
+        return meta
 
 
     def create_chat(self, title: str = "New chat") -> Dict:
-        # Creates folder for a chat, assigns a uuid for it, creates metadata and initializes the chat
+        # Assigns a uuid for a chat, creates metadata and initializes the chat
         chat_id = uuid.uuid4().hex[:12]
-        os.makedirs(self._chat_dir(chat_id), exist_ok=True)
 
         meta = {
             "id": chat_id,
@@ -69,15 +58,14 @@ class ChatManager:
             "content": self.system_prompt
         }]
 
-        self._write_json(self._messages_path(chat_id), messages)
-        self._write_json(self._meta_path(chat_id), meta)
+        self.storage.create(meta, messages)
         return meta
 
 
     def ensure_default_chat(self) -> Dict:
         # Ensures most recently updated chat launches first
         # If no chats -> creates new
-        chats = self.list_chats()
+        chats = self.list_chats(limit=1)
         if chats:
             return chats[0]
         return self.create_chat("New chat")
@@ -85,86 +73,106 @@ class ChatManager:
 
     def get_messages(self, chat_id: str) -> List[Dict]:
         # Loads chat messages for a specific chat
-        messages = self._read_json(self._messages_path(chat_id), default=None)
+        messages = self.storage.read_messages(chat_id)
         if messages is None:
             raise FileNotFoundError(f"Chat not found: {chat_id}")
         return messages
 
 
+    def get_message_page(self, chat_id: str, before: Optional[int] = None, after: Optional[int] = None,
+                         since: Optional[int] = None, limit: Optional[int] = None) -> Dict:
+        # Loads a window of messages by index: the latest `limit`, the ones before index `before`,
+        # the ones after index `after`, or everything from index `since` on (a client's delta)
+        total = self.storage.message_count(chat_id)
+        if after is not None or since is not None:
+            start = max(0, since if since is not None else after + 1)
+            end = total if limit is None else min(total, start + limit)
+        else:
+            end = total if before is None else max(0, min(before, total))
+            start = 0 if limit is None else max(0, end - limit)
+
+        return {
+            "messages": self.storage.read_range(chat_id, start, end) if start < end else [],
+            "start": start,
+            "total": total,
+        }
+
+
+    def get_summary(self, chat_id: str) -> Optional[Dict]:
+        # Rolling summary of older turns: {"text", "upto"} where upto counts the summarized messages after the system prompt
+        return self.get_meta(chat_id).get("context_summary")
+
+
+    def set_summary(self, chat_id: str, summary: Optional[Dict]) -> None:
+        # Stored in the chat's metadata, without counting as an update
+        meta = self.get_meta(chat_id)
+        meta["context_summary"] = summary
+        self.storage.write_meta(chat_id, meta)
+
+
     def save_messages(self, chat_id: str, messages: List[Dict]) -> None:
-        # Saves new messages to a json file
-        if not os.path.isdir(self._chat_dir(chat_id)):
+        # Replaces the chat history, only the changed tail is written when possible
+        if not self.storage.exists(chat_id):
             raise FileNotFoundError(f"Chat not found: {chat_id}")
 
-        self._write_json(self._messages_path(chat_id), messages)
-        meta = self._read_json(self._meta_path(chat_id), default=None)
+        self.storage.replace_messages(chat_id, messages)
+        self._touch(chat_id, reset_summary=True)
 
-        if not meta:
-            meta = {
-                "id": chat_id,
-                "title": "Chat",
-                "created_at": _time_now()
-            }
 
-        meta["updated_at"] = _time_now()
-        self._write_json(self._meta_path(chat_id), meta)
+    def append_messages(self, chat_id: str, messages: List[Dict]) -> None:
+        # Adds messages after the stored history without rewriting it
+        if not self.storage.exists(chat_id):
+            raise FileNotFoundError(f"Chat not found: {chat_id}")
+
+        self.storage.append_messages(chat_id, messages)
+        self._touch(chat_id)
 
 
     def clear_chat(self, chat_id: str) -> None:
-        # Resets messages.json to initial system prompt & updates meta
-        if not os.path.isdir(self._chat_dir(chat_id)):
+        # Resets messages to initial system prompt & updates meta
+        if not self.storage.exists(chat_id):
             raise FileNotFoundError(f"Chat not found: {chat_id}")
 
         messages = [{
             "role": "system",
             "content": self.system_prompt
             }]
-        self._write_json(self._messages_path(chat_id), messages)
-        meta = self._read_json(self._meta_path(chat_id), default=None)
-
-        if meta:
-            meta["updated_at"] = _time_now()
-            self._write_json(self._meta_path(chat_id), meta)
+        self.storage.replace_messages(chat_id, messages)
+        self._touch(chat_id, create=False, reset_summary=True)
 
 
     def rename_chat(self, chat_id: str, title: str) -> Dict:
         # Loads metadata for a chat and tries to set empty title
-        meta = self._read_json(self._meta_path(chat_id), default=None)
+        meta = self.storage.read_meta(chat_id)
 
         if meta is None:
             raise FileNotFoundError(f"Chat not found: {chat_id}")
         
         meta["title"] = title.strip() or meta.get("title", "Chat")
         meta["updated_at"] = _time_now()
-        self._write_json(self._meta_path(chat_id), meta)
+        self.storage.write_meta(chat_id, meta)
         return meta
 
     def delete_chat(self, chat_id: str) -> None:
-        # Recursively deletes files, directories & chat folder
-        cdir = self._chat_dir(chat_id)
-        if not os.path.isdir(cdir):
+        if not self.storage.exists(chat_id):
             raise FileNotFoundError(f"Chat not found: {chat_id}")
+        self.storage.delete(chat_id)
 
-        for root, dirs, files in os.walk(cdir, topdown=False):
-            for f in files:
-                os.remove(os.path.join(root, f))
-            for d in dirs:
-                os.rmdir(os.path.join(root, d))
-        
-        os.rmdir(cdir)
-        
-    def _read_json(self, path: str, default):
-        # Helper function to read json files
-        try:
-            if not os.path.exists(path):
-                return default
-            with open(path, "r", encoding="utf-8") as f:
-                return json.load(f)
-        except Exception:
-            return default
-
-    def _write_json(self, path: str, data) -> None:
-        # Helper function to write json data
-        os.makedirs(os.path.dirname(path), exist_ok=True)
-        with open(path, "w", encoding="utf-8") as f:
-            json.dump(data, f, ensure_ascii=False, indent=2)
\ No newline at end of file
+    def _touch(self, chat_id: str, create: bool = True, reset_summary: bool = False) -> None:
+        # Bumps updated_at, recreating lost metadata if asked to
+        # A rewritten history no longer matches the rolling summary, so it can be dropped
+        meta = self.storage.read_meta(chat_id)
+
+        if not meta:
+            if not create:
+                return
+            meta = {
+                "id": chat_id,
+                "title": "Chat",
+                "created_at": _time_now()
+            }
+
+        if reset_summary:
+            meta.pop("context_summary", None)
+        meta["updated_at"] = _time_now()
+        self.storage.write_meta(chat_id, meta)
@@ -0,0 +1,551 @@
+import os
+import json
+import sqlite3
+import hashlib
+import threading
+from typing import List, Dict, Optional
+from chat_index import ChatIndex
+
+
+def _fsync_dir(path: str) -> None:
+    # Makes a rename inside the directory durable
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+def atomic_write(path: str, text: str) -> None:
+    # Write to a temp file, fsync it and rename over the target so readers never see half a file
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(text)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+    _fsync_dir(os.path.dirname(path))
+
+
+def _chain(previous: bytes, message: Dict) -> bytes:
+    # Digest of a history given the digest of everything before its last message
+    return hashlib.sha1(previous + json.dumps(message, ensure_ascii=False, sort_keys=True).encode("utf-8")).digest()
+
+
+class _LogState:
+    ''' What is known about a chat's log without reading it again '''
+    def __init__(self):
+        self.offsets = []         # (byte offset, length) of each live message's line
+        self.digests = []         # digests[i] covers the first i + 1 live messages
+        self.records = 0          # lines in the log, live or not
+        self.size = 0             # bytes of valid log
+
+    @property
+    def count(self) -> int:
+        return len(self.offsets)
+
+    def add(self, message: Dict, offset: int, length: int) -> None:
+        self.offsets.append((offset, length))
+        self.digests.append(_chain(self.digests[-1] if self.digests else b"", message))
+
+    def truncate(self, keep: int) -> None:
+        del self.offsets[keep:]
+        del self.digests[keep:]
+
+    def extends(self, messages: List[Dict]) -> bool:
+        # True when messages start with the whole stored history
+        if not self.count or len(messages) < self.count:
+            return False
+        digest = b""
+        for message in messages[:self.count]:
+            digest = _chain(digest, message)
+        return digest == self.digests[-1]
+
+
+### Per-chat directories with an append-only message log ###
+class JsonlChatStorage:
+    def __init__(self, base_dir: str, compact_ratio: float = 2.0, compact_min_records: int = 64, index=None):
+        ''' Stores every chat as <base_dir>/<chat_id>/{meta.json, messages.jsonl}
+
+        messages.jsonl is an operation log: {"op": "add", "message"} appends one
+        message and {"op": "truncate", "keep"} cuts the history back to its first
+        messages. Adding a message is one appended line, whatever the history
+        length. The log is rewritten (compacted) once it holds compact_ratio
+        times more records than live messages. The byte offsets of the live lines
+        are kept in memory, so a page of messages is read without replaying the
+        log. meta.json is replaced atomically
+        and mirrored into a ChatIndex (index.db) for listing and lookups.
+
+        Args: base_dir (str): chats directory
+        compact_ratio (float): records / live messages that trigger compaction
+        compact_min_records (int): logs shorter than this are never compacted
+        index: ChatIndex, defaults to <base_dir>/index.db '''
+        self.base_dir = base_dir
+        self.compact_ratio = compact_ratio
+        self.compact_min_records = compact_min_records
+        self._lock = threading.RLock()
+        self._states: Dict[str, _LogState] = {}
+        os.makedirs(self.base_dir, exist_ok=True)
+        self.index = index or ChatIndex(os.path.join(base_dir, "index.db"))
+        self._reconcile_index()
+
+
+    ### Path builders ###
+    def _chat_dir(self, chat_id: str) -> str:
+        return os.path.join(self.base_dir, chat_id)
+
+    def _meta_path(self, chat_id: str) -> str:
+        return os.path.join(self._chat_dir(chat_id), "meta.json")
+
+    def _log_path(self, chat_id: str) -> str:
+        return os.path.join(self._chat_dir(chat_id), "messages.jsonl")
+
+    def _legacy_path(self, chat_id: str) -> str:
+        return os.path.join(self._chat_dir(chat_id), "messages.json")
+
+
+    ### Chats & metadata ###
+    def exists(self, chat_id: str) -> bool:
+        return os.path.isdir(self._chat_dir(chat_id))
+
+
+    def chat_ids(self) -> List[str]:
+        if not os.path.exists(self.base_dir):
+            return []
+        return [name for name in os.listdir(self.base_dir) if os.path.isdir(self._chat_dir(name))]
+
+
+    def read_meta(self, chat_id: str) -> Optional[Dict]:
+        return self.index.get(chat_id)
+
+
+    def list_metas(self, limit: Optional[int] = None, offset: int = 0) -> List[Dict]:
+        return self.index.list(limit, offset)
+
+
+    def count(self) -> int:
+        return self.index.count()
+
+
+    def search(self, query: str, limit: int = 20) -> List[Dict]:
+        raise NotImplementedError("Full-text search needs CHAT_STORAGE = 'sqlite'")
+
+
+    def _read_meta_file(self, chat_id: str) -> Optional[Dict]:
+        try:
+            with open(self._meta_path(chat_id), "r", encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+        except ValueError as e:
+            print(f">> Unreadable meta.json for chat {chat_id}: {e}")
+            return None
+
+
+    def write_meta(self, chat_id: str, meta: Dict) -> None:
+        atomic_write(self._meta_path(chat_id), json.dumps(meta, ensure_ascii=False, indent=2))
+        self.index.upsert(meta)
+
+
+    def _reconcile_index(self) -> None:
+        # Only chats added or removed outside the app are parsed, the rest is a directory listing
+        on_disk = set(self.chat_ids())
+        indexed = self.index.ids()
+        for chat_id in indexed - on_disk:
+            self.index.remove(chat_id)
+        for chat_id in on_disk - indexed:
+            meta = self._read_meta_file(chat_id)
+            if meta:
+                self.index.upsert({**meta, "id": chat_id})
+
+
+    def create(self, meta: Dict, messages: List[Dict]) -> None:
+        chat_id = meta["id"]
+        os.makedirs(self._chat_dir(chat_id), exist_ok=True)
+        with self._lock:
+            self._rewrite(chat_id, messages)
+        self.write_meta(chat_id, meta)
+
+
+    def delete(self, chat_id: str) -> None:
+        # Recursively deletes files, directories & chat folder
+        cdir = self._chat_dir(chat_id)
+        with self._lock:
+            self._states.pop(chat_id, None)
+            self.index.remove(chat_id)
+            for root, dirs, files in os.walk(cdir, topdown=False):
+                for f in files:
+                    os.remove(os.path.join(root, f))
+                for d in dirs:
+                    os.rmdir(os.path.join(root, d))
+            os.rmdir(cdir)
+
+
+    ### Messages ###
+    def read_messages(self, chat_id: str) -> Optional[List[Dict]]:
+        with self._lock:
+            if not self._ensure_log(chat_id):
+                return None
+            messages, self._states[chat_id] = self._replay(chat_id)
+            return messages
+
+
+    def message_count(self, chat_id: str) -> int:
+        with self._lock:
+            return self._state(chat_id).count
+
+
+    def read_range(self, chat_id: str, start: int, end: int) -> List[Dict]:
+        # Seeks to the lines of the requested messages, the rest of the log isn't read
+        with self._lock:
+            spans = self._state(chat_id).offsets[start:end]
+            messages = []
+            with open(self._log_path(chat_id), "rb") as f:
+                for offset, length in spans:
+                    f.seek(offset)
+                    messages.append(json.loads(f.read(length))["message"])
+            return messages
+
+
+    def append_messages(self, chat_id: str, messages: List[Dict]) -> None:
+        # Constant work per message: one line each, no read of the existing history
+        if not messages:
+            return
+        with self._lock:
+            state = self._state(chat_id)
+            lines = [{"op": "add", "message": message} for message in messages]
+            self._append(chat_id, state, lines)
+
+
+    def replace_messages(self, chat_id: str, messages: List[Dict]) -> None:
+        # Only the difference to the stored history is written when it can be found cheaply
+        with self._lock:
+            state = self._state(chat_id)
+            if state.extends(messages):
+                # Same history plus new messages
+                return self.append_messages(chat_id, messages[state.count:])
+
+            if len(messages) <= 1:
+                # Cleared back to the system prompt or emptied
+                self._append(chat_id, state, [{"op": "truncate", "keep": 0}] +
+                             [{"op": "add", "message": message} for message in messages])
+                self._maybe_compact(chat_id, state)
+                return
+
+            # Edited somewhere in the middle, write the new history out
+            self._rewrite(chat_id, messages)
+
+
+    ### Log internals ###
+    def _state(self, chat_id: str) -> _LogState:
+        state = self._states.get(chat_id)
+        if state is None:
+            if not self._ensure_log(chat_id):
+                raise FileNotFoundError(f"Chat not found: {chat_id}")
+            _, state = self._replay(chat_id)
+            self._states[chat_id] = state
+        return state
+
+
+    def _ensure_log(self, chat_id: str) -> bool:
+        # Converts a legacy messages.json into the log on first access
+        if os.path.exists(self._log_path(chat_id)):
+            return True
+        legacy_path = self._legacy_path(chat_id)
+        if not os.path.exists(legacy_path):
+            return False
+
+        with open(legacy_path, "r", encoding="utf-8") as f:
+            messages = json.load(f)
+        self._rewrite(chat_id, messages)
+        os.remove(legacy_path)
+        print(f">> Migrated chat {chat_id} to messages.jsonl")
+        return True
+
+
+    def _replay(self, chat_id: str):
+        # Rebuilds the message list from the log; a torn last line from a crash is cut off
+        messages, state = [], _LogState()
+        with open(self._log_path(chat_id), "rb") as f:
+            for raw_line in f:
+                if not raw_line.endswith(b"\n"):
+                    break
+                try:
+                    record = json.loads(raw_line)
+                except ValueError:
+                    break
+
+                self._apply(state, record, state.size, len(raw_line))
+                if record.get("op") == "add":
+                    messages.append(record["message"])
+                elif record.get("op") == "truncate":
+                    del messages[record.get("keep", 0):]
+                state.records += 1
+                state.size += len(raw_line)
+
+        if state.size != os.path.getsize(self._log_path(chat_id)):
+            print(f">> Dropping incomplete record at the end of chat {chat_id}'s log")
+            os.truncate(self._log_path(chat_id), state.size)
+
+        return messages, state
+
+
+    def _apply(self, state: _LogState, record: Dict, offset: int, length: int) -> None:
+        if record.get("op") == "add":
+            state.add(record["message"], offset, length)
+        elif record.get("op") == "truncate":
+            state.truncate(record.get("keep", 0))
+
+
+    def _append(self, chat_id: str, state: _LogState, records: List[Dict]) -> None:
+        lines = [(json.dumps(record, ensure_ascii=False) + "\n").encode("utf-8") for record in records]
+        with open(self._log_path(chat_id), "ab") as f:
+            f.write(b"".join(lines))
+            f.flush()
+            os.fsync(f.fileno())
+        for record, line in zip(records, lines):
+            self._apply(state, record, state.size, len(line))
+            state.records += 1
+            state.size += len(line)
+
+
+    def _maybe_compact(self, chat_id: str, state: _LogState) -> None:
+        if state.records >= self.compact_min_records and state.records > self.compact_ratio * max(state.count, 1):
+            messages, _ = self._replay(chat_id)
+            self._rewrite(chat_id, messages)
+
+
+    def _rewrite(self, chat_id: str, messages: List[Dict]) -> None:
+        # Compacted log holding only the live messages, swapped in atomically
+        lines = [json.dumps({"op": "add", "message": message}, ensure_ascii=False) + "\n" for message in messages]
+        atomic_write(self._log_path(chat_id), "".join(lines))
+        state = _LogState()
+        for message, line in zip(messages, lines):
+            length = len(line.encode("utf-8"))
+            state.add(message, state.size, length)
+            state.records += 1
+            state.size += length
+        self._states[chat_id] = state
+
+
+### Single SQLite database with full-text search ###
+class SqliteChatStorage:
+    def __init__(self, db_path: str):
+        ''' Stores all chats in one SQLite database (WAL mode)
+
+        Messages are rows keyed by (chat_id, seq) and mirrored into an FTS5
+        table by triggers, so search() ranks hits across every chat.
+
+        Args: db_path (str): database file, created on first use '''
+        self.db_path = db_path
+        os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+        self._lock = threading.RLock()
+        self._db = sqlite3.connect(db_path, check_same_thread=False)
+        with self._lock, self._db:
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("PRAGMA synchronous=NORMAL")
+            self._db.execute("PRAGMA foreign_keys=ON")
+            self._db.executescript("""
+                CREATE TABLE IF NOT EXISTS chats (
+                    id TEXT PRIMARY KEY,
+                    updated_at TEXT NOT NULL DEFAULT '',
+                    meta TEXT NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS chats_updated_at ON chats (updated_at DESC);
+
+                CREATE TABLE IF NOT EXISTS messages (
+                    id INTEGER PRIMARY KEY,
+                    chat_id TEXT NOT NULL REFERENCES chats (id) ON DELETE CASCADE,
+                    seq INTEGER NOT NULL,
+                    role TEXT NOT NULL,
+                    content TEXT NOT NULL
+                );
+                CREATE UNIQUE INDEX IF NOT EXISTS messages_chat_seq ON messages (chat_id, seq);
+
+                CREATE VIRTUAL TABLE IF NOT EXISTS messages_fts
+                    USING fts5 (content, content='messages', content_rowid='id');
+
+                CREATE TRIGGER IF NOT EXISTS messages_ai AFTER INSERT ON messages BEGIN
+                    INSERT INTO messages_fts (rowid, content) VALUES (new.id, new.content);
+                END;
+                CREATE TRIGGER IF NOT EXISTS messages_ad AFTER DELETE ON messages BEGIN
+                    INSERT INTO messages_fts (messages_fts, rowid, content) VALUES ('delete', old.id, old.content);
+                END;
+            """)
+
+
+    ### Chats & metadata ###
+    def exists(self, chat_id: str) -> bool:
+        with self._lock:
+            return self._db.execute("SELECT 1 FROM chats WHERE id = ?", (chat_id,)).fetchone() is not None
+
+
+    def chat_ids(self) -> List[str]:
+        with self._lock:
+            return [row[0] for row in self._db.execute("SELECT id FROM chats")]
+
+
+    def read_meta(self, chat_id: str) -> Optional[Dict]:
+        with self._lock:
+            row = self._db.execute("SELECT meta FROM chats WHERE id = ?", (chat_id,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+
+    def list_metas(self, limit: Optional[int] = None, offset: int = 0) -> List[Dict]:
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT meta FROM chats ORDER BY updated_at DESC LIMIT ? OFFSET ?",
+                (-1 if limit is None else limit, offset)).fetchall()
+        return [json.loads(row[0]) for row in rows]
+
+
+    def count(self) -> int:
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM chats").fetchone()[0]
+
+
+    def write_meta(self, chat_id: str, meta: Dict) -> None:
+        with self._lock, self._db:
+            self._upsert_meta(meta)
+
+
+    def create(self, meta: Dict, messages: List[Dict]) -> None:
+        with self._lock, self._db:
+            self._upsert_meta(meta)
+            self._insert(meta["id"], 0, messages)
+
+
+    def delete(self, chat_id: str) -> None:
+        with self._lock, self._db:
+            self._db.execute("DELETE FROM chats WHERE id = ?", (chat_id,))
+
+
+    ### Messages ###
+    def read_messages(self, chat_id: str) -> Optional[List[Dict]]:
+        if not self.exists(chat_id):
+            return None
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT role, content FROM messages WHERE chat_id = ? ORDER BY seq", (chat_id,)).fetchall()
+        return [{"role": role, "content": content} for role, content in rows]
+
+
+    def message_count(self, chat_id: str) -> int:
+        if not self.exists(chat_id):
+            raise FileNotFoundError(f"Chat not found: {chat_id}")
+        with self._lock:
+            return self._next_seq(chat_id)
+
+
+    def read_range(self, chat_id: str, start: int, end: int) -> List[Dict]:
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT role, content FROM messages WHERE chat_id = ? AND seq >= ? AND seq < ? ORDER BY seq",
+                (chat_id, start, end)).fetchall()
+        return [{"role": role, "content": content} for role, content in rows]
+
+
+    def append_messages(self, chat_id: str, messages: List[Dict]) -> None:
+        with self._lock, self._db:
+            self._insert(chat_id, self._next_seq(chat_id), messages)
+
+
+    def replace_messages(self, chat_id: str, messages: List[Dict]) -> None:
+        with self._lock, self._db:
+            count = self._next_seq(chat_id)
+            if count and len(messages) >= count:
+                role, content = self._db.execute(
+                    "SELECT role, content FROM messages WHERE chat_id = ? AND seq = ?",
+                    (chat_id, count - 1)).fetchone()
+                last = messages[count - 1]
+                if last.get("role") == role and last.get("content") == content:
+                    # Same history plus new messages
+                    self._insert(chat_id, count, messages[count:])
+                    return
+
+            self._db.execute("DELETE FROM messages WHERE chat_id = ?", (chat_id,))
+            self._insert(chat_id, 0, messages)
+
+
+    ### Search ###
+    def search(self, query: str, limit: int = 20) -> List[Dict]:
+        # Ranked (bm25) hits over user and assistant messages, each term must match
+        terms = [term.replace('"', '""') for term in query.split()]
+        if not terms:
+            return []
+        match = " ".join(f'"{term}"' for term in terms)
+
+        with self._lock:
+            rows = self._db.execute("""
+                SELECT m.chat_id, m.seq, m.role,
+                       snippet(messages_fts, 0, '[', ']', '…', 16),
+                       bm25(messages_fts) AS rank, c.meta
+                FROM messages_fts
+                JOIN messages m ON m.id = messages_fts.rowid
+                JOIN chats c ON c.id = m.chat_id
+                WHERE messages_fts MATCH ? AND m.role != 'system'
+                ORDER BY rank
+                LIMIT ?""", (match, limit)).fetchall()
+
+        return [
+            {
+                "chat_id": chat_id,
+                "title": json.loads(meta).get("title"),
+                "index": seq,
+                "role": role,
+                "snippet": snippet,
+                "score": round(-rank, 4),
+            }
+            for chat_id, seq, role, snippet, rank, meta in rows
+        ]
+
+
+    ### Internals ###
+    def _upsert_meta(self, meta: Dict) -> None:
+        self._db.execute(
+            "INSERT INTO chats (id, updated_at, meta) VALUES (?, ?, ?) "
+            "ON CONFLICT(id) DO UPDATE SET updated_at = excluded.updated_at, meta = excluded.meta",
+            (meta["id"], meta.get("updated_at", ""), json.dumps(meta, ensure_ascii=False)))
+
+
+    def _next_seq(self, chat_id: str) -> int:
+        row = self._db.execute("SELECT MAX(seq) FROM messages WHERE chat_id = ?", (chat_id,)).fetchone()
+        return 0 if row[0] is None else row[0] + 1
+
+
+    def _insert(self, chat_id: str, start: int, messages: List[Dict]) -> None:
+        self._db.executemany(
+            "INSERT INTO messages (chat_id, seq, role, content) VALUES (?, ?, ?, ?)",
+            [(chat_id, start + i, m.get("role", ""), m.get("content", "")) for i, m in enumerate(messages)])
+
+
+def open_chat_storage(kind: str, chats_dir: str, db_path: str):
+    # Picks the backend named by CHAT_STORAGE
+    if kind == "sqlite":
+        return SqliteChatStorage(db_path)
+    if kind == "jsonl":
+        return JsonlChatStorage(chats_dir)
+    raise ValueError(f"Unknown chat storage: {kind}")
+
+
+def migrate_to_sqlite(chats_dir: str, db_path: str) -> int:
+    # One-shot copy of the per-directory chats into the SQLite backend, returns the number copied
+    source = JsonlChatStorage(chats_dir)
+    target = SqliteChatStorage(db_path)
+    copied = 0
+    for meta in source.list_metas():
+        chat_id = meta["id"]
+        if target.exists(chat_id):
+            continue
+        messages = source.read_messages(chat_id)
+        if messages is None:
+            continue
+        target.create(meta, messages)
+        copied += 1
+    return copied
@@ -0,0 +1,301 @@
+import asyncio
+from response_filter import ResponseFilter
+
+
+def from_prompt_to_title(prompt: str, max_words: int = 5) -> str:
+    # Forms a chat title from first 5 words of the initial prompt
+    words = prompt.strip().split()
+    return " ".join(words[:max_words])
+
+
+### PROMPT ASSEMBLY ###
+class PromptBuilder:
+    ''' Turns the stored history and the new prompt into the messages sent to the model
+
+    The store is passed along for builders that keep state with the chat (summaries) '''
+
+    def build(self, history, prompt, store=None):
+        return list(history) + [{"role": "user", "content": prompt}]
+
+    async def abuild(self, history, prompt, store=None):
+        return self.build(history, prompt, store)
+
+
+### PERSISTENCE ###
+class ChatStore:
+    def __init__(self, chat_manager, chat_id):
+        ''' Persists turns into a ChatManager chat and auto-titles new chats '''
+        self.chat_manager = chat_manager
+        self.chat_id = chat_id
+        # llama-server slot pinned for the running turn
+        self.slot = None
+
+    def load(self):
+        return self.chat_manager.get_messages(self.chat_id)
+
+    def load_summary(self):
+        return self.chat_manager.get_summary(self.chat_id)
+
+    def save_summary(self, summary):
+        self.chat_manager.set_summary(self.chat_id, summary)
+
+    def save_turn(self, history, prompt, content):
+        # Appends only the new exchange, the stored history isn't rewritten
+        self.chat_manager.append_messages(self.chat_id, [
+            {"role": "user", "content": prompt},
+            {"role": "assistant", "content": content},
+        ])
+        self._auto_title(prompt)
+
+    def _auto_title(self, prompt):
+        # If still titled as "New chat" or empty, rename based on first user prompt
+        try:
+            meta = self.chat_manager.get_meta(self.chat_id)
+            if (meta.get("title") or "").strip().lower() in ("new chat", ""):
+                title = from_prompt_to_title(prompt, max_words=5)
+                if title:
+                    self.chat_manager.rename_chat(self.chat_id, title)
+
+        except Exception as e:
+            print("Auto titling failed:", e)
+
+
+class ConversationStore:
+    def __init__(self, conversation):
+        ''' Persists turns into the single ConversationManager history '''
+        self.conversation = conversation
+        self.slot = None
+
+    def load(self):
+        return self.conversation.get()
+
+    def load_summary(self):
+        return self.conversation.get_summary()
+
+    def save_summary(self, summary):
+        self.conversation.set_summary(summary)
+
+    def save_turn(self, history, prompt, content):
+        self.conversation.append("user", prompt)
+        self.conversation.append("assistant", content)
+
+
+### PIPELINE ###
+class CompletionPipeline:
+    def __init__(self, transport, server=None, model_name=None, temperature=0.7,
+                prompt_builder=None, response_filter=ResponseFilter, slot_router=None, response_cache=None):
+        ''' One completion path for every frontend
+
+        Stages: prompt assembly (prompt_builder), transport (LLMTransport),
+        streaming post-processing (response_filter), persistence (a store
+        passed per turn) and speech (an optional SpeechPipeline per turn).
+
+        Args: transport: LLMTransport used for the request
+        server: LLMServerManager, started on demand when given
+        model_name (str) / temperature (float): request options
+        prompt_builder: PromptBuilder or compatible
+        response_filter: factory for the incremental cleaner
+        slot_router: SlotRouter pinning chats (stores with a chat_id) to server slots
+        response_cache: ResponseCache answering repeated prompts without the server '''
+        self.transport = transport
+        self.server = server
+        self.model_name = model_name
+        self.temperature = temperature
+        self.prompt_builder = prompt_builder or PromptBuilder()
+        self.response_filter = response_filter
+        self.slot_router = slot_router
+        self.response_cache = response_cache
+
+
+    def turn(self, prompt, store, speech=None):
+        # One prompt/reply exchange, iterate stream()/astream() to run it
+        return CompletionTurn(self, prompt, store, speech)
+
+
+    def run(self, prompt, store, speech=None):
+        # Runs a turn to completion and returns the cleaned reply
+        turn = self.turn(prompt, store, speech)
+        for _ in turn.stream():
+            pass
+        return turn.content
+
+
+    def payload(self, messages, slot=None):
+        payload = {
+            "model": self.model_name,
+            "messages": messages,
+            "temperature": float(self.temperature),
+        }
+        if self.slot_router is not None:
+            payload.update(self.slot_router.request_options(slot))
+        return payload
+
+
+    def cache_key(self, history, prompt):
+        # None when there is no cache or it doesn't apply to this request
+        if self.response_cache is None:
+            return None
+        return self.response_cache.key(self.model_name, self.temperature, history, prompt)
+
+
+    def acquire_server(self):
+        # Waits behind a loading model (starting it if stopped) and marks the request in flight
+        if self.server is not None:
+            self.server.acquire()
+
+
+    async def aacquire_server(self):
+        if self.server is not None:
+            await _acquire_in_thread(self.server.acquire, lambda _: self.server.release())
+
+
+    def release_server(self):
+        if self.server is not None:
+            self.server.release()
+
+
+    def acquire_slot(self, store):
+        # Same slot for every turn of a chat, so llama-server can reuse the cached prompt prefix
+        chat_id = getattr(store, "chat_id", None)
+        if self.slot_router is not None and chat_id is not None:
+            store.slot = self.slot_router.acquire(chat_id)
+        return store.slot
+
+
+    async def aacquire_slot(self, store):
+        # Saving and restoring slot state is HTTP, keep it off the event loop
+        if self.slot_router is not None and getattr(store, "chat_id", None) is not None:
+            store.slot = await _acquire_in_thread(lambda: self.slot_router.acquire(store.chat_id),
+                                                  self.slot_router.release)
+        return store.slot
+
+
+    def release_slot(self, store):
+        if self.slot_router is not None:
+            self.slot_router.release(store.slot)
+        store.slot = None
+
+
+async def _acquire_in_thread(acquire, release):
+    # Runs a blocking acquire in a thread; if the caller is cancelled the thread
+    # still finishes, so whatever it got is released once it returns
+    future = asyncio.ensure_future(asyncio.to_thread(acquire))
+    try:
+        return await asyncio.shield(future)
+    except asyncio.CancelledError:
+        future.add_done_callback(lambda f: f.cancelled() or f.exception() or release(f.result()))
+        raise
+
+
+class CompletionTurn:
+    def __init__(self, pipeline, prompt, store, speech):
+        self.pipeline = pipeline
+        self.prompt = prompt
+        self.store = store
+        self.speech = speech
+        self.content = None
+        self._filter = pipeline.response_filter()
+        self._cache_key = None
+
+
+    def stream(self):
+        # Yields cleaned deltas; the reply is persisted once the stream ends
+        history = self.store.load()
+        cached = self._lookup(history)
+        if cached is not None:
+            yield self._replay(history, cached)
+            return
+
+        self.pipeline.acquire_server()
+        try:
+            slot = self.pipeline.acquire_slot(self.store)
+            messages = self.pipeline.prompt_builder.build(history, self.prompt, self.store)
+            for delta in self.pipeline.transport.stream_chat_completion(self.pipeline.payload(messages, slot)):
+                text = self._feed(delta)
+                if text:
+                    yield text
+            tail = self._finish(history)
+            if tail:
+                yield tail
+        except BaseException:
+            self._cancel()
+            raise
+        finally:
+            self.pipeline.release_slot(self.store)
+            self.pipeline.release_server()
+
+
+    async def astream(self):
+        # Chat storage and the response cache are file I/O, they run off the event loop
+        history = await asyncio.to_thread(self.store.load)
+        cached = await asyncio.to_thread(self._lookup, history)
+        if cached is not None:
+            yield await asyncio.to_thread(self._replay, history, cached)
+            return
+
+        await self.pipeline.aacquire_server()
+        try:
+            slot = await self.pipeline.aacquire_slot(self.store)
+            messages = await self.pipeline.prompt_builder.abuild(history, self.prompt, self.store)
+            async for delta in self.pipeline.transport.astream_chat_completion(self.pipeline.payload(messages, slot)):
+                text = self._feed(delta)
+                if text:
+                    yield text
+            tail = await asyncio.to_thread(self._finish, history)
+            if tail:
+                yield tail
+        except BaseException:
+            self._cancel()
+            raise
+        finally:
+            self.pipeline.release_slot(self.store)
+            self.pipeline.release_server()
+
+
+    def _lookup(self, history):
+        # Checked before the server is touched, a hit doesn't even start it
+        self._cache_key = self.pipeline.cache_key(history, self.prompt)
+        if self._cache_key is None:
+            return None
+        return self.pipeline.response_cache.get(self._cache_key)
+
+
+    def _replay(self, history, content):
+        # Cached replies are stored cleaned, so they skip the filter
+        try:
+            if self.speech:
+                self.speech.feed(content)
+                self.speech.finish()
+            self.content = content
+            self.store.save_turn(history, self.prompt, content)
+        except BaseException:
+            self._cancel()
+            raise
+        return content
+
+
+    def _feed(self, delta):
+        # <think> blocks and markdown are dropped chunk by chunk, speech starts with the first sentence
+        text = self._filter.feed(delta)
+        if text and self.speech:
+            self.speech.feed(text)
+        return text
+
+
+    def _finish(self, history):
+        tail = self._filter.finish()
+        if self.speech:
+            if tail:
+                self.speech.feed(tail)
+            self.speech.finish()
+
+        self.content = self._filter.text()
+        self.store.save_turn(history, self.prompt, self.content)
+        if self._cache_key is not None:
+            self.pipeline.response_cache.put(self._cache_key, self.content)
+        return tail
+
+
+    def _cancel(self):
+        if self.speech:
+            self.speech.cancel()
@@ -8,22 +8,74 @@ AUTO_SHUTDOWN = 600
 CHAT_HISTORY_FILE = "/tmp/assistant_history.json"
 DATA_DIR = os.path.expanduser("~/.local/share/ai-assistant")
 CHATS_DIR = os.path.join(DATA_DIR, "chats")
+CHAT_STORAGE = "jsonl"        # "jsonl" (one directory per chat) or "sqlite" (CHATS_DB, with search)
+CHATS_DB = os.path.join(DATA_DIR, "chats.db")
+CHAT_CACHE_SIZE = 32          # Recently used chats kept parsed in memory by the web bridge
 SYSTEM_PROMPT = "You are a concise and friendly AI assistant that gives answers without emojis."
 
 ### AUDIO SETTINGS ###
 WHISPER_MODEL = "large-v3"
+WHISPER_FAST_MODEL = ""       # Small model for short commands, e.g. "small.en" ("" = WHISPER_MODEL for everything)
+WHISPER_TIER_SECONDS = 4.0    # Utterances up to this long go to WHISPER_FAST_MODEL
+WHISPER_THREADS = 16          # CPU threads for Whisper, split between STT_WORKERS
+WHISPER_COMPUTE_TYPE = "int8"
+STT_WORKERS = 1               # Transcriptions that run at once (Whisper workers in the web bridge)
+STT_QUEUE_SIZE = 4            # Transcriptions that may wait before new ones are refused
+PRELOAD_AUDIO_MODELS = True   # Load Whisper and Piper in the background at startup instead of on first use
 SAMPLE_RATE = 48000
 PIPER_SAMPLE_RATE = 22050
 CHANNELS = 1
 RECORD_TIMEOUT = 1.0
+MAX_RECORD_SECONDS = 120
+CAPTURE_16K = False           # Record mono at 16 kHz directly, skips resampling if the device supports it
+PREROLL_SECONDS = 0.5         # Audio from just before recording starts that is kept (0 disables)
+STREAMING_STT = True          # Transcribe finished segments while still recording
+VAD_ENERGY_THRESHOLD = 0.01   # RMS level that counts as speech
+VAD_SEGMENT_SILENCE = 0.5     # Seconds of silence that close a segment
+MAX_SEGMENT_SECONDS = 20
+ENDPOINTING = False           # Stop recording automatically after trailing silence
+ENDPOINT_SILENCE = 1.0        # Seconds of silence that end an utterance
 PIPER_MODEL = os.path.expanduser("~/Documents/GitHub/AI-Assistant/TTS/models/en_US-alexa-medium/alexa.onnx")
 PIPER_CONFIG = os.path.expanduser("~/Documents/GitHub/AI-Assistant/TTS/models/en_US-alexa-medium/alexa.onnx.json")
+TTS_OUTPUT = "sounddevice"   # "sounddevice" plays in-process, "ffplay" is the fallback
+TTS_VOLUME = 1.0
+TTS_CACHE_DIR = os.path.join(DATA_DIR, "tts_cache")   # Spoken phrases kept as raw PCM
+TTS_CACHE_MB = 64             # Size cap of the speech cache (0 disables)
+TTS_WORKERS = 1               # Sentences Piper synthesizes at once
+REPLACE_SPEECH = False        # A new reply cuts off the one being spoken instead of queueing behind it
+BARGE_IN = False              # Talking over a spoken reply stops it (headsets only, speakers would trigger it themselves)
+BARGE_IN_THRESHOLD = 0.05     # RMS level that counts as the user talking during playback
+BARGE_IN_MIN_SPEECH = 0.3     # Seconds of continuous speech that stop playback
 
 ### LLM SERVER SETTINGS ###
 LLM_SERVER_BIN = os.path.expanduser("~/Documents/GitHub/llama.cpp/build/bin/llama-server")
 LLM_MODEL_PATH = os.path.expanduser("~/Documents/GitHub/llama.cpp/models/Qwen3.5-35B-A3B-UD-Q6_K_XL.gguf")
 LLM_PID_FILE = "/tmp/llm_server.pid"
 TEMPERATURE = 0.7
+LLM_CONNECT_TIMEOUT = 5.0     # Seconds to open a connection to llama-server
+LLM_READ_TIMEOUT = 300.0      # Seconds to wait for a reply
+LLM_RETRIES = 2               # Extra attempts when a connection is refused or reset
+LLM_POOL_SIZE = 8             # Kept-alive connections to llama-server
+LLM_PARALLEL = 2              # Generations llama-server runs at once (--parallel slots)
+LLM_CONTEXT_SIZE = 0          # Context tokens per slot, llama-server gets -c LLM_CONTEXT_SIZE * LLM_PARALLEL (0 = model default, split between slots)
+LLM_QUEUE_SIZE = 16           # Requests that may wait for a free slot
+LLM_PRELOAD = False           # Load the model in the background when the web bridge starts
+LLM_LOAD_TIMEOUT = 120        # Seconds a model load may take before requests give up
+LLM_SLOT_SAVE_DIR = os.path.join(DATA_DIR, "slots")   # KV caches of cold chats ("" disables)
+LLM_PROBE_INTERVAL = 10       # Seconds between /health probes of a running server
+CONTEXT_TOKEN_BUDGET = 6144   # Prompt tokens per request, older turns get summarized (0 = send everything)
+                              # With LLM_CONTEXT_SIZE set, leave room for the reply (reasoning models think inside it too)
+CONTEXT_KEEP_RATIO = 0.6      # Share of the budget kept for recent turns after summarizing
+CONTEXT_SUMMARY_TOKENS = 400  # Length limit of the rolling summary
+RESPONSE_CACHE = False        # Answer exact repeats of a prompt from disk instead of the model
+RESPONSE_CACHE_MODE = "history"   # "history" matches the whole chat, "last_turn" only the new prompt
+RESPONSE_CACHE_FORCE = False  # Also cache when TEMPERATURE > 0
+RESPONSE_CACHE_MAX_ENTRIES = 500
+RESPONSE_CACHE_TTL = 604800   # Seconds a cached reply stays valid (0 = forever)
+RESPONSE_CACHE_DIR = os.path.join(DATA_DIR, "response_cache")
+
+### WEB BRIDGE SETTINGS ###
+HEALTH_INTERVAL = 2.0         # Seconds between health checks broadcast on /ws
 
 ### LOCAL SETTINGS FILE PATH ###
 SETTINGS_FILE_PATH = os.path.join(DATA_DIR, "settings.json")
\ No newline at end of file
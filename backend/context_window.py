@@ -0,0 +1,169 @@
+import hashlib, threading, asyncio
+from collections import OrderedDict
+from completion_pipeline import PromptBuilder
+from response_filter import clean_response
+
+
+SUMMARY_PROMPT = (
+    "Summarize the conversation below for your own memory. Keep names, facts, decisions, "
+    "open questions and user preferences. Write plain sentences, no lists, no preamble."
+)
+
+
+### TOKEN COUNTING ###
+class TokenCounter:
+    def __init__(self, transport, cache_size=4096, per_message_overhead=4):
+        ''' Counts tokens with llama-server's /tokenize, caching results by text
+
+        Args: transport: LLMTransport of the running server
+        cache_size (int): texts remembered
+        per_message_overhead (int): chat template tokens added around each message '''
+        self.transport = transport
+        self.cache_size = cache_size
+        self.per_message_overhead = per_message_overhead
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+
+
+    def count(self, text):
+        key = hashlib.sha1(text.encode("utf-8")).digest()
+        with self._lock:
+            if key in self._cache:
+                self._cache.move_to_end(key)
+                return self._cache[key]
+
+        try:
+            tokens = len(self.transport.post("/tokenize", {"content": text}, timeout=30).json()["tokens"])
+        except Exception as e:
+            # Rough estimate, not cached so the real count replaces it once the server answers
+            print(f">> Token count failed ({e}), estimating.")
+            return len(text) // 3 + 1
+
+        with self._lock:
+            self._cache[key] = tokens
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return tokens
+
+
+    def count_message(self, message):
+        return self.count(message.get("content") or "") + self.per_message_overhead
+
+
+### CONTEXT ASSEMBLY ###
+class ContextWindowBuilder(PromptBuilder):
+    def __init__(self, transport, model_name, budget=6144, keep_ratio=0.6, summary_tokens=400, counter=None):
+        ''' Fits the history into a token budget, folding older turns into a rolling summary
+
+        The system prompt, the summary and the new prompt are always sent. Recent
+        turns fill the rest of the budget. When they no longer fit, the turns that
+        fall out are summarized together with the previous summary and the recent
+        part is cut down to keep_ratio of the budget, so the summary is updated every
+        few turns instead of on every one. Summaries are saved through the store.
+
+        Args: transport: LLMTransport used for /tokenize and the summary requests
+        model_name (str): model for the summary requests
+        budget (int): prompt tokens per request, 0 sends the full history
+        keep_ratio (float): share of the budget left to recent turns after a summary
+        summary_tokens (int): length limit of a summary
+        counter: TokenCounter, created from the transport if not given '''
+        self.transport = transport
+        self.model_name = model_name
+        self.budget = budget
+        self.keep_ratio = keep_ratio
+        self.summary_tokens = summary_tokens
+        self.counter = counter or TokenCounter(transport)
+
+
+    def build(self, history, prompt, store=None):
+        if not self.budget:
+            return super().build(history, prompt, store)
+
+        system = list(history[:1]) if history and history[0].get("role") == "system" else []
+        turns = list(history[len(system):])
+        user_message = {"role": "user", "content": prompt}
+
+        # A summary past the end of the history belongs to messages that were cleared
+        summary = store.load_summary() if store is not None else None
+        if summary and summary.get("upto", 0) > len(turns):
+            summary = None
+        upto = summary["upto"] if summary else 0
+
+        fixed = sum(self.counter.count_message(m) for m in system + [user_message])
+        recent = turns[upto:]
+        if fixed + self._summary_cost(summary) + self._cost(recent) <= self.budget:
+            return self._assemble(system, summary, recent, user_message)
+
+        # Overflow: keep the newest turns within keep_ratio of the budget, starting at a user message
+        target = self.budget * self.keep_ratio - fixed - self.summary_tokens
+        cut, used = len(turns), 0
+        while cut > upto:
+            cost = self.counter.count_message(turns[cut - 1])
+            if used + cost > target:
+                break
+            used += cost
+            cut -= 1
+        while cut < len(turns) and turns[cut].get("role") != "user":
+            cut += 1
+
+        if cut > upto:
+            try:
+                summary = self._summarize(summary, turns[upto:cut], cut, getattr(store, "slot", None))
+            except Exception as e:
+                # Better an oversized prompt than a lost turn
+                print(f">> Summarizing the conversation failed due to: {e}")
+                return self._assemble(system, summary, recent, user_message)
+            if store is not None:
+                store.save_summary(summary)
+
+        return self._assemble(system, summary, turns[cut:], user_message)
+
+
+    async def abuild(self, history, prompt, store=None):
+        # Token counts and summaries are HTTP calls, keep them off the event loop
+        return await asyncio.to_thread(self.build, history, prompt, store)
+
+
+    def _cost(self, messages):
+        return sum(self.counter.count_message(m) for m in messages)
+
+
+    def _summary_cost(self, summary):
+        return self.counter.count_message(self._summary_message(summary)) if summary else 0
+
+
+    def _summary_message(self, summary):
+        return {"role": "system", "content": f"Summary of the earlier conversation: {summary['text']}"}
+
+
+    def _assemble(self, system, summary, recent, user_message):
+        summary_part = [self._summary_message(summary)] if summary else []
+        return system + summary_part + list(recent) + [user_message]
+
+
+    def _summarize(self, summary, messages, upto, slot=None):
+        # Previous summary plus the turns that fall out of the window become the new summary
+        print(f">> Folding {len(messages)} older messages into the conversation summary...")
+        transcript = "\n".join(f"{m.get('role')}: {m.get('content')}" for m in messages)
+        if summary:
+            transcript = f"Earlier summary: {summary['text']}\n\n{transcript}"
+
+        payload = {
+            "model": self.model_name,
+            "messages": [
+                {"role": "system", "content": SUMMARY_PROMPT},
+                {"role": "user", "content": transcript},
+            ],
+            "temperature": 0.2,
+            "max_tokens": self.summary_tokens,
+            # Thinking would eat the whole token limit of a summary
+            "chat_template_kwargs": {"enable_thinking": False},
+        }
+        if slot is not None:
+            # The chat's own slot, its cached prefix changes with the new summary anyway
+            payload["id_slot"] = slot
+        data = self.transport.chat_completion(payload)
+        text = clean_response(data["choices"][0]["message"]["content"] or "")
+        if not text:
+            raise ValueError("model returned an empty summary")
+        return {"text": text, "upto": upto}
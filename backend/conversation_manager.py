@@ -4,7 +4,10 @@ class ConversationManager:
     # Handle everything related to chat history
     def __init__(self, history_path):
         self.history_path = history_path
+        # Metadata next to the history file, holds the rolling summary like a chat's meta.json
+        self.meta_path = os.path.splitext(history_path)[0] + ".meta.json"
         self.history = self._load_history()
+        self.meta = self._load_meta()
 
     def _load_history(self):
         # Load conversation history from the file
@@ -17,10 +20,31 @@ class ConversationManager:
                 {"role": "system", "content": "You are a concise and friendly AI assistant that gives answers without emojis."}
             ]
 
+    def _load_meta(self):
+        if os.path.exists(self.meta_path):
+            try:
+                with open(self.meta_path) as f:
+                    return json.load(f)
+            except ValueError as e:
+                print(f">> Unreadable {self.meta_path}: {e}")
+        return {}
+
     def save(self):
         with open(self.history_path, "w") as f:
             json.dump(self.history, f)
 
+    def save_meta(self):
+        with open(self.meta_path, "w") as f:
+            json.dump(self.meta, f)
+
+    def get_summary(self):
+        # Rolling summary of older turns, {"text", "upto"} as in ChatManager
+        return self.meta.get("context_summary")
+
+    def set_summary(self, summary):
+        self.meta["context_summary"] = summary
+        self.save_meta()
+
     def append(self, role, content):
         self.history.append({"role": role, "content": content.strip()})
         self.save()
@@ -31,6 +55,9 @@ class ConversationManager:
         else:
             self.history = []
         self.save()
+        # The summary covered messages that are gone now
+        if self.meta.pop("context_summary", None) is not None:
+            self.save_meta()
 
     def get(self):
         return self.history
\ No newline at end of file
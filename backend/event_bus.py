@@ -0,0 +1,73 @@
+import asyncio, threading
+
+
+class EventBus:
+    def __init__(self, max_queue=256, sticky=("health", "audio", "activity", "server")):
+        ''' Fans events out to WebSocket subscribers
+
+        publish() may be called from any thread, delivery happens on the event
+        loop. The latest event of each sticky type is replayed to new subscribers
+        so they start from the current state instead of waiting for a change.
+
+        Args: max_queue (int): events buffered per subscriber, a slow one loses the oldest
+        sticky: event types that describe state rather than progress '''
+        self.max_queue = max_queue
+        self.sticky = set(sticky)
+        self.loop = None
+        self._subscribers = set()
+        self._last = {}
+        self._lock = threading.Lock()
+
+
+    def attach(self, loop):
+        # Events published before this are only kept when sticky
+        self.loop = loop
+
+
+    ### PUBLISHING ###
+    def publish(self, type, **data):
+        event = {"type": type, **data}
+        if type in self.sticky:
+            with self._lock:
+                self._last[type] = event
+
+        loop = self.loop
+        if loop is None or loop.is_closed():
+            return
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is loop:
+            self._deliver(event)
+        else:
+            loop.call_soon_threadsafe(self._deliver, event)
+
+
+    def _deliver(self, event):
+        for queue in list(self._subscribers):
+            if queue.full():
+                # Progress events are cheap to lose, the sticky state comes again
+                queue.get_nowait()
+            queue.put_nowait(event)
+
+
+    ### SUBSCRIBING ###
+    def subscribe(self):
+        # Called on the event loop; returns a queue primed with the current state
+        queue = asyncio.Queue(self.max_queue)
+        with self._lock:
+            snapshot = list(self._last.values())
+        for event in snapshot:
+            queue.put_nowait(event)
+        self._subscribers.add(queue)
+        return queue
+
+
+    def unsubscribe(self, queue):
+        self._subscribers.discard(queue)
+
+
+    @property
+    def subscribers(self):
+        return len(self._subscribers)
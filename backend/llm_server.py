@@ -2,96 +2,415 @@ import time
 import os
 import subprocess
 import signal
-import requests
+import threading
+from llm_transport import LLMTransport
 
 class LLMServerManager:
-    def __init__(self, bin_path, model_path, port, pid_file, auto_shutdown):
+    def __init__(self, bin_path, model_path, port, pid_file, auto_shutdown, transport=None, parallel=1,
+                load_timeout=120, drain_timeout=30, slot_save_path=None, probe_interval=10, context_size=0,
+                unhealthy_after=3):
         self.bin_path = bin_path
         self.model_path = model_path
         self.port = port
         self.pid_file = pid_file
         self.auto_shutdown = auto_shutdown
         self.last_query_time = time.time()
+        # Number of slots, each one serves a generation concurrently
+        self.parallel = parallel
+        # Per slot, llama-server divides -c between its slots
+        self.context_size = context_size
+        self.load_timeout = load_timeout
+        self.drain_timeout = drain_timeout
+        # Directory where llama-server may save and restore slot KV caches
+        self.slot_save_path = slot_save_path
+        # Pooled HTTP client shared by everything that talks to this server
+        self.transport = transport or LLMTransport(port)
+
+        # Lifecycle: stopped -> loading -> ready -> draining -> stopped
+        # ready <-> unhealthy while the process runs but /health fails
+        self.state = "stopped"
+        self.error = None
+        self._cond = threading.Condition()
+        self._process = None
+        self._in_flight = 0
+        self._load_started = None
+        self._load_failures = 0
+        self._health_checks = 0
+        self._last_health = None
+        # Bumped on every load, whatever the slots held before is gone
+        self.starts = 0
+        # Called with the new state on every transition, must not block
+        self.on_state = None
+
+        # Liveness is tracked, not looked up: set when a process is started or adopted,
+        # cleared by the exit watcher (own child) or the probe (adopted from the PID file)
+        self.probe_interval = probe_interval
+        self.unhealthy_after = unhealthy_after
+        self._alive = False
+        self._adopted_pid = None
+        self._last_probe = None
+        self._failed_probes = 0
+        self._reconcile_pid_file()
+        threading.Thread(target=self._probe_loop, daemon=True).start()
 
 
     ### SERVER LISTENER ###
     def is_running(self):
-        if not os.path.exists(self.pid_file):
-            return False
+        # Cached, kept up to date by the exit watcher and the probe
+        return self._alive
+
+
+    @property
+    def pid(self):
+        if self._process is not None:
+            return self._process.pid
+        return self._adopted_pid
 
-        # Checks if the server is still running on the background
+
+    def _reconcile_pid_file(self):
+        # Only at startup and before spawning: a server left by an earlier run or another frontend is adopted
         try:
             with open(self.pid_file) as f:
                 pid = int(f.read().strip())
-                os.kill(pid, 0)
-                return True
-        except:
+        except (OSError, ValueError):
+            return False
+
+        if self._is_llama_server(pid):
+            self._adopted_pid = pid
+            self._alive = True
+            print(f">> Found a running LLM server with PID: {pid}")
+            return True
+
+        # Dead, or the PID now belongs to an unrelated process
+        print(">> PID file stale. Cleaning up...")
+        self._remove_pid_file()
+        return False
+
+
+    def _is_llama_server(self, pid):
+        try:
+            os.kill(pid, 0)
+        except OSError:
             return False
+        # A reused PID runs some other program, checked where /proc is available
+        try:
+            with open(f"/proc/{pid}/cmdline", "rb") as f:
+                return os.path.basename(self.bin_path).encode() in f.read()
+        except OSError:
+            return True
+
+
+    def _remove_pid_file(self):
+        try:
+            os.remove(self.pid_file)
+        except OSError:
+            pass
+
+
+    def _watch_exit(self, process):
+        # Blocks until the child exits, however it exits
+        code = process.wait()
+        with self._cond:
+            if self._process is not process:
+                return
+            self._process = None
+            self._alive = False
+            self._remove_pid_file()
+            if self.state in ("loading", "ready", "unhealthy"):
+                # Crashed or killed from outside, stop() would have set draining first
+                self.error = f"LLM server exited with code {code}"
+                print(f">> {self.error}.")
+                if self.state == "loading":
+                    self._load_failures += 1
+                self._set_state("stopped")
+            self._cond.notify_all()
+
+
+    def _probe_loop(self):
+        # Periodic /health while a server is up; adopted processes can't be waited on, so they are checked here too
+        while True:
+            time.sleep(self.probe_interval)
+            if not self._alive or self.state == "loading":
+                continue
+
+            adopted = self._adopted_pid
+            if adopted is not None and self._process is None and not self._is_llama_server(adopted):
+                with self._cond:
+                    if self._adopted_pid == adopted:
+                        print(f">> LLM server with PID {adopted} is gone.")
+                        self._adopted_pid = None
+                        self._alive = False
+                        self._remove_pid_file()
+                        if self.state in ("loading", "ready", "unhealthy"):
+                            self.error = "LLM server exited"
+                            self._set_state("stopped")
+                        self._cond.notify_all()
+                continue
+
+            status = self.transport.health(timeout=2)
+            with self._cond:
+                self._last_health = status
+                self._last_probe = time.time()
+                if status == 200:
+                    self._failed_probes = 0
+                    if self.state == "unhealthy":
+                        print(">> LLM server is answering again.")
+                        self.error = None
+                        self._set_state("ready")
+                        self._cond.notify_all()
+                    continue
+
+                self._failed_probes += 1
+                if self.state == "ready" and self._failed_probes >= self.unhealthy_after:
+                    # Hung: the process is up but requests would only time out, so new ones are refused
+                    self.error = f"LLM server isn't answering /health (last status: {status})"
+                    print(f">> {self.error}.")
+                    self._set_state("unhealthy")
+                    self._cond.notify_all()
+
+
+    def status(self):
+        # Lifecycle state and load progress for /api/health
+        with self._cond:
+            loading_seconds = None
+            if self.state == "loading" and self._load_started:
+                loading_seconds = round(time.time() - self._load_started, 1)
+            return {
+                "state": self.state,
+                "loading_seconds": loading_seconds,
+                "health_checks": self._health_checks,
+                "last_health": self._last_health,
+                "in_flight": self._in_flight,
+                "error": self.error,
+                "pid": self.pid,
+                "alive": self._alive,
+                "last_probe": self._last_probe,
+            }
+
 
-    
     ### START THE SERVER ###
-    def start(self):
-        if self.is_running():
-            print(">> LLM server is already running.")
-            return
+    def start(self, wait=True):
+        # Begins loading in the background, wait=False returns right away (preload)
+        with self._cond:
+            if self.state == "ready":
+                print(">> LLM server is already running.")
+                return True
+            if self.state == "stopped":
+                self._begin_loading()
+                if self.state == "stopped":
+                    # The process couldn't even be spawned
+                    return False
 
-        # Start the LLM server as a bg process
-        print(">> LLM server starting. Loading model to VRAM...")
-        process = subprocess.Popen([
-            self.bin_path,
-            "-m", self.model_path,
-            "-t", "16",
-            "-ngl", "999",
-            "--port", str(self.port)
-        ])
-
-        # Bookmarks the bg process
-        with open(self.pid_file, "w") as f:
-            f.write(str(process.pid))
-        time.sleep(2)
-        print(">> LLM server started with PID:", process.pid)
-
-        # Wait for the model finish loading
-        for _ in range(60):
-            try:
-                # Remove prints?
-                r = requests.get(f"http://127.0.0.1:{self.port}/health", timeout=2)
-                if r.status_code == 200:
-                    print(">> LLM server ready to accept queries.")
-                    break
-            except Exception:
-                pass
-            time.sleep(1)
+        return self.wait_ready(self.load_timeout) if wait else False
+
+
+    def wait_ready(self, timeout=None):
+        # Blocks until the model is loaded, False on timeout or a failed load
+        deadline = None if timeout is None else time.time() + timeout
+        with self._cond:
+            failures = self._load_failures
+            while self.state != "ready":
+                if self._load_failures != failures:
+                    return False
+                remaining = None if deadline is None else deadline - time.time()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+            return True
+
+
+    def _begin_loading(self):
+        # Called with _cond held and state "stopped"
+        self._set_state("loading")
+        self.error = None
+        self._load_started = time.time()
+        self._health_checks = 0
+        self._last_health = None
+        self._failed_probes = 0
+        self.starts += 1
+
+        if self._process is not None and self._process.poll() is None:
+            # Our own child outlived an earlier load timeout, its handle is kept
+            print(">> LLM server process still running. Waiting for it to become ready...")
+        elif (self._alive and self._adopted_pid is not None) or self._reconcile_pid_file():
+            # Started earlier or by another frontend, only wait for readiness
+            self._process = None
+            print(">> LLM server process found. Waiting for it to become ready...")
         else:
-            print(">> LLM server did not respond within 60 seconds.")
+            # Start the LLM server as a bg process
+            print(">> LLM server starting. Loading model to VRAM...")
+            command = [
+                self.bin_path,
+                "-m", self.model_path,
+                "-t", "16",
+                "-ngl", "999",
+                "--port", str(self.port),
+                "--parallel", str(self.parallel)
+            ]
+            if self.context_size:
+                command += ["-c", str(self.context_size * self.parallel)]
+            try:
+                if self.slot_save_path:
+                    os.makedirs(self.slot_save_path, exist_ok=True)
+                    command += ["--slot-save-path", self.slot_save_path]
+                self._process = subprocess.Popen(command)
+            except OSError as e:
+                # Wrong LLM_SERVER_BIN and the like, fails every waiting request right away
+                self.error = f"LLM server could not be started: {e}"
+                print(f">> {self.error}.")
+                self._set_state("stopped")
+                self._load_failures += 1
+                self._cond.notify_all()
+                return
+            self._adopted_pid = None
+            self._alive = True
+
+            # Bookmarks the bg process for other frontends and the next run
+            try:
+                with open(self.pid_file, "w") as f:
+                    f.write(str(self._process.pid))
+            except OSError as e:
+                print(f">> Failed to write the PID file: {e}")
+            print(">> LLM server started with PID:", self._process.pid)
+            threading.Thread(target=self._watch_exit, args=(self._process,), daemon=True).start()
+
+        threading.Thread(target=self._watch_loading, args=(self._process,), daemon=True).start()
+        self._cond.notify_all()
+
+
+    def _watch_loading(self, process):
+        # Polls /health with backoff until the model is loaded (llama-server answers 503 meanwhile)
+        delay = 0.1
+        deadline = time.time() + self.load_timeout
+        while True:
+            if process is not None and process.poll() is not None:
+                return self._loading_failed(f"LLM server exited with code {process.returncode} while loading")
+
+            status = self.transport.health(timeout=2)
+            with self._cond:
+                if self.state != "loading":
+                    # Stopped while loading
+                    return
+                self._health_checks += 1
+                self._last_health = status
+                if status == 200:
+                    self._set_state("ready")
+                    self.last_query_time = time.time()
+                    self._cond.notify_all()
+                    print(f">> LLM server ready to accept queries ({time.time() - self._load_started:.1f}s).")
+                    return
+
+            if time.time() >= deadline:
+                return self._loading_failed(f"LLM server did not respond within {self.load_timeout} seconds")
+            time.sleep(delay)
+            delay = min(delay * 2, 2.0)
+
+
+    def _loading_failed(self, reason):
+        print(f">> {reason}.")
+        with self._cond:
+            if self.state == "loading":
+                self.error = reason
+                self._set_state("stopped")
+                self._load_failures += 1
+                self._cond.notify_all()
+
+
+    def _set_state(self, state):
+        # Called with _cond held
+        changed = state != self.state
+        self.state = state
+        if changed and self.on_state:
+            try:
+                self.on_state(state)
+            except Exception as e:
+                print(f">> LLM server state listener failed: {e}")
+
+
+    ### REQUEST TRACKING ###
+    def acquire(self, timeout=None):
+        # Waits until the server is ready (starting it if needed) and counts the request as in flight
+        # Every request waits here behind a single load instead of calling start() itself
+        timeout = self.load_timeout if timeout is None else timeout
+        deadline = time.time() + timeout
+        with self._cond:
+            failures = self._load_failures
+            while self.state != "ready":
+                if self._load_failures != failures:
+                    raise RuntimeError(self.error or "LLM server failed to start")
+                if self.state == "unhealthy":
+                    raise RuntimeError(self.error)
+                if self.state == "stopped":
+                    self._begin_loading()
+                    continue
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    raise TimeoutError("LLM server is still loading, try again shortly")
+                self._cond.wait(remaining)
+
+            self._in_flight += 1
+            self.last_query_time = time.time()
+
+
+    def release(self):
+        with self._cond:
+            self._in_flight -= 1
+            self.last_query_time = time.time()
+            self._cond.notify_all()
 
 
     ### STOP THE SERVER ###
     def stop(self, conversation=None):
-        # Safety checks and stops LLM server
-        if not self.is_running():
-            print(">> No LLM server running: No pid file found")
-            return
+        # Lets in-flight requests finish before the process is terminated
+        with self._cond:
+            if self.state in ("ready", "loading", "unhealthy"):
+                self._set_state("draining")
+                self._cond.notify_all()
+                deadline = time.time() + self.drain_timeout
+                while self._in_flight > 0 and time.time() < deadline:
+                    self._cond.wait(deadline - time.time())
+                if self._in_flight > 0:
+                    print(f">> Stopping with {self._in_flight} request(s) still running.")
 
         try:
-            with open(self.pid_file) as f:
-                pid = int(f.read().strip())
+            self._terminate()
+        finally:
+            with self._cond:
+                self._set_state("stopped")
+                self._process = None
+                self._adopted_pid = None
+                self._alive = False
+                self._cond.notify_all()
 
-            # For stale pid files
-            try:
-                os.kill(pid, 0)
-            except ProcessLookupError:
-                print(">>> PID file stale. Cleaning up...")
-                os.remove(self.pid_file)
-                return
-            
-            print(f">> Stopping LLM server with PID: {pid}")
-            os.kill(pid, signal.SIGTERM)
-            os.remove(self.pid_file)
+
+    def _terminate(self):
+        # Stops our own child through its handle, an adopted server by PID
+        process, pid = self._process, self._adopted_pid
+        if not self._alive or (process is None and pid is None):
+            print(">> No LLM server running.")
+            return
+
+        try:
+            if process is not None:
+                print(f">> Stopping LLM server with PID: {process.pid}")
+                process.terminate()
+                try:
+                    process.wait(timeout=10)
+                except subprocess.TimeoutExpired:
+                    print(">> LLM server ignored SIGTERM. Killing it...")
+                    process.kill()
+                    process.wait()
+            else:
+                print(f">> Stopping LLM server with PID: {pid}")
+                os.kill(pid, signal.SIGTERM)
             print(">> LLM server stopped. Reserved VRAM released.")
-        
+
+        except ProcessLookupError:
+            print(">> LLM server had already exited.")
         except Exception as e:
             print(f">> Failed to stop LLM server: {e}")
+        finally:
+            self._remove_pid_file()
 
 
     ### AUTO SHUTDOWN ###
@@ -99,7 +418,8 @@ class LLMServerManager:
         # Monitors idle time and shuts down the server automatically
         while True:
 
-            if self.is_running() and (time.time() - self.last_query_time > self.auto_shutdown):
+            idle = self._in_flight == 0 and (time.time() - self.last_query_time > self.auto_shutdown)
+            if self.is_running() and self.state != "loading" and idle:
                 print(">> LLM has been idle for too long. Shutting down the server...")
                 self.stop(conversation)
-            time.sleep(60)
\ No newline at end of file
+            time.sleep(60)
@@ -0,0 +1,147 @@
+import time, json, asyncio, requests, httpx
+from requests.adapters import HTTPAdapter
+
+
+def _sse_delta(raw_line):
+    ''' Parses one SSE line from /v1/chat/completions
+
+    Returns the content delta, "" for lines without content, or None at [DONE] '''
+    line = raw_line.decode("utf-8").strip() if isinstance(raw_line, bytes) else raw_line.strip()
+    if not line.startswith("data:"):
+        return ""
+    data = line[len("data:"):].strip()
+    if data == "[DONE]":
+        return None
+
+    choices = json.loads(data).get("choices") or []
+    if not choices:
+        return ""
+    return (choices[0].get("delta") or {}).get("content") or ""
+
+
+class LLMTransport:
+    def __init__(self, port, connect_timeout=5.0, read_timeout=300.0, retries=2, pool_size=8):
+        ''' Shared HTTP client for llama-server
+
+        Keeps connections alive in a pool, retries requests whose connection was
+        refused or reset before a response arrived, and streams completions
+        asynchronously for the FastAPI bridge.
+
+        Args: port (int): llama-server port on localhost
+        connect_timeout / read_timeout (float): seconds
+        retries (int): extra attempts after a connection error
+        pool_size (int): kept-alive connections '''
+        self.base_url = f"http://127.0.0.1:{port}"
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.retries = retries
+        self.pool_size = pool_size
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+
+        # Created on first use so it belongs to the event loop that awaits it
+        self._async_client = None
+
+
+    ### SYNC API ###
+    def chat_completion(self, payload, timeout=None):
+        # Full (non-streamed) completion, returns the decoded JSON body
+        response = self._request("POST", "/v1/chat/completions", json=payload, timeout=timeout)
+        response.raise_for_status()
+        return response.json()
+
+
+    def stream_chat_completion(self, payload, timeout=None):
+        # Yields content deltas as llama-server emits them
+        response = self._request("POST", "/v1/chat/completions", json={**payload, "stream": True},
+                                 timeout=timeout, stream=True)
+        with response:
+            response.raise_for_status()
+            for raw_line in response.iter_lines():
+                delta = _sse_delta(raw_line)
+                if delta is None:
+                    break
+                if delta:
+                    yield delta
+
+
+    def post(self, path, payload, timeout=None):
+        # Any other JSON endpoint (e.g. /tokenize), returns the response
+        response = self._request("POST", path, json=payload, timeout=timeout)
+        response.raise_for_status()
+        return response
+
+
+    def health(self, timeout=2.0):
+        # Status code of /health, None if the server can't be reached
+        try:
+            return self.session.get(f"{self.base_url}/health", timeout=timeout).status_code
+        except requests.RequestException:
+            return None
+
+
+    def _request(self, method, path, timeout=None, **kwargs):
+        timeout = (self.connect_timeout, timeout or self.read_timeout)
+        for attempt in range(self.retries + 1):
+            try:
+                return self.session.request(method, f"{self.base_url}{path}", timeout=timeout, **kwargs)
+            except requests.ConnectionError:
+                # Refused or reset before a response, safe to send again
+                if attempt == self.retries:
+                    raise
+                time.sleep(0.2 * 2 ** attempt)
+
+
+    ### ASYNC API ###
+    async def astream_chat_completion(self, payload, timeout=None):
+        client = self._client()
+        request = client.build_request("POST", "/v1/chat/completions", json={**payload, "stream": True},
+                                       timeout=self._async_timeout(timeout))
+        response = await self._asend(request, stream=True)
+        try:
+            response.raise_for_status()
+            async for line in response.aiter_lines():
+                delta = _sse_delta(line)
+                if delta is None:
+                    break
+                if delta:
+                    yield delta
+        finally:
+            await response.aclose()
+
+
+    async def aclose(self):
+        if self._async_client is not None:
+            await self._async_client.aclose()
+            self._async_client = None
+
+
+    def close(self):
+        self.session.close()
+
+
+    def _client(self):
+        if self._async_client is None:
+            self._async_client = httpx.AsyncClient(
+                base_url=self.base_url,
+                timeout=self._async_timeout(None),
+                limits=httpx.Limits(max_connections=self.pool_size,
+                                    max_keepalive_connections=self.pool_size))
+        return self._async_client
+
+
+    def _async_timeout(self, timeout):
+        return httpx.Timeout(timeout or self.read_timeout, connect=self.connect_timeout)
+
+
+    async def _asend(self, request, stream=False):
+        for attempt in range(self.retries + 1):
+            try:
+                return await self._client().send(request, stream=stream)
+            except (httpx.ConnectError, httpx.RemoteProtocolError):
+                # Refused, or a kept-alive connection was closed before a response
+                if attempt == self.retries:
+                    raise
+                await asyncio.sleep(0.2 * 2 ** attempt)
@@ -0,0 +1,16 @@
+import argparse
+
+import config
+from chat_storage import migrate_to_sqlite
+
+
+### One-shot migration of chats into the SQLite backend ###
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Copy chats from the directory layout into SQLite")
+    parser.add_argument("--chats-dir", default=config.CHATS_DIR)
+    parser.add_argument("--db", default=config.CHATS_DB)
+    args = parser.parse_args()
+
+    print(f">> Migrating chats from {args.chats_dir} to {args.db}...")
+    copied = migrate_to_sqlite(args.chats_dir, args.db)
+    print(f">> Migrated {copied} chat(s). Set CHAT_STORAGE = \"sqlite\" in config.py to use them.")
@@ -0,0 +1,79 @@
+import time, threading
+
+
+class LazyModel:
+    def __init__(self, name, load):
+        ''' Loads a model on first use or in the background, exactly once
+
+        Args: name (str): shown in logs and /api/health
+        load: callable returning the loaded model '''
+        self.name = name
+        self._load = load
+        self._model = None
+        self._state = "unloaded"       # unloaded -> loading -> ready / failed
+        self._error = None
+        self._seconds = None
+        self._cond = threading.Condition()
+
+
+    def get(self):
+        # Returns the model, loading it here if nobody has started yet and waiting if someone has
+        with self._cond:
+            while self._state == "loading":
+                self._cond.wait()
+            if self._state == "ready":
+                return self._model
+            self._state = "loading"
+
+        self._run_load()
+        with self._cond:
+            if self._state != "ready":
+                raise RuntimeError(f"{self.name} failed to load: {self._error}")
+            return self._model
+
+
+    def load_now(self):
+        # Warm-up: loads in the calling thread and only reports a failure, the next get() retries
+        try:
+            self.get()
+        except RuntimeError as e:
+            print(f">> {e}")
+
+
+    @property
+    def ready(self):
+        return self._state == "ready"
+
+
+    @property
+    def failed(self):
+        # The last load failed, get() would try again
+        return self._state == "failed"
+
+
+    def status(self):
+        with self._cond:
+            return {"name": self.name, "state": self._state, "seconds": self._seconds, "error": self._error}
+
+
+    def _run_load(self):
+        # Called with the state already set to "loading"
+        print(f">> Loading {self.name}...")
+        started = time.time()
+        try:
+            model = self._load()
+        except Exception as e:
+            print(f">> Loading {self.name} failed due to: {e}")
+            with self._cond:
+                self._state = "failed"
+                self._error = str(e)
+                self._cond.notify_all()
+            return
+
+        with self._cond:
+            self._model = model
+            self._state = "ready"
+            self._error = None
+            self._seconds = round(time.time() - started, 1)
+            self._cond.notify_all()
+        print(f">> {self.name} loaded ({self._seconds}s).")
@@ -0,0 +1,203 @@
+import time, asyncio, threading
+from concurrent.futures import ThreadPoolExecutor
+from collections import deque
+from contextlib import contextmanager, asynccontextmanager
+
+
+class QueueFull(Exception):
+    ''' Raised when the wait queue is already at its limit '''
+
+
+class Ticket:
+    def __init__(self, chat_id, loop=None):
+        ''' One queued generation, granted by the scheduler when a slot frees up '''
+        self.chat_id = chat_id
+        self.enqueued_at = time.time()
+        self.started_at = None
+        self._event = threading.Event()
+        self._loop = loop
+        self.future = loop.create_future() if loop else None
+
+
+    @property
+    def granted(self):
+        return self._event.is_set()
+
+
+    def _grant(self):
+        self.started_at = time.time()
+        self._event.set()
+        if self.future is not None:
+            self._loop.call_soon_threadsafe(self._resolve)
+
+
+    def _resolve(self):
+        if not self.future.done():
+            self.future.set_result(True)
+
+
+class GenerationScheduler:
+    def __init__(self, max_concurrent=1, max_queue=16):
+        ''' Bounded FIFO queue in front of llama-server's slots
+
+        Up to max_concurrent generations run at once (one per server slot) and
+        requests for the same chat run one after another. Usable from threads
+        (slot) and from the event loop (aslot).
+
+        Args: max_concurrent (int): parallel generations, match llama-server's --parallel
+        max_queue (int): waiting requests before new ones are refused '''
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self._lock = threading.Lock()
+        self._waiting = deque()
+        self._active = {}
+        self._recent_waits = deque(maxlen=50)
+
+
+    ### QUEUE OPERATIONS ###
+    def enqueue(self, chat_id, loop=None):
+        # Returns a ticket that is granted right away if a slot is free
+        with self._lock:
+            if len(self._waiting) >= self.max_queue:
+                raise QueueFull(f"{len(self._waiting)} requests are already waiting")
+            ticket = Ticket(chat_id, loop)
+            self._waiting.append(ticket)
+            self._dispatch()
+        return ticket
+
+
+    def release(self, ticket):
+        # Frees the ticket's slot, or drops it from the queue if it never started
+        with self._lock:
+            if ticket in self._waiting:
+                self._waiting.remove(ticket)
+            elif self._active.get(ticket.chat_id) is ticket:
+                del self._active[ticket.chat_id]
+            self._dispatch()
+
+
+    def position(self, ticket):
+        # 1-based place in the queue, 0 once the ticket is running
+        with self._lock:
+            for index, waiting in enumerate(self._waiting):
+                if waiting is ticket:
+                    return index + 1
+        return 0
+
+
+    def _dispatch(self):
+        # Grants waiting tickets in FIFO order, skipping chats that already generate
+        for ticket in list(self._waiting):
+            if len(self._active) >= self.max_concurrent:
+                break
+            if ticket.chat_id in self._active:
+                continue
+            self._waiting.remove(ticket)
+            self._active[ticket.chat_id] = ticket
+            self._recent_waits.append(time.time() - ticket.enqueued_at)
+            ticket._grant()
+
+
+    ### CONTEXT MANAGERS ###
+    @contextmanager
+    def slot(self, chat_id):
+        # Blocks the calling thread until the generation may start
+        ticket = self.enqueue(chat_id)
+        try:
+            ticket._event.wait()
+            yield ticket
+        finally:
+            self.release(ticket)
+
+
+    @asynccontextmanager
+    async def aslot(self, chat_id):
+        ticket = self.enqueue(chat_id, asyncio.get_running_loop())
+        try:
+            await ticket.future
+            yield ticket
+        finally:
+            self.release(ticket)
+
+
+    ### REPORTING ###
+    @property
+    def busy(self):
+        return bool(self._active)
+
+
+    def stats(self):
+        # Queue state for /api/health
+        now = time.time()
+        with self._lock:
+            waits = list(self._recent_waits)
+            return {
+                "max_concurrent": self.max_concurrent,
+                "max_queue": self.max_queue,
+                "active": len(self._active),
+                "waiting": len(self._waiting),
+                "queue": [
+                    {
+                        "chat_id": ticket.chat_id,
+                        "position": index + 1,
+                        "waited": round(now - ticket.enqueued_at, 2),
+                    }
+                    for index, ticket in enumerate(self._waiting)
+                ],
+                "avg_wait": round(sum(waits) / len(waits), 2) if waits else 0.0,
+            }
+
+
+class BoundedExecutor:
+    def __init__(self, name, workers=1, max_queue=4):
+        ''' Dedicated thread pool for one blocking resource (Whisper) with a cap on waiting jobs
+
+        Slow jobs stay off the web server's shared threadpool, so they can't starve
+        the light endpoints, and a burst is refused instead of piling up.
+
+        Args: name (str): thread name prefix and label in stats
+        workers (int): jobs that run at once
+        max_queue (int): jobs that may wait for a worker, QueueFull beyond that '''
+        self.name = name
+        self.workers = workers
+        self.max_queue = max_queue
+        self.completed = 0
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix=name)
+        self._lock = threading.Lock()
+        self._submitted = 0       # running + waiting
+
+
+    def submit(self, fn, *args):
+        with self._lock:
+            if self._submitted >= self.workers + self.max_queue:
+                raise QueueFull(f"{self._submitted - self.workers} {self.name} jobs are already waiting")
+            self._submitted += 1
+        future = self._executor.submit(fn, *args)
+        future.add_done_callback(self._done)
+        return future
+
+
+    async def run(self, fn, *args):
+        # Awaitable submit; if the caller goes away a running job still finishes
+        return await asyncio.wrap_future(self.submit(fn, *args))
+
+
+    def _done(self, future):
+        with self._lock:
+            self._submitted -= 1
+            self.completed += 1
+
+
+    def stats(self):
+        with self._lock:
+            return {
+                "workers": self.workers,
+                "max_queue": self.max_queue,
+                "running": min(self._submitted, self.workers),
+                "waiting": max(0, self._submitted - self.workers),
+                "completed": self.completed,
+            }
+
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
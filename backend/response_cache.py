@@ -0,0 +1,131 @@
+import os, json, time, hashlib, tempfile, threading
+from collections import OrderedDict
+
+
+class ResponseCache:
+    def __init__(self, cache_dir, enabled=False, mode="history", force=False, max_entries=500, ttl=7 * 24 * 3600):
+        ''' Exact-match cache of finished replies, one small JSON file per entry
+
+        Args: cache_dir (str): where entries are stored
+        enabled (bool): opt-in switch
+        mode (str): "history" keys on the whole conversation, "last_turn" only on the new prompt
+        force (bool): also cache when temperature > 0 (replies are random there, so off by default)
+        max_entries (int): least recently used entries are deleted beyond this
+        ttl (int): seconds an entry stays valid '''
+        self.cache_dir = cache_dir
+        self.enabled = enabled
+        self.mode = mode
+        self.force = force
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.bypassed = 0
+
+        self._lock = threading.Lock()
+        # key -> last use, least recently used first
+        self._index = OrderedDict()
+        os.makedirs(cache_dir, exist_ok=True)
+        entries = [(os.path.getmtime(self._path(name[:-5])), name[:-5])
+                   for name in os.listdir(cache_dir) if name.endswith(".json")]
+        for used, key in sorted(entries):
+            self._index[key] = used
+
+
+    ### KEYS ###
+    def key(self, model_name, temperature, history, prompt):
+        # None when the cache is off or the reply isn't deterministic enough to reuse
+        if not self.enabled:
+            return None
+        if float(temperature) > 0 and not self.force:
+            with self._lock:
+                self.bypassed += 1
+            return None
+
+        if self.mode == "last_turn":
+            # Stateless utility questions: only the prompt, case and spacing don't matter
+            material = {"prompt": " ".join(prompt.lower().split())}
+        else:
+            messages = [[m.get("role"), " ".join((m.get("content") or "").split())] for m in history]
+            material = {"messages": messages + [["user", " ".join(prompt.split())]]}
+
+        material.update(model=model_name, temperature=round(float(temperature), 3), mode=self.mode)
+        return hashlib.sha256(json.dumps(material, ensure_ascii=False, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+    ### LOOKUP ###
+    def get(self, key):
+        if key is None:
+            return None
+        path = self._path(key)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                entry = json.load(f)
+            response = entry["response"]
+            expired = self.ttl and time.time() - entry["created"] > self.ttl
+        except (OSError, ValueError, KeyError):
+            expired = True
+
+        if expired:
+            with self._lock:
+                self._drop(key)
+                self.misses += 1
+            return None
+
+        with self._lock:
+            self.hits += 1
+            if key in self._index:
+                self._index[key] = time.time()
+                self._index.move_to_end(key)
+        return response
+
+
+    def put(self, key, response):
+        # Best effort, the turn is already saved when this runs, so a disk error is only reported
+        if key is None or not response:
+            return
+        path = self._path(key)
+        tmp_path = None
+        try:
+            # Own temp file per writer, two turns may store the same key at once
+            fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix=".tmp")
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump({"response": response, "created": time.time()}, f, ensure_ascii=False)
+            os.replace(tmp_path, path)
+        except Exception as e:
+            print(f">> Caching the response failed due to: {e}")
+            if tmp_path and os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            return
+
+        with self._lock:
+            self._index[key] = time.time()
+            self._index.move_to_end(key)
+            while len(self._index) > self.max_entries:
+                self._drop(next(iter(self._index)))
+
+
+    def stats(self):
+        with self._lock:
+            return {
+                "enabled": self.enabled,
+                "mode": self.mode,
+                "entries": len(self._index),
+                "hits": self.hits,
+                "misses": self.misses,
+                "bypassed": self.bypassed,
+            }
+
+
+    ### INTERNALS ###
+    def _path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.json")
+
+
+    def _drop(self, key):
+        # Called with _lock held
+        self._index.pop(key, None)
+        try:
+            os.remove(self._path(key))
+        except OSError:
+            pass
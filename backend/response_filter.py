@@ -0,0 +1,103 @@
+THINK_OPEN = "<think>"
+THINK_CLOSE = "</think>"
+
+
+def clean_response(text: str) -> str:
+    ''' Removes <think> tags and unnecessary symbols from a complete reply '''
+    response_filter = ResponseFilter()
+    response_filter.feed(text or "")
+    response_filter.finish()
+    return response_filter.text()
+
+
+def _partial_suffix(text: str, token: str) -> int:
+    # Length of the longest tail of text that could be the start of token
+    for size in range(min(len(token) - 1, len(text)), 0, -1):
+        if text.endswith(token[:size]):
+            return size
+    return 0
+
+
+### INCREMENTAL RESPONSE CLEANING ###
+class ResponseFilter:
+    ''' Cleans a streamed reply chunk by chunk
+
+    Drops <think> blocks as soon as they are seen and strips the markdown
+    symbols that TTS and the UI don't want. Only the few characters that
+    could still turn into a tag or symbol are held back between chunks. '''
+
+    def __init__(self):
+        self._pending = ""          # Raw text that may still contain a partial tag
+        self._markdown_pending = "" # Visible text that may still contain a partial "###"/"---"
+        self._in_think = False
+        self._started = False       # Leading whitespace is stripped until the first real character
+        self._pieces = []
+
+
+    def feed(self, delta: str) -> str:
+        # Returns the newly visible, cleaned part of the reply
+        self._pending += delta
+        return self._emit(self._split_think(), final=False)
+
+
+    def finish(self) -> str:
+        # Flushes whatever was held back; an unterminated <think> block is dropped
+        visible = "" if self._in_think else self._pending
+        self._pending = ""
+        return self._emit(visible, final=True)
+
+
+    def text(self) -> str:
+        # Full cleaned reply emitted so far
+        return "".join(self._pieces).strip()
+
+
+    def _split_think(self) -> str:
+        visible = []
+        while self._pending:
+            if self._in_think:
+                end = self._pending.find(THINK_CLOSE)
+                if end == -1:
+                    # Keep only what could be the beginning of the closing tag
+                    hold = _partial_suffix(self._pending, THINK_CLOSE)
+                    self._pending = self._pending[len(self._pending) - hold:]
+                    break
+                self._pending = self._pending[end + len(THINK_CLOSE):]
+                self._in_think = False
+            else:
+                start = self._pending.find(THINK_OPEN)
+                if start == -1:
+                    hold = _partial_suffix(self._pending, THINK_OPEN)
+                    visible.append(self._pending[:len(self._pending) - hold])
+                    self._pending = self._pending[len(self._pending) - hold:]
+                    break
+                visible.append(self._pending[:start])
+                self._pending = self._pending[start + len(THINK_OPEN):]
+                self._in_think = True
+        return "".join(visible)
+
+
+    def _emit(self, visible: str, final: bool) -> str:
+        # Same cleanup order as the full-text version: asterisks, hashtags, dash lines
+        text = self._markdown_pending + visible.replace("*", "")
+        text = text.replace("###", "").replace("---", "")
+        self._markdown_pending = ""
+
+        if not final:
+            # Hold back a trailing "#"/"-" run that the next chunk could complete
+            hold = 0
+            while hold < 2 and hold < len(text) and text[-1 - hold] in "#-" and text[-1] == text[-1 - hold]:
+                hold += 1
+            if hold:
+                self._markdown_pending = text[-hold:]
+                text = text[:-hold]
+
+        if not self._started:
+            text = text.lstrip()
+            if not text:
+                return ""
+            self._started = True
+
+        if text:
+            self._pieces.append(text)
+        return text
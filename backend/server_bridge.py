@@ -1,14 +1,26 @@
-from fastapi import FastAPI, HTTPException, Body, Response, UploadFile, File
+from fastapi import FastAPI, HTTPException, Body, Response, UploadFile, File, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
+from fastapi.concurrency import run_in_threadpool
+from starlette.background import BackgroundTask
 from pydantic import BaseModel
 from typing import Any, Dict
-import threading, time, json
+import threading, asyncio, time, json
 
 import config
 from llm_server import LLMServerManager
+from llm_transport import LLMTransport
 from chat_manager import ChatManager
+from chat_storage import open_chat_storage
+from chat_cache import CachedChatStorage
 from settings_manager import SettingsManager
 from audio_manager import AudioManager
+from completion_pipeline import CompletionPipeline, ChatStore
+from context_window import ContextWindowBuilder
+from slot_router import SlotRouter
+from response_cache import ResponseCache
+from event_bus import EventBus
+from request_scheduler import GenerationScheduler, BoundedExecutor, QueueFull
 
 
 app = FastAPI(title="AI Assistant Bridge")
@@ -39,39 +51,89 @@ class SpeakToggleRequest(BaseModel):
 
 
 ### Shared backend objects ###
+transport = LLMTransport(
+    port = config.SERVER_PORT,
+    connect_timeout = config.LLM_CONNECT_TIMEOUT,
+    read_timeout = config.LLM_READ_TIMEOUT,
+    retries = config.LLM_RETRIES,
+    pool_size = config.LLM_POOL_SIZE
+)
+
 server = LLMServerManager(
     bin_path = config.LLM_SERVER_BIN,
     model_path = config.LLM_MODEL_PATH,
     port = config.SERVER_PORT,
     pid_file = config.LLM_PID_FILE,
-    auto_shutdown = config.AUTO_SHUTDOWN
+    auto_shutdown = config.AUTO_SHUTDOWN,
+    transport = transport,
+    parallel = config.LLM_PARALLEL,
+    context_size = config.LLM_CONTEXT_SIZE,
+    load_timeout = config.LLM_LOAD_TIMEOUT,
+    slot_save_path = config.LLM_SLOT_SAVE_DIR,
+    probe_interval = config.LLM_PROBE_INTERVAL
 )
 
-chat_manager = ChatManager(
-    config.CHATS_DIR,
-    system_prompt = config.SYSTEM_PROMPT
+# Each chat keeps hitting the same slot so its prompt stays in the KV cache
+slot_router = SlotRouter(
+    transport,
+    slots = config.LLM_PARALLEL,
+    save_dir = config.LLM_SLOT_SAVE_DIR,
+    server = server
 )
 
-audio_manager = AudioManager(
-    whisper_model=config.WHISPER_MODEL,
-    piper_model=config.PIPER_MODEL,
-    piper_config=config.PIPER_CONFIG,
-    mic_rate=config.SAMPLE_RATE,
-    tts_rate=config.PIPER_SAMPLE_RATE,
-    channels=config.CHANNELS,
-    record_timeout=config.RECORD_TIMEOUT
+# Switching between active chats is served from memory, writes go through to disk
+chat_cache = CachedChatStorage(
+    open_chat_storage(config.CHAT_STORAGE, config.CHATS_DIR, config.CHATS_DB),
+    max_chats = config.CHAT_CACHE_SIZE
+)
+
+chat_manager = ChatManager(
+    config.CHATS_DIR,
+    system_prompt = config.SYSTEM_PROMPT,
+    storage = chat_cache
 )
 
 # Toggle for audio assistant replies
 speak_responses = False
 
+# Voice turns that were ended by trailing silence run in the background
+voice_state = {
+    "chat_id": None,
+    "processing": False,
+    "last_turn": None,
+}
+
 # Use blocklist to block some settings from config.py to be showed
 settings_blocklist = {"LLM_PID_FILE", "PIPE_PATH", "CHANNELS"}
-settings_restart_required = {"LLM_MODEL_PATH", "SERVER_PORT", "LLM_SERVER_BIN", "MODEL_NAME"}
+settings_restart_required = {"LLM_MODEL_PATH", "SERVER_PORT", "LLM_SERVER_BIN", "MODEL_NAME", "LLM_PARALLEL", "LLM_CONTEXT_SIZE", "LLM_SLOT_SAVE_DIR",
+                             "CHAT_STORAGE", "CHATS_DIR", "CHATS_DB", "RESPONSE_CACHE_DIR", "TTS_CACHE_DIR",
+                             "CAPTURE_16K", "PREROLL_SECONDS", "STT_WORKERS", "TTS_WORKERS"}
+
+# Generations wait here for one of llama-server's slots, one at a time per chat
+scheduler = GenerationScheduler(
+    max_concurrent = config.LLM_PARALLEL,
+    max_queue = config.LLM_QUEUE_SIZE
+)
+
+# Whisper gets its own bounded threads, a few voice turns can't starve the other endpoints
+stt_pool = BoundedExecutor(
+    "stt",
+    workers = config.STT_WORKERS,
+    max_queue = config.STT_QUEUE_SIZE
+)
+
+# Loop of the web server, voice turns ended by the audio thread are scheduled on it
+event_loop = None
+
+# State changes, token deltas and transcripts pushed to /ws subscribers
+bus = EventBus()
+server.on_state = lambda state: bus.publish("server", state=state)
 
-### Locks ###
-busy_lock = threading.Lock()
-tts_lock = threading.Lock()
+# Health is computed by one background monitor, not by every client that asks
+health_snapshot = None
+
+# Work in progress that isn't visible on the audio manager or the server
+activity = {"state": "idle", "transcribing": 0, "thinking": 0}
 
 
 ### HELPER FUNCTIONS ###
@@ -89,200 +151,371 @@ def build_settings_defaults():
 SETTINGS_DEFAULTS = build_settings_defaults()
 settings_manager = SettingsManager(config.SETTINGS_FILE_PATH, SETTINGS_DEFAULTS)
 
-def from_prompt_to_title(prompt: str, max_words:int = 5) -> str:
-    # Forms a chat title from first 5 words of the initial prompt
-    words = prompt.strip().split()
-    return " ".join(words[:max_words])
+# Saved settings apply from startup, not only after they are changed again
+startup_settings = settings_manager.get_merged_settings()
 
-def speak_async(text: str):
-    # Play TTS in a background thread
-    if not text:
-        return
-    
-    def _run():
-        # Prevent overlapping playback
-        if not tts_lock.acquire(blocking=False):
-            return
-        
+def context_fits(budget: int, context_size: int) -> bool:
+    # 0 on either side means no limit is known
+    return not budget or not context_size or budget < context_size
+
+if not context_fits(int(startup_settings["CONTEXT_TOKEN_BUDGET"]), server.context_size):
+    print(f">> CONTEXT_TOKEN_BUDGET is larger than the {server.context_size} tokens of a slot, long chats will be cut off.")
+
+audio_manager = AudioManager(
+    whisper_model=startup_settings["WHISPER_MODEL"],
+    piper_model=config.PIPER_MODEL,
+    piper_config=config.PIPER_CONFIG,
+    mic_rate=config.SAMPLE_RATE,
+    tts_rate=config.PIPER_SAMPLE_RATE,
+    channels=config.CHANNELS,
+    record_timeout=config.RECORD_TIMEOUT,
+    output_backend=config.TTS_OUTPUT,
+    volume=config.TTS_VOLUME,
+    max_record_seconds=config.MAX_RECORD_SECONDS,
+    streaming_stt=config.STREAMING_STT,
+    vad_threshold=config.VAD_ENERGY_THRESHOLD,
+    segment_silence=config.VAD_SEGMENT_SILENCE,
+    max_segment_seconds=config.MAX_SEGMENT_SECONDS,
+    endpointing=config.ENDPOINTING,
+    endpoint_silence=config.ENDPOINT_SILENCE,
+    tts_cache_dir=config.TTS_CACHE_DIR,
+    tts_cache_mb=config.TTS_CACHE_MB,
+    # Models load in the background, /api/health answers right away
+    whisper_fast_model=startup_settings["WHISPER_FAST_MODEL"],
+    whisper_tier_seconds=float(startup_settings["WHISPER_TIER_SECONDS"]),
+    whisper_threads=int(startup_settings["WHISPER_THREADS"]),
+    whisper_compute_type=startup_settings["WHISPER_COMPUTE_TYPE"],
+    preload_models=bool(startup_settings["PRELOAD_AUDIO_MODELS"]),
+    barge_in=bool(startup_settings["BARGE_IN"]),
+    barge_in_threshold=float(startup_settings["BARGE_IN_THRESHOLD"]),
+    barge_in_min_speech=float(startup_settings["BARGE_IN_MIN_SPEECH"]),
+    replace_speech=bool(startup_settings["REPLACE_SPEECH"]),
+    capture_16k=bool(startup_settings["CAPTURE_16K"]),
+    preroll_seconds=float(startup_settings["PREROLL_SECONDS"]),
+    tts_workers=config.TTS_WORKERS,
+    stt_workers=config.STT_WORKERS
+)
+
+# Completion path shared with the pipe and Qt frontends
+pipeline = CompletionPipeline(
+    transport,
+    server = server,
+    model_name = startup_settings["MODEL_NAME"],
+    temperature = float(startup_settings["TEMPERATURE"]),
+    # Long chats are sent as summary + recent turns within the token budget
+    prompt_builder = ContextWindowBuilder(
+        transport,
+        startup_settings["MODEL_NAME"],
+        budget = int(startup_settings["CONTEXT_TOKEN_BUDGET"]),
+        keep_ratio = float(startup_settings["CONTEXT_KEEP_RATIO"]),
+        summary_tokens = int(startup_settings["CONTEXT_SUMMARY_TOKENS"])
+    ),
+    slot_router = slot_router,
+    # Opt-in, exact repeats of a prompt are answered from disk
+    response_cache = ResponseCache(
+        config.RESPONSE_CACHE_DIR,
+        enabled = bool(startup_settings["RESPONSE_CACHE"]),
+        mode = startup_settings["RESPONSE_CACHE_MODE"],
+        force = bool(startup_settings["RESPONSE_CACHE_FORCE"]),
+        max_entries = int(startup_settings["RESPONSE_CACHE_MAX_ENTRIES"]),
+        ttl = int(startup_settings["RESPONSE_CACHE_TTL"])
+    )
+)
+
+health_interval = float(startup_settings["HEALTH_INTERVAL"])
+
+def open_speech():
+    # Starts a sentence-pipelined speech session for a streamed reply, None if speaking is disabled
+    # A reply that is still playing isn't dropped: the new one queues behind it or replaces it (REPLACE_SPEECH)
+    if not speak_responses:
+        return None
+    return audio_manager.speech_pipeline()
+
+async def generate(turn, chat_id: str, source: str):
+    # Runs a turn, publishing its deltas on the bus; yields the deltas for the caller's own stream
+    activity["thinking"] += 1
+    publish_activity(chat_id)
+    try:
+        async for text in turn.astream():
+            bus.publish("delta", chat_id=chat_id, source=source, content=text)
+            yield text
+        bus.publish("done", chat_id=chat_id, source=source, response=turn.content)
+    finally:
+        activity["thinking"] -= 1
+        publish_activity(chat_id)
+
+def publish_activity(chat_id: str | None = None):
+    # Most visible thing the assistant is doing, published only when it changes
+    if audio_manager.recording:
+        state = "recording"
+    elif activity["transcribing"]:
+        state = "transcribing"
+    elif activity["thinking"]:
+        state = "thinking"
+    elif audio_manager.speaking:
+        state = "speaking"
+    else:
+        state = "idle"
+    if state != activity["state"]:
+        activity["state"] = state
+        bus.publish("activity", state=state, chat_id=chat_id)
+
+def compute_health() -> Dict[str, Any]:
+    return {
+        "status": "ok",
+        "llm_server_running": server.is_running(),
+        "llm_server": server.status(),
+        "busy": scheduler.busy,
+        "queue": scheduler.stats(),
+        "chat_cache": chat_cache.stats(),
+        "slots": slot_router.stats(),
+        "response_cache": pipeline.response_cache.stats(),
+        "tts_cache": audio_manager.tts_cache.stats() if audio_manager.tts_cache else None,
+        "audio_models": audio_manager.models_status(),
+        "stt": stt_pool.stats(),
+        "subscribers": bus.subscribers,
+    }
+
+def audio_snapshot() -> Dict[str, Any]:
+    return {
+        "recording": bool(getattr(audio_manager, "recording", False)),
+        "partial_transcript": audio_manager.partial_transcript,
+        "speak_responses": speak_responses,
+        "speaking": audio_manager.speaking,
+        "speech_pending": audio_manager.speech_pending,
+        "endpointing": audio_manager.endpointing,
+        "processing": voice_state["processing"],
+        "last_turn": voice_state["last_turn"],
+    }
+
+async def health_monitor():
+    # Recomputes health and audio state on an interval and broadcasts what changed
+    global health_snapshot
+    previous = {}
+    while True:
         try:
-            audio_manager.speak(text)
-        finally:
-            tts_lock.release()
-        
-    threading.Thread(target=_run, daemon=True).start()
+            health_snapshot = await run_in_threadpool(compute_health)
+            for kind, snapshot in (("health", health_snapshot), ("audio", audio_snapshot())):
+                if snapshot != previous.get(kind):
+                    previous[kind] = snapshot
+                    bus.publish(kind, data=snapshot)
+            # Speech ending and utterances cut by silence don't report themselves
+            publish_activity()
+        except Exception as e:
+            print(f">> Health monitor failed due to: {e}")
+        await asyncio.sleep(health_interval)
+
+def ndjson(event: Dict[str, Any]) -> str:
+    # One JSON event per line for streamed responses
+    return json.dumps(event, ensure_ascii=False) + "\n"
+
+def queue_full(e: QueueFull) -> HTTPException:
+    return HTTPException(status_code=429, detail=f"Assistant queue is full ({e}). Try again later.")
 
 
 ### API endpoints ###
 @app.on_event("startup")
-def start_record_thread():
+async def start_event_bus():
+    global event_loop
+    event_loop = asyncio.get_running_loop()
+    bus.attach(event_loop)
+    asyncio.create_task(health_monitor())
+
+@app.on_event("startup")
+async def start_record_thread():
     threading.Thread(target=audio_manager.record_loop, daemon=True).start()
 
+@app.on_event("startup")
+async def preload_model():
+    # Warm start: the model loads in the background while the UI comes up
+    if startup_settings.get("LLM_PRELOAD"):
+        server.start(wait=False)
+
+@app.on_event("shutdown")
+async def close_transport():
+    await transport.aclose()
+    transport.close()
+    stt_pool.shutdown()
+
 @app.get("/api/health")
-def health():
-    # Fetches server health status
-    return {
-        "status": "ok",
-        "llm_server_running": server.is_running(),
-        "busy": busy_lock.locked(),
-    }
+async def health():
+    # Latest snapshot of the health monitor, at most HEALTH_INTERVAL old
+    return health_snapshot or await run_in_threadpool(compute_health)
+
+@app.websocket("/ws")
+async def events(websocket: WebSocket):
+    # Pushes health, server, activity and audio state plus token deltas and transcripts
+    # Every event is {"type": ...}; the current state is sent right after connecting
+    await websocket.accept()
+    queue = bus.subscribe()
+    try:
+        while True:
+            await websocket.send_json(await queue.get())
+    except WebSocketDisconnect:
+        pass
+    except Exception as e:
+        # Client went away mid-send
+        print(f">> WebSocket closed: {e}")
+    finally:
+        bus.unsubscribe(queue)
 
 @app.get("/api/chats")
-def list_chats():
-    # Lists chats for sidebar
+async def list_chats(limit: int | None = None, offset: int = 0):
+    # Lists chats for sidebar, newest first; limit/offset page through them
     return {
-        "chats": chat_manager.list_chats()
+        "chats": await run_in_threadpool(chat_manager.list_chats, limit=limit, offset=offset),
+        "total": await run_in_threadpool(chat_manager.count_chats)
     }
 
+@app.get("/api/search")
+async def search_chats(q: str, limit: int = 20):
+    # Ranked full-text hits with snippets, needs the SQLite chat storage
+    try:
+        return {
+            "query": q,
+            "results": await run_in_threadpool(chat_manager.search, q, limit=max(1, min(limit, 100)))
+        }
+    except NotImplementedError as e:
+        raise HTTPException(status_code=501, detail=str(e))
+
 @app.post("/api/chats")
-def create_chat(req: CreateChatRequest):
+async def create_chat(req: CreateChatRequest):
     # Creates a chat with just system prompt
     title = (req.title or "New chat").strip()
-    meta = chat_manager.create_chat(title=title)
+    meta = await run_in_threadpool(chat_manager.create_chat, title=title)
     return {
         "chat": meta
     }
 
 @app.get("/api/chats/{chat_id}")
-def get_chat(chat_id: str):
-    # Loads chat messages from disk to UI
-    messages = chat_manager.get_messages(chat_id)
+async def get_chat(chat_id: str, before: int | None = None, after: int | None = None,
+             since: int | None = None, limit: int | None = None):
+    # Loads chat messages to UI, all of them or a window (before/after/limit cursors, since=N for new ones)
+    # "start" is the index of the first returned message, "total" the chat's message count
+    try:
+        page = await run_in_threadpool(chat_manager.get_message_page, chat_id,
+                                       before=before, after=after, since=since, limit=limit)
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="Chat not found!")
     return {
         "id": chat_id,
-        "messages": messages
+        **page
     }
 
 @app.post("/api/chats/{chat_id}/clear")
-def clear_chat(chat_id: str):
+async def clear_chat(chat_id: str):
     # Clean the selected chat
-    chat_manager.clear_chat(chat_id)
+    await run_in_threadpool(chat_manager.clear_chat, chat_id)
+    slot_router.forget(chat_id)
     return {
         "ok": True
     }
 
 @app.post("/api/chats/{chat_id}/rename")
-def rename_chat(chat_id: str, req: RenameChatRequest):
+async def rename_chat(chat_id: str, req: RenameChatRequest):
     # Rename a chat
-    meta = chat_manager.rename_chat(chat_id, req.title)
+    meta = await run_in_threadpool(chat_manager.rename_chat, chat_id, req.title)
     return {
         "chat": meta
     }
 
 @app.delete("/api/chats/{chat_id}")
-def delete_chat(chat_id: str):
+async def delete_chat(chat_id: str):
     # Delets a chat
-    chat_manager.delete_chat(chat_id)
+    await run_in_threadpool(chat_manager.delete_chat, chat_id)
+    slot_router.forget(chat_id)
     return {
         "ok": True
     }
 
 @app.post("/api/chats/{chat_id}/chat")
-def chat(chat_id: str, req: ChatRequest):
+async def chat(chat_id: str, req: ChatRequest):
     # Loads messages for a specific chat, appends new messages, and saves them to disk
     # Prompt and error handling
     prompt = req.prompt.strip()
     if not prompt:
         raise HTTPException(status_code=400, detail="Prompt can't be empty.")
-    if not busy_lock.acquire(blocking=False):
-        raise HTTPException(status_code=409, detail="Assistant is currently busy.")
 
     try:
-        # Fetches chats
-        messages = chat_manager.get_messages(chat_id)
-        messages.append({
-            "role": "user",
-            "content": prompt
-        })
-
-        # Error handling
-        if not server.is_running():
-            server.start()
-        server.last_query_time = time.time()
-
-        # Send a message to server
-        import requests
-        effective = settings_manager.get_merged_settings()
-        payload = {
-            "model": effective["MODEL_NAME"],
-            "messages": messages,
-            "temperature": float(effective["TEMPERATURE"]),
-        }
-
-        r = requests.post(
-            f"http://127.0.0.1:{server.port}/v1/chat/completions",
-            json=payload,
-            timeout=300
-        )
-        r.raise_for_status()
-        data = r.json()
-
-        # Reply extraction
-        raw = data["choices"][0]["message"]["content"]
-        content = raw
-
-        # Cleaning the response
-        if "<think>" in content and "</think>" in content:
-            content = content.split("</think>", 1)[-1].strip()
-        content = content.replace("*", "").replace("###", "").replace("---", "").strip()
-
-        # Append to messages
-        messages.append({
-            "role": "assistant",
-            "content": content
-        })
+        # Waits for a free slot, earlier requests for this chat finish first
+        async with scheduler.aslot(chat_id):
+            # Speak responses outloud if enabled
+            turn = pipeline.turn(prompt, ChatStore(chat_manager, chat_id), speech=open_speech())
+            async for _ in generate(turn, chat_id, "chat"):
+                pass
+            return {
+                "response": turn.content
+            }
 
-        # Speak responses outloud if enabled
-        if speak_responses and content and not content.lower().startswith("error"):
-            speak_async(content)
+    except QueueFull as e:
+        raise queue_full(e)
 
-        # Save
-        chat_manager.save_messages(chat_id, messages)
+@app.post("/api/chats/{chat_id}/chat/stream")
+async def chat_stream(chat_id: str, req: ChatRequest):
+    # Same as /chat but relays the reply as NDJSON events while llama-server generates it
+    # Events: {"type": "queued", "position", "waited"}, {"type": "delta", "content"},
+    # {"type": "done", "response"}, {"type": "error", "detail"}
+    prompt = req.prompt.strip()
+    if not prompt:
+        raise HTTPException(status_code=400, detail="Prompt can't be empty.")
+    try:
+        ticket = scheduler.enqueue(chat_id, asyncio.get_running_loop())
+    except QueueFull as e:
+        raise queue_full(e)
 
-        # Auto-title
-        # If still titled as "New chat" or empty, rename based on first user prompt
+    async def _events():
         try:
-            meta = None
-            # List and find correct chat
-            for m in chat_manager.list_chats():
-                if m.get("id") == chat_id:
-                    meta = m
-                    break
-
-            if meta and (meta.get("title") or "").strip().lower() in ("new chat", ""):
-                title = from_prompt_to_title(prompt, max_words=5)
-                if title:
-                    chat_manager.rename_chat(chat_id, title)
-        
+            # Report the queue position until a slot frees up
+            # granted is set as soon as the slot is handed out, the future only resolves on the next loop pass
+            while not ticket.granted:
+                yield ndjson({
+                    "type": "queued",
+                    "position": scheduler.position(ticket),
+                    "waited": round(time.time() - ticket.enqueued_at, 1)
+                })
+                await asyncio.wait([ticket.future], timeout=1.0)
+
+            turn = pipeline.turn(prompt, ChatStore(chat_manager, chat_id), speech=open_speech())
+            async for text in generate(turn, chat_id, "stream"):
+                yield ndjson({"type": "delta", "content": text})
+            yield ndjson({"type": "done", "response": turn.content})
+
         except Exception as e:
-            print("Auto titling failed:", e)
+            print(f">> Streaming chat failed due to: {e}")
+            yield ndjson({"type": "error", "detail": str(e)})
 
-        return {
-            "response": content
-        }
+        finally:
+            # Frees the slot, or leaves the queue if the client went away while waiting
+            scheduler.release(ticket)
+
+    # release() is idempotent, the background task covers streams that never started
+    return StreamingResponse(_events(), media_type="application/x-ndjson",
+                             background=BackgroundTask(scheduler.release, ticket))
 
-    finally:
-        # Release the lock
-        busy_lock.release()
-            
 @app.post("/api/server/start")
-def start_server():
-    # Starts the LLM server
-    if not server.is_running():
-        server.start()
-    return {"ok": True, "llm_server_running": server.is_running()}
+async def start_server():
+    # Starts loading the LLM server, progress is reported by /api/health
+    server.start(wait=False)
+    return {"ok": True, "llm_server_running": server.is_running(), "llm_server": server.status()}
 
 @app.post("/api/server/stop")
-def stop_server():
-    # Stops the LLM server
-    server.stop()
-    return {"ok": True, "llm_server_running": server.is_running()}
+async def stop_server():
+    # Stops the LLM server, waiting up to the drain timeout for running generations
+    await run_in_threadpool(server.stop)
+    return {"ok": True, "llm_server_running": server.is_running(), "llm_server": server.status()}
 
 @app.get("/api/settings")
-def get_settings():
-    return {"settings": settings_manager.get_merged_settings()}
+async def get_settings():
+    return {"settings": await run_in_threadpool(settings_manager.get_merged_settings)}
 
 @app.post("/api/settings")
-def update_settings(updates: Dict[str, Any] = Body(...)):
+async def update_settings(updates: Dict[str, Any] = Body(...)):
+    # Validation is quick, saving the file and swapping models isn't
+    return await run_in_threadpool(apply_settings, updates)
+
+def apply_settings(updates: Dict[str, Any]):
     """Updates all settings of the json"""
+    global health_interval
     # Filter allowed parameters (config - blocklist)
     allowed_params = set(SETTINGS_DEFAULTS.keys())
     # Incoming parameters from UI
@@ -342,6 +575,71 @@ def update_settings(updates: Dict[str, Any] = Body(...)):
         p = int(incoming_params["SERVER_PORT"])
         if p < 1 or p > 65535:
             raise HTTPException(status_code=400, detail="SERVER_PORT must be between 1 and 65535")
+
+    if "ENDPOINT_SILENCE" in incoming_params:
+        e = float(incoming_params["ENDPOINT_SILENCE"])
+        if e <= 0:
+            raise HTTPException(status_code=400, detail="ENDPOINT_SILENCE must be a positive number")
+
+    if "TTS_VOLUME" in incoming_params:
+        v = float(incoming_params["TTS_VOLUME"])
+        if v < 0 or v > 1:
+            raise HTTPException(status_code=400, detail="TTS_VOLUME must be between 0 and 1")
+
+    for key in ("LLM_PARALLEL", "LLM_QUEUE_SIZE", "LLM_LOAD_TIMEOUT", "LLM_PROBE_INTERVAL", "STT_WORKERS", "TTS_WORKERS"):
+        if key in incoming_params and int(incoming_params[key]) < 1:
+            raise HTTPException(status_code=400, detail=f"{key} must be at least 1")
+
+    if "STT_QUEUE_SIZE" in incoming_params and int(incoming_params["STT_QUEUE_SIZE"]) < 0:
+        raise HTTPException(status_code=400, detail="STT_QUEUE_SIZE can't be negative")
+
+    if "CONTEXT_TOKEN_BUDGET" in incoming_params and int(incoming_params["CONTEXT_TOKEN_BUDGET"]) < 0:
+        raise HTTPException(status_code=400, detail="CONTEXT_TOKEN_BUDGET can't be negative")
+
+    if "LLM_CONTEXT_SIZE" in incoming_params and int(incoming_params["LLM_CONTEXT_SIZE"]) < 0:
+        raise HTTPException(status_code=400, detail="LLM_CONTEXT_SIZE can't be negative")
+
+    if "CONTEXT_TOKEN_BUDGET" in incoming_params or "LLM_CONTEXT_SIZE" in incoming_params:
+        # Prompts are budgeted per request, each request gets one slot's share of the context
+        merged = {**settings_manager.get_merged_settings(), **incoming_params}
+        if not context_fits(int(merged["CONTEXT_TOKEN_BUDGET"]), int(merged["LLM_CONTEXT_SIZE"])):
+            raise HTTPException(status_code=400, detail="CONTEXT_TOKEN_BUDGET must be smaller than LLM_CONTEXT_SIZE")
+
+    if "CONTEXT_KEEP_RATIO" in incoming_params:
+        k = float(incoming_params["CONTEXT_KEEP_RATIO"])
+        if k <= 0 or k > 1:
+            raise HTTPException(status_code=400, detail="CONTEXT_KEEP_RATIO must be between 0 and 1")
+
+    if "PREROLL_SECONDS" in incoming_params and float(incoming_params["PREROLL_SECONDS"]) < 0:
+        raise HTTPException(status_code=400, detail="PREROLL_SECONDS can't be negative")
+
+    for key in ("BARGE_IN_THRESHOLD", "BARGE_IN_MIN_SPEECH", "HEALTH_INTERVAL"):
+        if key in incoming_params and float(incoming_params[key]) <= 0:
+            raise HTTPException(status_code=400, detail=f"{key} must be a positive number")
+
+    if "WHISPER_THREADS" in incoming_params and int(incoming_params["WHISPER_THREADS"]) < 1:
+        raise HTTPException(status_code=400, detail="WHISPER_THREADS must be at least 1")
+
+    if "WHISPER_COMPUTE_TYPE" in incoming_params:
+        if incoming_params["WHISPER_COMPUTE_TYPE"] not in ("int8", "int8_float32", "int16", "float16", "float32", "default"):
+            raise HTTPException(status_code=400, detail="Unknown WHISPER_COMPUTE_TYPE")
+
+    if "TTS_CACHE_MB" in incoming_params and int(incoming_params["TTS_CACHE_MB"]) < 0:
+        raise HTTPException(status_code=400, detail="TTS_CACHE_MB can't be negative")
+
+    if "RESPONSE_CACHE_MODE" in incoming_params:
+        if incoming_params["RESPONSE_CACHE_MODE"] not in ("history", "last_turn"):
+            raise HTTPException(status_code=400, detail="RESPONSE_CACHE_MODE must be 'history' or 'last_turn'")
+
+    if "RESPONSE_CACHE_MAX_ENTRIES" in incoming_params and int(incoming_params["RESPONSE_CACHE_MAX_ENTRIES"]) < 1:
+        raise HTTPException(status_code=400, detail="RESPONSE_CACHE_MAX_ENTRIES must be at least 1")
+
+    if "RESPONSE_CACHE_TTL" in incoming_params and int(incoming_params["RESPONSE_CACHE_TTL"]) < 0:
+        raise HTTPException(status_code=400, detail="RESPONSE_CACHE_TTL can't be negative")
+
+    if "TTS_OUTPUT" in incoming_params:
+        if incoming_params["TTS_OUTPUT"] not in ("sounddevice", "ffplay"):
+            raise HTTPException(status_code=400, detail="TTS_OUTPUT must be 'sounddevice' or 'ffplay'")
         
     # Load overrides from settings.json
     overrides = settings_manager.load_overrides()
@@ -354,6 +652,67 @@ def update_settings(updates: Dict[str, Any] = Body(...)):
     # Apply effective settings if safe
     if "AUTO_SHUTDOWN" in incoming_params:
         server.auto_shutdown = int(effective_settings["AUTO_SHUTDOWN"])
+    if "TEMPERATURE" in incoming_params:
+        pipeline.temperature = float(effective_settings["TEMPERATURE"])
+    if "TTS_VOLUME" in incoming_params:
+        audio_manager.set_volume(effective_settings["TTS_VOLUME"])
+    if "TTS_CACHE_MB" in incoming_params and audio_manager.tts_cache:
+        # Shrinking takes effect with the next stored phrase
+        audio_manager.tts_cache.max_bytes = int(effective_settings["TTS_CACHE_MB"]) * 1024 * 1024
+    if "TTS_OUTPUT" in incoming_params:
+        audio_manager.output_backend = effective_settings["TTS_OUTPUT"]
+    if "ENDPOINTING" in incoming_params:
+        audio_manager.endpointing = bool(effective_settings["ENDPOINTING"])
+    if "LLM_LOAD_TIMEOUT" in incoming_params:
+        server.load_timeout = int(effective_settings["LLM_LOAD_TIMEOUT"])
+    if "LLM_PROBE_INTERVAL" in incoming_params:
+        server.probe_interval = int(effective_settings["LLM_PROBE_INTERVAL"])
+    if "CONTEXT_TOKEN_BUDGET" in incoming_params:
+        pipeline.prompt_builder.budget = int(effective_settings["CONTEXT_TOKEN_BUDGET"])
+    if "CONTEXT_KEEP_RATIO" in incoming_params:
+        pipeline.prompt_builder.keep_ratio = float(effective_settings["CONTEXT_KEEP_RATIO"])
+    if "CONTEXT_SUMMARY_TOKENS" in incoming_params:
+        pipeline.prompt_builder.summary_tokens = int(effective_settings["CONTEXT_SUMMARY_TOKENS"])
+    if "CHAT_CACHE_SIZE" in incoming_params:
+        chat_cache.max_chats = max(1, int(effective_settings["CHAT_CACHE_SIZE"]))
+    if "RESPONSE_CACHE" in incoming_params:
+        pipeline.response_cache.enabled = bool(effective_settings["RESPONSE_CACHE"])
+    if "RESPONSE_CACHE_MODE" in incoming_params:
+        pipeline.response_cache.mode = effective_settings["RESPONSE_CACHE_MODE"]
+    if "RESPONSE_CACHE_FORCE" in incoming_params:
+        pipeline.response_cache.force = bool(effective_settings["RESPONSE_CACHE_FORCE"])
+    if "RESPONSE_CACHE_MAX_ENTRIES" in incoming_params:
+        pipeline.response_cache.max_entries = int(effective_settings["RESPONSE_CACHE_MAX_ENTRIES"])
+    if "RESPONSE_CACHE_TTL" in incoming_params:
+        pipeline.response_cache.ttl = int(effective_settings["RESPONSE_CACHE_TTL"])
+    if "LLM_QUEUE_SIZE" in incoming_params:
+        scheduler.max_queue = int(effective_settings["LLM_QUEUE_SIZE"])
+    if "STT_QUEUE_SIZE" in incoming_params:
+        stt_pool.max_queue = int(effective_settings["STT_QUEUE_SIZE"])
+    if "HEALTH_INTERVAL" in incoming_params:
+        health_interval = float(effective_settings["HEALTH_INTERVAL"])
+    if "BARGE_IN" in incoming_params:
+        audio_manager.barge_in = bool(effective_settings["BARGE_IN"])
+    if "BARGE_IN_THRESHOLD" in incoming_params:
+        audio_manager.set_barge_in_threshold(effective_settings["BARGE_IN_THRESHOLD"])
+    if "BARGE_IN_MIN_SPEECH" in incoming_params:
+        audio_manager.barge_in_min_speech = float(effective_settings["BARGE_IN_MIN_SPEECH"])
+    if "REPLACE_SPEECH" in incoming_params:
+        audio_manager.replace_speech = bool(effective_settings["REPLACE_SPEECH"])
+    if "WHISPER_TIER_SECONDS" in incoming_params:
+        audio_manager.whisper_tier_seconds = float(effective_settings["WHISPER_TIER_SECONDS"])
+    if any(key in incoming_params for key in ("WHISPER_MODEL", "WHISPER_FAST_MODEL", "WHISPER_THREADS", "WHISPER_COMPUTE_TYPE")):
+        # Swapped models load again on next use, or right away when preloading
+        audio_manager.configure_whisper(
+            effective_settings["WHISPER_MODEL"],
+            effective_settings["WHISPER_FAST_MODEL"],
+            int(effective_settings["WHISPER_THREADS"]),
+            effective_settings["WHISPER_COMPUTE_TYPE"]
+        )
+        if effective_settings["PRELOAD_AUDIO_MODELS"]:
+            audio_manager.preload()
+    if "ENDPOINT_SILENCE" in incoming_params:
+        audio_manager.endpoint_silence = float(effective_settings["ENDPOINT_SILENCE"])
 
     # Determine whether restart is required for changes to apply
     restart_required = any(key in incoming_params for key in settings_restart_required)
@@ -367,19 +726,14 @@ def update_settings(updates: Dict[str, Any] = Body(...)):
     }
 
 @app.get("/api/chats/{chat_id}/export")
-def export_chat(chat_id: str):
+async def export_chat(chat_id: str):
     # Read data from disk
-    meta = None
-    for m in chat_manager.list_chats():
-        if m.get("id") == chat_id:
-            meta = m
-            break
-    
-    # Check whether chat was found or not
-    if meta is None:
+    try:
+        meta = await run_in_threadpool(chat_manager.get_meta, chat_id)
+    except FileNotFoundError:
         raise HTTPException(status_code=404, detail="Chat not found!")
     
-    messages = chat_manager.get_messages(chat_id)
+    messages = await run_in_threadpool(chat_manager.get_messages, chat_id)
     # Check for format errors
     if not isinstance(messages, list):
         raise HTTPException(status_code=500, detail="Chat messages found but they are not in list format!")
@@ -457,121 +811,130 @@ async def import_chat(file: UploadFile = File(...)):
         title = "Imported chat"
 
     # New chat creation
-    new_meta = chat_manager.create_chat(title=title)
-    chat_manager.save_messages(new_meta["id"], cleaned_messages)
+    new_meta = await run_in_threadpool(chat_manager.create_chat, title=title)
+    await run_in_threadpool(chat_manager.save_messages, new_meta["id"], cleaned_messages)
 
     return {"ok": True, "chat": new_meta}
 
 @app.get("/api/audio/state")
-def audio_state():
-    return {
-        "recording": bool(getattr(audio_manager, "recording", False)),
-        "speak_responses": speak_responses,
-    }
+async def audio_state():
+    return audio_snapshot()
 
 @app.post("/api/audio/speak_enabled")
-def set_speak_outloud(req: SpeakToggleRequest):
+async def set_speak_outloud(req: SpeakToggleRequest):
     global speak_responses
     speak_responses = bool(req.enabled)
+    bus.publish("audio", data=audio_snapshot())
     return { "ok": True, "speak_responses": speak_responses }
 
+@app.post("/api/audio/stop")
+async def stop_speaking():
+    # Interrupts the reply that is being read out loud
+    await run_in_threadpool(audio_manager.stop_speaking)
+    return { "ok": True }
+
 @app.post("/api/audio/record/toggle")
-def toggle_recording(chat_id: str):
+async def toggle_recording(chat_id: str):
     # Toggle recording and handle transcription + sending it to server
-    audio_manager.recording = not bool(getattr(audio_manager, "recording", False))
+    utterance = None
+    if audio_manager.recording:
+        utterance = audio_manager.stop_recording()
+    else:
+        audio_manager.start_recording()
+
+    publish_activity(chat_id)
+    bus.publish("audio", data=audio_snapshot())
 
     # If turned recording ON
     if audio_manager.recording:
+        # Remember the chat in case trailing silence ends the utterance
+        voice_state["chat_id"] = chat_id
         return { "ok": True, "recording": True }
-    
+
     # If turned recording OFF -> transcribe
-    transcript = audio_manager.transcribe()
-    if not transcript:
-        return { "ok": True, "recording": False, "transcript": "", "response": "" }
-    
-    # Prevent overlapping requests/file writes
-    if not busy_lock.acquire(blocking=False):
-        raise HTTPException(status_code=409, detail="Assistant is currently busy. Try again later.")
-    
-    try:
-        # Load messages for the chat and append transcript
-        messages = chat_manager.get_messages(chat_id)
-        messages.append({"role": "user", "content": transcript})
+    return await voice_turn(chat_id, utterance)
 
+async def voice_endpoint(utterance):
+    # Runs when trailing silence ended the utterance, same as toggling recording off
+    chat_id = voice_state["chat_id"]
+    if not chat_id:
+        audio_manager.discard(utterance)
+        return
 
-        # Handle message sending if server is stopped
-        if not server.is_running():
-            return {
-                "ok": False,
-                "recording": False,
-                "transcript": transcript,
-                "response": "",
-                "error": "LLM server is stopped. Click 'start server' before sending."
-            }
-        
-        # Build the request
-        import requests
-        effective = settings_manager.get_merged_settings()
-        payload = {
-            "model": effective["MODEL_NAME"],
-            "messages": messages,
-            "temperature": float(effective["TEMPERATURE"]),
-        }
+    voice_state["processing"] = True
+    bus.publish("audio", data=audio_snapshot())
+    try:
+        result = await voice_turn(chat_id, utterance)
+    except HTTPException as e:
+        result = { "ok": False, "recording": False, "transcript": "", "response": "", "error": e.detail }
+    except Exception as e:
+        print(f">> Voice turn failed due to: {e}")
+        result = { "ok": False, "recording": False, "transcript": "", "response": "", "error": str(e) }
+    finally:
+        voice_state["processing"] = False
+
+    # The UI picks up the answer through /api/audio/state
+    previous = voice_state["last_turn"]
+    voice_state["last_turn"] = {
+        "id": (previous["id"] + 1) if previous else 1,
+        "chat_id": chat_id,
+        **result
+    }
+    bus.publish("audio", data=audio_snapshot())
 
-        r = requests.post(
-            f"http://127.0.0.1:{server.port}/v1/chat/completions",
-            json=payload,
-            timeout=300
-        )
-        r.raise_for_status()
-        data = r.json()
-        
-        # Reply extraction
-        raw = data["choices"][0]["message"]["content"]
-        content = raw
-        
-        # Cleaning the response
-        if "<think>" in content and "</think>" in content:
-            content = content.split("</think>", 1)[-1].strip()
-        content = content.replace("*", "").replace("###", "").replace("---", "").strip()
-
-        # Append to messages
-        messages.append({
-            "role": "assistant",
-            "content": content
-        })
-        # Save
-        chat_manager.save_messages(chat_id, messages)
-
-        # Auto-title
-        # If still titled as "New chat" or empty, rename based on first user prompt
-        try:
-            meta = None
-            # List and find correct chat
-            for m in chat_manager.list_chats():
-                if m.get("id") == chat_id:
-                    meta = m
-                    break
-
-            if meta and (meta.get("title") or "").strip().lower() in ("new chat", ""):
-                title = from_prompt_to_title(transcript, max_words=5)
-                if title:
-                    chat_manager.rename_chat(chat_id, title)
-        
-        except Exception as e:
-            print("Auto titling failed:", e)
+def on_voice_endpoint(utterance):
+    # Called from an audio thread, the turn itself runs on the web server's loop
+    if event_loop is not None:
+        asyncio.run_coroutine_threadsafe(voice_endpoint(utterance), event_loop)
+    else:
+        audio_manager.discard(utterance)
 
-        # Speak responses outloud if enabled
-        if speak_responses and content and not content.lower().startswith("error"):
-            speak_async(content)
+audio_manager.on_endpoint = on_voice_endpoint
+# Segments recognized while the user is still talking
+audio_manager.on_partial = lambda text: bus.publish("transcript", chat_id=voice_state["chat_id"], text=text, final=False)
 
+async def voice_turn(chat_id: str, utterance):
+    # Transcribes the finished utterance on the STT threads and sends it to the server
+    activity["transcribing"] += 1
+    publish_activity(chat_id)
+    try:
+        transcript = await stt_pool.run(audio_manager.transcribe, utterance)
+    except QueueFull as e:
+        # Never reached transcribe(), so the utterance is let go here
+        audio_manager.discard(utterance)
+        raise queue_full(e)
+    finally:
+        activity["transcribing"] -= 1
+        publish_activity(chat_id)
+    bus.publish("transcript", chat_id=chat_id, text=transcript or "", final=True)
+    if not transcript:
+        return { "ok": True, "recording": False, "transcript": "", "response": "" }
+    
+    # Handle message sending if server is stopped
+    if not server.is_running():
         return {
-            "ok": True,
+            "ok": False,
             "recording": False,
             "transcript": transcript,
-            "response": content
+            "response": "",
+            "error": "LLM server is stopped. Click 'start server' before sending."
         }
-    
-    finally:
-        # Release the lock
-        busy_lock.release()
\ No newline at end of file
+
+    try:
+        # Queues behind other generations, turns for the same chat never overlap
+        async with scheduler.aslot(chat_id):
+            # Speak responses outloud if enabled
+            turn = pipeline.turn(transcript, ChatStore(chat_manager, chat_id), speech=open_speech())
+            async for _ in generate(turn, chat_id, "voice"):
+                pass
+            content = turn.content
+
+    except QueueFull as e:
+        raise queue_full(e)
+
+    return {
+        "ok": True,
+        "recording": False,
+        "transcript": transcript,
+        "response": content
+    }
\ No newline at end of file
@@ -13,7 +13,7 @@ class SettingsManager:
             if not os.path.exists(self.settings_path):
                 return {}
             with open(self.settings_path, "r", encoding="utf-8") as f:
-                data = json.load()
+                data = json.load(f)
                 if isinstance(data, Dict):
                     return data
                 else:
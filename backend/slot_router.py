@@ -0,0 +1,168 @@
+import os, time, threading
+from collections import OrderedDict
+
+
+class SlotRouter:
+    def __init__(self, transport, slots=1, save_dir=None, max_saved=64, server=None):
+        ''' Pins every chat to one llama-server slot so its prompt prefix stays in the KV cache
+
+        When a slot has to be handed to another chat, the previous chat's KV state
+        is saved to disk (llama-server's slot save API, needs --slot-save-path) and
+        restored when that chat comes back, so it isn't prefilled again.
+
+        Args: transport: LLMTransport of the server
+        slots (int): slot count, llama-server's --parallel
+        save_dir (str): --slot-save-path of the server, None disables save/restore
+        max_saved (int): saved slot files kept, oldest are deleted first
+        server: LLMServerManager, a restart forgets what the slots held '''
+        self.transport = transport
+        self.slots = slots
+        self.save_dir = save_dir
+        self.max_saved = max_saved
+        self.server = server
+
+        self._lock = threading.Lock()
+        self._owner = [None] * slots          # chat held in each slot's KV cache
+        self._busy = [False] * slots
+        self._last_used = [0.0] * slots
+        self._saved = OrderedDict()           # chat_id -> file name, least recently saved first
+        self._server_starts = self._starts()
+        self.saves = 0
+        self.restores = 0
+
+        if save_dir:
+            os.makedirs(save_dir, exist_ok=True)
+            # Slot files from earlier runs are still valid for the same model
+            for name in sorted(os.listdir(save_dir), key=lambda n: os.path.getmtime(os.path.join(save_dir, n))):
+                if name.startswith("chat-") and name.endswith(".bin"):
+                    self._saved[name[len("chat-"):-len(".bin")]] = name
+
+
+    ### ROUTING ###
+    def acquire(self, chat_id):
+        # Returns the slot the chat's request must use, None if every slot is busy
+        with self._lock:
+            self._check_restart()
+            slot = self._pick(chat_id)
+            if slot is None:
+                return None
+            self._busy[slot] = True
+            previous = self._owner[slot]
+            self._owner[slot] = chat_id
+
+        # Disk I/O on llama-server's side, the slot is already reserved
+        if previous != chat_id:
+            if previous is not None:
+                self._save(slot, previous)
+            self._restore(slot, chat_id)
+        return slot
+
+
+    def release(self, slot):
+        if slot is None:
+            return
+        with self._lock:
+            self._busy[slot] = False
+            self._last_used[slot] = time.time()
+
+
+    def request_options(self, slot):
+        # Extra fields for /v1/chat/completions
+        if slot is None:
+            return {"cache_prompt": True}
+        return {"id_slot": slot, "cache_prompt": True}
+
+
+    def forget(self, chat_id):
+        # Deleted or cleared chats don't need their KV state any more
+        with self._lock:
+            for slot, owner in enumerate(self._owner):
+                if owner == chat_id:
+                    self._owner[slot] = None
+            name = self._saved.pop(chat_id, None)
+        if name:
+            self._remove_file(name)
+
+
+    def _pick(self, chat_id):
+        # Own slot first, then an empty one, then the least recently used idle one
+        for slot, owner in enumerate(self._owner):
+            if owner == chat_id:
+                return None if self._busy[slot] else slot
+        idle = [slot for slot in range(self.slots) if not self._busy[slot]]
+        if not idle:
+            return None
+        empty = [slot for slot in idle if self._owner[slot] is None]
+        if empty:
+            return empty[0]
+        return min(idle, key=lambda slot: self._last_used[slot])
+
+
+    def _starts(self):
+        return getattr(self.server, "starts", 0)
+
+
+    def _check_restart(self):
+        # A restarted server starts with empty slots, saved files stay usable
+        starts = self._starts()
+        if starts != self._server_starts:
+            self._server_starts = starts
+            self._owner = [None] * self.slots
+
+
+    ### SAVE / RESTORE ###
+    def _save(self, slot, chat_id):
+        if not self.save_dir:
+            return
+        name = f"chat-{chat_id}.bin"
+        try:
+            self.transport.post(f"/slots/{slot}?action=save", {"filename": name})
+        except Exception as e:
+            print(f">> Saving slot {slot} for chat {chat_id} failed: {e}")
+            return
+
+        with self._lock:
+            self.saves += 1
+            self._saved.pop(chat_id, None)
+            self._saved[chat_id] = name
+            evicted = []
+            while len(self._saved) > self.max_saved:
+                evicted.append(self._saved.popitem(last=False)[1])
+        for old in evicted:
+            self._remove_file(old)
+
+
+    def _restore(self, slot, chat_id):
+        with self._lock:
+            name = self._saved.get(chat_id)
+        if not name:
+            return
+        try:
+            self.transport.post(f"/slots/{slot}?action=restore", {"filename": name})
+        except Exception as e:
+            # Nothing lost, the prompt is prefilled as usual
+            print(f">> Restoring slot {slot} for chat {chat_id} failed: {e}")
+            return
+        with self._lock:
+            self.restores += 1
+
+
+    def _remove_file(self, name):
+        try:
+            os.remove(os.path.join(self.save_dir, name))
+        except OSError:
+            pass
+
+
+    ### REPORTING ###
+    def stats(self):
+        with self._lock:
+            return {
+                "slots": [
+                    {"id": slot, "chat_id": self._owner[slot], "busy": self._busy[slot]}
+                    for slot in range(self.slots)
+                ],
+                "saved": len(self._saved),
+                "saves": self.saves,
+                "restores": self.restores,
+            }
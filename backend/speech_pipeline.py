@@ -0,0 +1,225 @@
+import re, queue, threading
+
+# Sentence end punctuation (optionally closed by quotes/brackets) followed by whitespace, or a line break
+SENTENCE_BOUNDARY = re.compile(r"[.!?…]+[\"')\]]*\s+|\n+")
+
+
+class SentenceSplitter:
+    def __init__(self, min_chars=12):
+        ''' Cuts streamed text into sentences
+
+        Args: min_chars (int): shorter fragments are merged into the next sentence '''
+        self.min_chars = min_chars
+        self._buffer = ""
+
+
+    def feed(self, text):
+        # Returns the sentences completed by this chunk
+        self._buffer += text
+        sentences = []
+        start = 0
+        for match in SENTENCE_BOUNDARY.finditer(self._buffer):
+            sentence = self._buffer[start:match.end()].strip()
+            if len(sentence) < self.min_chars:
+                continue
+            sentences.append(sentence)
+            start = match.end()
+
+        self._buffer = self._buffer[start:]
+        return sentences
+
+
+    def flush(self):
+        # Returns whatever is left once the stream has ended
+        rest = self._buffer.strip()
+        self._buffer = ""
+        return [rest] if rest else []
+
+
+class SpeechPipeline:
+    def __init__(self, synthesize, open_output, on_done=None, after=None):
+        ''' Speaks a reply sentence by sentence while it is still being generated
+
+        Args: synthesize: callable(text) yielding int16 sample arrays
+        open_output: callable() returning an output with write/close/stop
+        on_done: called once playback has finished or was cancelled
+        after: SpeechPipeline that has to finish playing first, synthesis starts right away '''
+        self._synthesize = synthesize
+        self._open_output = open_output
+        self._on_done = on_done
+        self._after = after
+        self._splitter = SentenceSplitter()
+
+        self._sentences = queue.Queue()
+        self._chunks = queue.Queue()
+        self._output = None
+        self._cancelled = threading.Event()
+        self._done = threading.Event()
+
+        # Synthesis and playback run on separate workers so the next
+        # sentence is synthesized while the current one is playing
+        threading.Thread(target=self._synth_worker, daemon=True).start()
+        threading.Thread(target=self._playback_worker, daemon=True).start()
+
+
+    @property
+    def output(self):
+        # Playback output, None until the first audio chunk is ready
+        return self._output
+
+
+    @property
+    def playing(self):
+        # Audio is coming out of the speakers right now
+        return self._output is not None and not self._done.is_set() and not self._cancelled.is_set()
+
+
+    @property
+    def done(self):
+        return self._done.is_set()
+
+
+    ### PRODUCER SIDE ###
+    def feed(self, text):
+        # Queues every sentence completed by this chunk of text
+        for sentence in self._splitter.feed(text):
+            self._sentences.put(sentence)
+
+
+    def finish(self):
+        # Marks the end of the text stream
+        for sentence in self._splitter.flush():
+            self._sentences.put(sentence)
+        self._sentences.put(None)
+
+
+    def cancel(self):
+        # Drops queued sentences and stops playback immediately
+        self._cancelled.set()
+        self._sentences.put(None)
+        output = self._output
+        if output is not None:
+            output.stop()
+
+
+    def wait(self, timeout=None):
+        # Blocks until the last sentence has been played
+        return self._done.wait(timeout)
+
+
+    ### WORKERS ###
+    def _synth_worker(self):
+        try:
+            while not self._cancelled.is_set():
+                sentence = self._sentences.get()
+                if sentence is None:
+                    break
+                for samples in self._synthesize(sentence):
+                    if self._cancelled.is_set():
+                        break
+                    self._chunks.put(samples)
+        except Exception as e:
+            print(f">> Speech synthesis failed due to: {e}")
+        finally:
+            self._chunks.put(None)
+
+
+    def _playback_worker(self):
+        try:
+            # Queued behind another reply: wait for it to end, or for this one to be cancelled
+            if self._after is not None:
+                while not self._after.wait(0.05) and not self._cancelled.is_set():
+                    pass
+                self._after = None
+
+            while True:
+                samples = self._chunks.get()
+                if samples is None:
+                    break
+                if self._cancelled.is_set():
+                    continue
+
+                # Output is opened on the first chunk and kept open so sentences play back to back
+                if self._output is None:
+                    self._output = self._open_output()
+                self._output.write(samples)
+
+            if self._output is None:
+                if not self._cancelled.is_set():
+                    print(">> Piper returned no audio.")
+            elif self._cancelled.is_set():
+                self._output.stop()
+            else:
+                self._output.close()
+
+        except Exception as e:
+            if not self._cancelled.is_set():
+                print(f">> Speech playback failed due to: {e}")
+        finally:
+            self._done.set()
+            if self._on_done:
+                self._on_done()
+
+
+class SpeechQueue:
+    def __init__(self, synthesize, open_output, max_sessions=4):
+        ''' Orders speech sessions so a new reply never drops or talks over the one playing
+
+        A session opened normally plays once the previous ones have finished; with
+        replace=True everything queued or playing is cancelled first.
+
+        Args: synthesize / open_output: passed to every SpeechPipeline
+        max_sessions (int): beyond this the oldest sessions are cancelled '''
+        self._synthesize = synthesize
+        self._open_output = open_output
+        self.max_sessions = max_sessions
+        # Replaced, never mutated, under _lock; readers such as the audio callback take no lock
+        self._sessions = ()
+        self._lock = threading.Lock()
+
+
+    def open(self, replace=False, on_done=None):
+        def _finished():
+            with self._lock:
+                self._sessions = tuple(s for s in self._sessions if s is not pipeline)
+            if on_done:
+                on_done()
+
+        with self._lock:
+            if replace:
+                dropped, self._sessions = self._sessions, ()
+            else:
+                excess = max(0, len(self._sessions) + 1 - self.max_sessions)
+                dropped, self._sessions = self._sessions[:excess], self._sessions[excess:]
+            previous = self._sessions[-1] if self._sessions else None
+            pipeline = SpeechPipeline(self._synthesize, self._open_output, on_done=_finished, after=previous)
+            self._sessions += (pipeline,)
+
+        for session in dropped:
+            session.cancel()
+        return pipeline
+
+
+    def cancel(self):
+        # Stops the reply that is playing and everything queued behind it
+        with self._lock:
+            dropped, self._sessions = self._sessions, ()
+        for session in dropped:
+            session.cancel()
+        return len(dropped)
+
+
+    @property
+    def sessions(self):
+        return list(self._sessions)
+
+
+    @property
+    def playing(self):
+        # Lock-free, polled from the microphone callback for barge-in
+        return any(session.playing for session in self._sessions)
+
+
+    @property
+    def pending(self):
+        return len(self.sessions)
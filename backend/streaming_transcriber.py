@@ -0,0 +1,111 @@
+import threading
+from vad import EnergyVAD
+
+
+class StreamingTranscriber:
+    def __init__(self, read_audio, transcribe, rate, threshold=0.01, segment_silence=0.5,
+                max_segment_seconds=20, poll_interval=0.2, on_partial=None):
+        ''' Transcribes an utterance segment by segment while it is still being recorded
+
+        Args: read_audio: callable(start) returning captured samples from index start onwards
+        transcribe: callable(samples) returning the text of one segment
+        rate (int): sample rate of the captured audio
+        segment_silence (float): seconds of silence after speech that close a segment
+        max_segment_seconds (float): segments are cut here even without a pause
+        on_partial: called with the transcript so far whenever a segment finishes '''
+        self._read_audio = read_audio
+        self._transcribe = transcribe
+        self.rate = rate
+        self.segment_silence = segment_silence
+        self.max_segment_seconds = max_segment_seconds
+        self.poll_interval = poll_interval
+        self.on_partial = on_partial
+
+        self._vad = EnergyVAD(rate, threshold=threshold)
+        self._texts = []
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+
+        # Positions are sample indexes in the capture buffer
+        self._scanned = 0         # Everything before this went through the VAD
+        self._cut = 0             # Start of the audio that hasn't been transcribed yet
+        self._voiced = False      # Pending audio contains speech
+        self._silence = 0         # Samples of silence since the last speech frame
+
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+
+    @property
+    def partial_text(self):
+        with self._lock:
+            return " ".join(self._texts).strip()
+
+
+    def stop(self):
+        # No more audio is coming, the worker exits and finish() takes care of the tail
+        self._stop.set()
+
+
+    def finish(self):
+        # Stops listening and transcribes only the audio after the last cut
+        self._stop.set()
+        self._thread.join()
+
+        tail = self._read_audio(self._cut)
+        # Without any finished segment the VAD may have missed quiet speech, so transcribe regardless
+        if len(tail) and (self._voiced or not self._texts):
+            self._add_text(self._transcribe(tail))
+        return self.partial_text
+
+
+    ### BACKGROUND WORKER ###
+    def _run(self):
+        while not self._stop.wait(self.poll_interval):
+            try:
+                self._scan()
+            except Exception as e:
+                print(f">> Streaming transcription failed due to: {e}")
+
+
+    def _scan(self):
+        audio = self._read_audio(self._scanned)
+        frame_len = self._vad.frame_len
+        usable = len(audio) - len(audio) % frame_len
+
+        for index, voiced in enumerate(self._vad.voiced(audio[:usable])):
+            frame_end = self._scanned + (index + 1) * frame_len
+            if voiced:
+                self._voiced = True
+                self._silence = 0
+            else:
+                self._silence += frame_len
+
+            pause = self._voiced and self._silence >= self.segment_silence * self.rate
+            too_long = frame_end - self._cut >= self.max_segment_seconds * self.rate
+            if pause or too_long:
+                self._close_segment(frame_end)
+            elif not self._voiced and self._silence >= self.segment_silence * self.rate:
+                # Leading silence is never sent to Whisper
+                self._cut = frame_end - int(self.segment_silence * self.rate)
+
+        self._scanned += usable
+
+
+    def _close_segment(self, end):
+        # Transcribes [cut, end) while the capture keeps filling in the background
+        if self._voiced:
+            self._add_text(self._transcribe(self._read_audio(self._cut)[:end - self._cut]))
+        self._cut = end
+        self._voiced = False
+        self._silence = 0
+
+
+    def _add_text(self, text):
+        text = (text or "").strip()
+        if not text:
+            return
+        with self._lock:
+            self._texts.append(text)
+        if self.on_partial:
+            self.on_partial(self.partial_text)
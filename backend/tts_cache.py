@@ -0,0 +1,99 @@
+import os, json, hashlib, threading, dataclasses
+from collections import OrderedDict
+import numpy
+
+
+class TtsCache:
+    def __init__(self, cache_dir, max_bytes=64 * 1024 * 1024):
+        ''' Content-addressed cache of synthesized speech, stored as raw int16 PCM
+
+        Args: cache_dir (str): where the .pcm files are kept
+        max_bytes (int): total size cap, least recently played files are deleted first '''
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+
+        self._lock = threading.Lock()
+        # key -> file size, least recently used first
+        self._index = OrderedDict()
+        self._bytes = 0
+        os.makedirs(cache_dir, exist_ok=True)
+        for name in sorted(os.listdir(cache_dir), key=lambda n: os.path.getmtime(os.path.join(cache_dir, n))):
+            if name.endswith(".pcm"):
+                size = os.path.getsize(os.path.join(cache_dir, name))
+                self._index[name[:-len(".pcm")]] = size
+                self._bytes += size
+
+
+    def key(self, text, model_path, syn_config=None):
+        # Same words with the same voice and settings sound the same
+        if dataclasses.is_dataclass(syn_config):
+            settings = dataclasses.asdict(syn_config)
+        else:
+            settings = vars(syn_config) if syn_config is not None else {}
+        material = {"text": text.strip(), "model": os.path.abspath(model_path), "config": settings}
+        return hashlib.sha256(json.dumps(material, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+
+    def get(self, key):
+        # Samples of a cached phrase, None when it has to be synthesized
+        path = self._path(key)
+        with self._lock:
+            if key not in self._index:
+                self.misses += 1
+                return None
+            self._index.move_to_end(key)
+
+        try:
+            samples = numpy.fromfile(path, dtype=numpy.int16)
+            os.utime(path)
+        except OSError:
+            with self._lock:
+                self._drop(key)
+                self.misses += 1
+            return None
+
+        with self._lock:
+            self.hits += 1
+        return samples
+
+
+    def put(self, key, samples):
+        samples = numpy.ascontiguousarray(samples, dtype=numpy.int16)
+        if not samples.size or samples.nbytes > self.max_bytes:
+            return
+        path = self._path(key)
+        tmp_path = f"{path}.tmp"
+        samples.tofile(tmp_path)
+        os.replace(tmp_path, path)
+
+        with self._lock:
+            self._bytes -= self._index.pop(key, 0)
+            self._index[key] = samples.nbytes
+            self._bytes += samples.nbytes
+            while self._bytes > self.max_bytes and self._index:
+                self._drop(next(iter(self._index)))
+
+
+    def stats(self):
+        with self._lock:
+            return {
+                "entries": len(self._index),
+                "bytes": self._bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+            }
+
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.pcm")
+
+
+    def _drop(self, key):
+        # Called with _lock held
+        self._bytes -= self._index.pop(key, 0)
+        try:
+            os.remove(self._path(key))
+        except OSError:
+            pass
@@ -0,0 +1,44 @@
+import numpy
+
+
+class EnergyVAD:
+    def __init__(self, rate, threshold=0.01, frame_ms=30, noise_ratio=3.0):
+        ''' Energy-based voice activity detection on float32 audio
+
+        Args: rate (int): sample rate of the audio
+        threshold (float): minimum RMS that counts as speech
+        frame_ms (int): analysis frame length
+        noise_ratio (float): speech must also be this much louder than the tracked noise floor '''
+        self.frame_len = max(1, int(rate * frame_ms / 1000))
+        self.threshold = threshold
+        self.noise_ratio = noise_ratio
+        # Starts at the level where the fixed threshold and the noise floor rule agree
+        self.noise_floor = threshold / noise_ratio
+
+
+    def voiced(self, audio):
+        # Returns one bool per complete frame; a trailing partial frame is ignored
+        count = len(audio) // self.frame_len
+        if not count:
+            return numpy.zeros(0, dtype=bool)
+
+        frames = audio[:count * self.frame_len].reshape(count, self.frame_len)
+        rms = numpy.sqrt(numpy.mean(numpy.square(frames, dtype=numpy.float32), axis=1))
+        return self._classify(rms)
+
+
+    def voiced_block(self, audio):
+        # Treats a whole audio callback block as one frame, whatever its size
+        if not len(audio):
+            return False
+        rms = numpy.sqrt(numpy.mean(numpy.square(audio, dtype=numpy.float32)))
+        return bool(self._classify(numpy.array([rms]))[0])
+
+
+    def _classify(self, rms):
+        # Noise floor follows the quiet frames so a noisy room doesn't read as speech
+        voiced = rms > max(self.threshold, self.noise_floor * self.noise_ratio)
+        quiet = rms[~voiced]
+        if len(quiet):
+            self.noise_floor = 0.9 * self.noise_floor + 0.1 * float(quiet.mean())
+        return voiced
@@ -2,7 +2,10 @@ import os, threading, time
 from config import *
 from conversation_manager import ConversationManager
 from llm_server import LLMServerManager
+from llm_transport import LLMTransport
 from llm_client import LLMClient
+from context_window import ContextWindowBuilder
+from response_cache import ResponseCache
 from pipe_listener import PipeListener
 from audio_manager import AudioManager
 
@@ -10,15 +13,49 @@ from audio_manager import AudioManager
 ### INITIALIZATION ###
 conversation = ConversationManager(CHAT_HISTORY_FILE)
 
+transport = LLMTransport(
+    port = SERVER_PORT,
+    connect_timeout = LLM_CONNECT_TIMEOUT,
+    read_timeout = LLM_READ_TIMEOUT,
+    retries = LLM_RETRIES,
+    pool_size = LLM_POOL_SIZE
+)
+
 server = LLMServerManager(
     bin_path = LLM_SERVER_BIN,
     model_path = LLM_MODEL_PATH,
     port = SERVER_PORT,
     pid_file = LLM_PID_FILE,
-    auto_shutdown=AUTO_SHUTDOWN
+    auto_shutdown=AUTO_SHUTDOWN,
+    transport = transport,
+    parallel = LLM_PARALLEL,
+    context_size = LLM_CONTEXT_SIZE,
+    load_timeout = LLM_LOAD_TIMEOUT,
+    slot_save_path = LLM_SLOT_SAVE_DIR,
+    probe_interval = LLM_PROBE_INTERVAL
 )
 
-llm_client = LLMClient(MODEL_NAME, server, conversation, TEMPERATURE)
+# Keeps long conversations within the token budget
+context_builder = ContextWindowBuilder(
+    transport,
+    MODEL_NAME,
+    budget = CONTEXT_TOKEN_BUDGET,
+    keep_ratio = CONTEXT_KEEP_RATIO,
+    summary_tokens = CONTEXT_SUMMARY_TOKENS
+)
+
+# Exact repeats of a prompt are answered from disk when enabled
+response_cache = ResponseCache(
+    RESPONSE_CACHE_DIR,
+    enabled = RESPONSE_CACHE,
+    mode = RESPONSE_CACHE_MODE,
+    force = RESPONSE_CACHE_FORCE,
+    max_entries = RESPONSE_CACHE_MAX_ENTRIES,
+    ttl = RESPONSE_CACHE_TTL
+)
+
+llm_client = LLMClient(MODEL_NAME, server, conversation, TEMPERATURE,
+                       prompt_builder=context_builder, response_cache=response_cache)
 
 audio_manager = AudioManager(
     whisper_model = WHISPER_MODEL,
@@ -27,22 +64,55 @@ audio_manager = AudioManager(
     mic_rate = SAMPLE_RATE,
     tts_rate = PIPER_SAMPLE_RATE,
     channels = CHANNELS,
-    record_timeout = RECORD_TIMEOUT
+    record_timeout = RECORD_TIMEOUT,
+    output_backend = TTS_OUTPUT,
+    volume = TTS_VOLUME,
+    max_record_seconds = MAX_RECORD_SECONDS,
+    streaming_stt = STREAMING_STT,
+    vad_threshold = VAD_ENERGY_THRESHOLD,
+    segment_silence = VAD_SEGMENT_SILENCE,
+    max_segment_seconds = MAX_SEGMENT_SECONDS,
+    endpointing = ENDPOINTING,
+    endpoint_silence = ENDPOINT_SILENCE,
+    tts_cache_dir = TTS_CACHE_DIR,
+    tts_cache_mb = TTS_CACHE_MB,
+    whisper_fast_model = WHISPER_FAST_MODEL,
+    whisper_tier_seconds = WHISPER_TIER_SECONDS,
+    whisper_threads = WHISPER_THREADS,
+    whisper_compute_type = WHISPER_COMPUTE_TYPE,
+    preload_models = PRELOAD_AUDIO_MODELS,
+    barge_in = BARGE_IN,
+    barge_in_threshold = BARGE_IN_THRESHOLD,
+    barge_in_min_speech = BARGE_IN_MIN_SPEECH,
+    replace_speech = REPLACE_SPEECH,
+    capture_16k = CAPTURE_16K,
+    preroll_seconds = PREROLL_SECONDS,
+    tts_workers = TTS_WORKERS
 )
     
 
 ### PIPE EVENT HANDLERS ###
 def handle_toggle():
     # Toggles recording on/off
-    audio_manager.recording = not audio_manager.recording
-    print(f">> Recording state changed: {audio_manager.recording}")
     if not audio_manager.recording:
-        print(">> Processing audio input...")
-        text = audio_manager.transcribe()
-        if text:
-            response = llm_client.send_query(text)
-            print(">> RESPONSE:", response)
-            audio_manager.speak(response)
+        audio_manager.start_recording()
+        print(">> Recording state changed: True")
+        return
+    utterance = audio_manager.stop_recording()
+    print(">> Recording state changed: False")
+    handle_utterance(utterance)
+
+def handle_utterance(utterance):
+    # Transcribes the finished utterance and speaks the reply
+    print(">> Processing audio input...")
+    text = audio_manager.transcribe(utterance)
+    if text:
+        # Speech starts with the first sentence while the rest is still generating
+        speech = audio_manager.speech_pipeline()
+        response = llm_client.send_query(text, speech=speech)
+        print(">> RESPONSE:", response)
+        if speech:
+            speech.wait()
 
 def handle_stop():
     # Stops LLM server manually
@@ -55,6 +125,9 @@ def handle_stop():
 if __name__ == "__main__":
     print(">> AI Assistant starting up...")
 
+    # Trailing silence ends the utterance without a second toggle
+    audio_manager.on_endpoint = handle_utterance
+
     # Pipe listener (for cli control)
     pipe_listener = PipeListener(pipe_path=PIPE_PATH, on_toggle=handle_toggle, on_stop=handle_stop)
 